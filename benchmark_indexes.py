@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+"""
+Query plan benchmark for the filter and ordering indexes.
+
+Builds a throwaway test database, seeds it, and prints the query plan and
+timing of every filter/ordering path in crm/filters.py twice: with the
+indexes from crm.0002_filter_indexes dropped ("before") and in place
+("after").
+
+Usage:
+    python benchmark_indexes.py [--customers N] [--products N] [--orders N]
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'crm_project.settings')
+django.setup()
+
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment
+from django.test.runner import DiscoverRunner
+from django.utils import timezone
+
+from crm.models import Customer, Product, Order
+
+
+def filter_paths(now):
+    """The querysets behind each filter and default ordering."""
+    return [
+        ("allCustomers (ordering)", Customer.objects.all()[:50]),
+        ("customers createdAt range", Customer.objects.filter(created_at__gte=now - timedelta(days=30))[:50]),
+        ("customers name exact", Customer.objects.filter(name="Customer 42")),
+        ("allProducts (ordering)", Product.objects.all()[:50]),
+        ("products price range", Product.objects.filter(price__gte=10, price__lte=20)[:50]),
+        ("products stock range", Product.objects.filter(stock__gte=5, stock__lte=8)[:50]),
+        ("products lowStock", Product.objects.filter(stock__lt=10)),
+        ("allOrders (ordering)", Order.objects.all()[:50]),
+        ("orders orderDate range", Order.objects.filter(order_date__gte=now - timedelta(days=7))[:50]),
+        ("orders totalAmount range", Order.objects.filter(total_amount__gte=100, total_amount__lte=150)[:50]),
+        ("orders by customer", Order.objects.filter(customer_id=Customer.objects.values('id')[:1])[:50]),
+    ]
+
+
+def seed(customers, products, orders):
+    now = timezone.now()
+    random.seed(0)
+    Customer.objects.bulk_create(
+        [Customer(name=f"Customer {i}", email=f"customer{i}@example.com") for i in range(customers)],
+        batch_size=1000,
+    )
+    # created_at is auto_now_add, so spread it out after the insert
+    with transaction.atomic():
+        for pk in Customer.objects.values_list('id', flat=True).iterator():
+            Customer.objects.filter(pk=pk).update(
+                created_at=now - timedelta(minutes=random.randint(0, 525600))
+            )
+    Product.objects.bulk_create(
+        [
+            Product(name=f"Product {i}", price=Decimal(random.randint(100, 50000)) / 100, stock=random.randint(0, 500))
+            for i in range(products)
+        ],
+        batch_size=1000,
+    )
+    customer_ids = list(Customer.objects.values_list('id', flat=True))
+    Order.objects.bulk_create(
+        [
+            Order(
+                customer_id=random.choice(customer_ids),
+                order_date=now - timedelta(minutes=random.randint(0, 525600)),
+                total_amount=Decimal(random.randint(100, 100000)) / 100,
+            )
+            for _ in range(orders)
+        ],
+        batch_size=1000,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def indexed_models():
+    return [model for model in (Customer, Product, Order) if model._meta.indexes]
+
+
+def drop_indexes():
+    with connection.schema_editor() as editor:
+        for model in indexed_models():
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+
+
+def create_indexes():
+    with connection.schema_editor() as editor:
+        for model in indexed_models():
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+
+def measure(queryset, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        list(queryset.all())
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def report(label, now):
+    print(f"\n{'=' * 20} {label} {'=' * 20}")
+    for name, queryset in filter_paths(now):
+        print(f"\n-- {name}: {measure(queryset):.2f} ms")
+        for line in queryset.explain().splitlines():
+            print(f"   {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        print(f"Seeding {args.customers} customers, {args.products} products, {args.orders} orders...")
+        seed(args.customers, args.products, args.orders)
+        now = timezone.now()
+        drop_indexes()
+        report("BEFORE (no filter indexes)", now)
+        create_indexes()
+        report("AFTER (crm.0002_filter_indexes)", now)
+    finally:
+        runner.teardown_databases(old_config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Customer, Product, Order, OrderItem
+from .models import Customer, Product, Order, OrderItem, DailyStats, PersistedQuery
 
 
 @admin.register(Customer)
@@ -85,4 +85,25 @@ class OrderItemAdmin(admin.ModelAdmin):
             'fields': ('id',),
             'classes': ('collapse',)
         }),
-    ) 
\ No newline at end of file
+    )
+
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    list_display = ['date', 'order_count', 'revenue', 'new_customers', 'updated_at']
+    date_hierarchy = 'date'
+    readonly_fields = ['date', 'order_count', 'revenue', 'new_customers', 'updated_at']
+    ordering = ['-date']
+
+
+@admin.register(PersistedQuery)
+class PersistedQueryAdmin(admin.ModelAdmin):
+    list_display = ['sha256', 'created_at']
+    search_fields = ['sha256', 'query']
+    ordering = ['-created_at']
+    
+    def get_readonly_fields(self, request, obj=None):
+        # The key is the hash of the query, so a stored query cannot change
+        if obj is not None:
+            return ['sha256', 'query', 'created_at']
+        return ['sha256', 'created_at']
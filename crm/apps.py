@@ -4,4 +4,13 @@ from django.apps import AppConfig
 class CrmConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'crm'
-    verbose_name = 'Customer Relationship Management' 
\ No newline at end of file
+    verbose_name = 'Customer Relationship Management'
+
+    def ready(self):
+        from . import persisted, rollup  # noqa: F401 (signal receivers)
+        from .cache import connect_invalidation, get_cache_timeout
+
+        # Receivers on delete turn off Django's fast-delete path, so only
+        # connect them when there is a cache to invalidate
+        if get_cache_timeout():
+            connect_invalidation()
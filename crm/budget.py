@@ -0,0 +1,178 @@
+"""
+SQL query budget per GraphQL operation.
+
+CRMGraphQLView runs every operation inside track_queries(), which counts
+the statements sent on the default connection and the time they take.
+When an operation is traced (see crm.tracing), QueryBudgetMiddleware
+records which resolver is running, so each statement is attributed to the
+field path that caused it, and the per-path summary is logged. When the
+operation is done the tracker logs a warning if:
+
+- it ran more than CRM_QUERY_BUDGET statements. With
+  CRM_QUERY_BUDGET_ACTION = 'raise' the statement over budget is not run
+  and fails with QueryBudgetExceeded instead, which the client sees as a
+  field error;
+- one statement (the SQL without its parameters) ran more than
+  CRM_QUERY_REPEAT_THRESHOLD times: the signature of an N+1.
+
+AsyncCRMGraphQLView resolves root fields in worker threads, which count
+their statements in the same tracker through follow_queries(). crm.testing
+builds on this to assert query counts in tests.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+logger = logging.getLogger(__name__)
+
+_resolver_path = ContextVar('crm_resolver_path', default=None)
+
+_tracker = ContextVar('crm_query_tracker', default=None)
+
+
+def get_query_budget():
+    return getattr(settings, 'CRM_QUERY_BUDGET', 100)
+
+
+def get_query_budget_action():
+    return getattr(settings, 'CRM_QUERY_BUDGET_ACTION', 'log')
+
+
+def get_repeat_threshold():
+    return getattr(settings, 'CRM_QUERY_REPEAT_THRESHOLD', 10)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def path_key(path):
+    """'customers.orders.edges.node' for a graphql Path, without list indexes."""
+    keys = []
+    while path is not None:
+        if isinstance(path.key, str):
+            keys.append(path.key)
+        path = path.prev
+    return '.'.join(reversed(keys))
+
+
+class QueryTracker:
+    """
+    execute_wrapper that counts statements per resolver path and per SQL
+    shape. One tracker may wrap the connections of several threads.
+    """
+
+    def __init__(self, budget=None, action=None, repeat_threshold=None):
+        self.budget = get_query_budget() if budget is None else budget
+        self.action = action or get_query_budget_action()
+        self.repeat_threshold = get_repeat_threshold() if repeat_threshold is None else repeat_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.paths = defaultdict(lambda: [0, 0.0])
+        self.shapes = Counter()
+        self.shape_paths = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.action == 'raise' and self.budget and self.count >= self.budget:
+            raise QueryBudgetExceeded(f"Operation exceeded its budget of {self.budget} SQL queries.")
+        path = _resolver_path.get()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            key = path_key(path) if path is not None else ''
+            with self._lock:
+                self.record(key, sql, elapsed)
+
+    def record(self, key, sql, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        stats = self.paths[key]
+        stats[0] += 1
+        stats[1] += elapsed
+        self.shapes[sql] += 1
+        self.shape_paths[sql].add(key)
+
+    @property
+    def over_budget(self):
+        return bool(self.budget) and self.count > self.budget
+
+    @property
+    def repeated(self):
+        """(sql, count) of the statements that ran more than repeat_threshold times."""
+        if not self.repeat_threshold:
+            return []
+        return [(sql, count) for sql, count in self.shapes.most_common() if count > self.repeat_threshold]
+
+    def summary(self, limit=5):
+        """The paths that ran the most statements, one per line."""
+        paths = sorted(self.paths.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+        return '\n'.join(
+            f"  {key or '<operation>'}: {count} queries, {duration * 1000:.1f} ms"
+            for key, (count, duration) in paths
+        )
+
+    def report(self, operation_name=None, trace=False):
+        name = operation_name or '<anonymous>'
+        if trace:
+            logger.info(
+                "Operation %s ran %d SQL queries in %.1f ms:\n%s",
+                name, self.count, self.duration * 1000, self.summary(),
+            )
+        if self.over_budget:
+            logger.warning(
+                "Operation %s ran %d SQL queries (budget %d) in %.1f ms:\n%s",
+                name, self.count, self.budget, self.duration * 1000, self.summary(),
+            )
+        for sql, count in self.repeated:
+            logger.warning(
+                "Possible N+1 in operation %s: %d identical queries from %s: %s",
+                name, count, ', '.join(sorted(self.shape_paths[sql])) or '<operation>', sql,
+            )
+
+
+@contextmanager
+def track_queries(budget=None, action=None, repeat_threshold=None, using=DEFAULT_DB_ALIAS):
+    """Count the statements run on the using connection inside the block."""
+    tracker = QueryTracker(budget, action, repeat_threshold)
+    token = _tracker.set(tracker)
+    try:
+        with connections[using].execute_wrapper(tracker):
+            yield tracker
+    finally:
+        _tracker.reset(token)
+
+
+@contextmanager
+def follow_queries(using=DEFAULT_DB_ALIAS):
+    """
+    Count the statements run on this thread's using connection in the
+    tracker of the enclosing track_queries() block, if any. For threads
+    started with a copy of that block's context.
+    """
+    tracker = _tracker.get()
+    if tracker is None:
+        yield None
+        return
+    with connections[using].execute_wrapper(tracker):
+        yield tracker
+
+
+class QueryBudgetMiddleware:
+    """Graphene middleware that tells the active QueryTracker which field is resolving."""
+
+    def resolve(self, next, root, info, **args):
+        token = _resolver_path.set(info.path)
+        try:
+            return next(root, info, **args)
+        finally:
+            _resolver_path.reset(token)
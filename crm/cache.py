@@ -0,0 +1,200 @@
+"""
+Response cache for GraphQL queries.
+
+Opt in by setting CRM_RESPONSE_CACHE_TIMEOUT. Query results are stored in
+the CRM_RESPONSE_CACHE_ALIAS cache under a key made of the normalized
+document, the variables, the user and the version tag of every model the
+selection reads, including the through models of many-to-many fields and
+the models its filter arguments join. A write to one of those models bumps
+its tag (through post_save/post_delete, or touch() for bulk writes that
+send no signals), so later requests look under new keys and the stale
+entries expire.
+Mutations and documents that select an uncacheable field are never cached.
+"""
+
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from graphql import (
+    GraphQLObjectType,
+    OperationType,
+    TypeInfo,
+    TypeInfoVisitor,
+    Visitor,
+    get_named_type,
+    get_operation_ast,
+    is_abstract_type,
+    print_ast,
+    visit,
+)
+from graphene.utils.str_converters import to_snake_case
+from .models import Customer, DailyStats, Order, OrderItem, Product
+from .planner import get_model_fields
+
+
+CACHED_MODELS = (Customer, Product, Order, OrderItem)
+
+# Root fields whose result must never be served from the cache
+UNCACHEABLE_FIELDS = ('_debug',)
+
+# Root fields that read models without returning them
+FIELD_MODELS = {
+    'crmStats': (Customer, Order, OrderItem, DailyStats),
+}
+
+# Models joined by the filter arguments of fields returning the key model
+ARGUMENT_MODELS = {
+    Order: (Customer, OrderItem, Product),
+}
+
+# Arguments that may name any relation (the free-form orderBy of filter inputs)
+OPEN_ARGUMENTS = ('filter',)
+
+PAGINATION_ARGUMENTS = ('first', 'last', 'after', 'before', 'offset')
+
+KEY_PREFIX = 'crm:graphql'
+
+
+def get_cache_timeout():
+    return getattr(settings, 'CRM_RESPONSE_CACHE_TIMEOUT', 0)
+
+
+def get_cache():
+    return caches[getattr(settings, 'CRM_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def version_key(model):
+    return f'{KEY_PREFIX}:version:{model._meta.label_lower}'
+
+
+def bump_version(model):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        # Evicted (or never read): restart from a value no earlier tag used
+        cache.set(version_key(model), time.time_ns(), None)
+
+
+def touch(*models):
+    """Invalidate cached responses that read any of models once the transaction commits."""
+    if not get_cache_timeout():
+        return
+    for model in models:
+        transaction.on_commit(lambda model=model: bump_version(model))
+
+
+def get_versions(models):
+    cache = get_cache()
+    keys = {version_key(model): model for model in models}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, time.time_ns(), None)
+        versions[key] = cache.get(key)
+    return [versions[key] for key in sorted(keys)]
+
+
+def graphql_model(graphql_type):
+    return getattr(getattr(getattr(graphql_type, 'graphene_type', None), '_meta', None), 'model', None)
+
+
+def through_models(parent, name):
+    """The through model of field name of parent, when it is a many-to-many relation."""
+    model = graphql_model(parent)
+    if model is None:
+        return ()
+    field = get_model_fields(model).get(to_snake_case(name))
+    if field is None or not field.many_to_many:
+        return ()
+    return (field.remote_field.through if field.concrete else field.through,)
+
+
+class _ModelCollector(Visitor):
+    def __init__(self, type_info, schema):
+        super().__init__()
+        self.type_info = type_info
+        self.schema = schema
+        self.models = set()
+        self.cacheable = True
+
+    def enter_field(self, node, *args):
+        parent = self.type_info.get_parent_type()
+        if parent is self.schema.query_type:
+            if node.name.value in UNCACHEABLE_FIELDS:
+                self.cacheable = False
+            self.models.update(FIELD_MODELS.get(node.name.value, ()))
+        else:
+            self.models.update(through_models(parent, node.name.value))
+        field_type = self.type_info.get_type()
+        named = get_named_type(field_type) if field_type is not None else None
+        if named is None:
+            return
+        if is_abstract_type(named):
+            # node(id:) and friends may return any model
+            self.models.update(CACHED_MODELS)
+        elif isinstance(named, GraphQLObjectType):
+            model = graphql_model(named)
+            if model is not None:
+                self.models.add(model)
+                arguments = {argument.name.value for argument in node.arguments} - set(PAGINATION_ARGUMENTS)
+                if arguments & set(OPEN_ARGUMENTS):
+                    self.models.update(CACHED_MODELS)
+                elif arguments:
+                    self.models.update(ARGUMENT_MODELS.get(model, ()))
+
+
+def read_models(schema, document):
+    """
+    Return the models a query document reads, or None if it selects an
+    uncacheable field.
+    """
+    type_info = TypeInfo(schema)
+    collector = _ModelCollector(type_info, schema)
+    visit(document, TypeInfoVisitor(type_info, collector))
+    return collector.models if collector.cacheable else None
+
+
+def get_cache_key(schema, document, variables, operation_name, user):
+    """
+    Return the cache key of a query, or None if it must not be cached: the
+    operation is not a query or selects an uncacheable field.
+    """
+    operation = get_operation_ast(document, operation_name)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+    models = read_models(schema, document)
+    if models is None:
+        return None
+    payload = json.dumps(
+        [
+            print_ast(document),
+            operation_name,
+            variables or {},
+            user.pk if user is not None and user.is_authenticated else None,
+            get_versions(models),
+        ],
+        sort_keys=True,
+        cls=DjangoJSONEncoder,
+    )
+    return f'{KEY_PREFIX}:response:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+
+def _invalidate(sender, **kwargs):
+    touch(sender)
+
+
+def connect_invalidation():
+    for model in CACHED_MODELS:
+        post_save.connect(_invalidate, sender=model, dispatch_uid=f'crm_cache_{model._meta.model_name}_save')
+        post_delete.connect(_invalidate, sender=model, dispatch_uid=f'crm_cache_{model._meta.model_name}_delete')
+
+
+def disconnect_invalidation():
+    for model in CACHED_MODELS:
+        post_save.disconnect(sender=model, dispatch_uid=f'crm_cache_{model._meta.model_name}_save')
+        post_delete.disconnect(sender=model, dispatch_uid=f'crm_cache_{model._meta.model_name}_delete')
@@ -0,0 +1,94 @@
+"""
+HTTP client for jobs that must go through the GraphQL endpoint.
+
+One client per endpoint is kept for the life of the process. It holds a
+keep-alive requests.Session, validates documents against a schema snapshot
+exported at deploy time instead of introspecting the server, and parses
+and validates each document only once. A run of a cron job therefore costs
+a single POST on a pooled connection.
+
+Export the snapshot when deploying:
+
+    python manage.py graphql_schema --out schema.graphql
+"""
+
+import os
+from functools import lru_cache
+from django.conf import settings
+from graphql import DocumentNode, build_schema, parse, print_ast, validate
+import requests
+from requests.adapters import HTTPAdapter
+from .executor import GraphQLExecutionError
+
+
+def get_schema_snapshot_path():
+    return getattr(settings, 'CRM_GRAPHQL_SCHEMA_SNAPSHOT', os.path.join(settings.BASE_DIR, 'schema.graphql'))
+
+
+@lru_cache(maxsize=None)
+def load_schema_snapshot(path):
+    """Build a GraphQLSchema from the SDL file at path, or return None if there is none."""
+    try:
+        with open(path) as snapshot:
+            return build_schema(snapshot.read())
+    except FileNotFoundError:
+        return None
+
+
+class GraphQLClient:
+    def __init__(self, url, schema=None, timeout=10, pool_size=4):
+        self.url = url
+        self.schema = schema
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._documents = {}
+
+    def prepare(self, document):
+        """
+        Return the query text of document (a string or gql() DocumentNode),
+        validated against the schema snapshot the first time it is seen.
+        """
+        key = print_ast(document) if isinstance(document, DocumentNode) else document
+        query = self._documents.get(key)
+        if query is None:
+            node = document if isinstance(document, DocumentNode) else parse(document)
+            if self.schema is not None:
+                errors = validate(self.schema, node)
+                if errors:
+                    raise GraphQLExecutionError([error.formatted for error in errors])
+            query = self._documents[key] = print_ast(node)
+        return query
+
+    def execute(self, document, variables=None, operation_name=None):
+        payload = {'query': self.prepare(document)}
+        if variables:
+            payload['variables'] = variables
+        if operation_name:
+            payload['operationName'] = operation_name
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        try:
+            result = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise GraphQLExecutionError([f"Invalid response from {self.url}: {response.text[:200]}"])
+        if result.get('errors'):
+            raise GraphQLExecutionError(result['errors'])
+        response.raise_for_status()
+        return result.get('data')
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+
+
+def get_client(url):
+    """Return the process-wide client for url."""
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = GraphQLClient(url, schema=load_schema_snapshot(get_schema_snapshot_path()))
+    return client
@@ -0,0 +1,179 @@
+"""
+Query depth and cost limits.
+
+Reverse relations (Customer.orders, Product.orders, ...) let a client nest
+lists without bound, and every level multiplies the rows fetched. Before a
+document runs, QueryCostRule estimates its cost: each object field costs
+its weight (1 unless listed in FIELD_COSTS; scalars are free), and the
+items of a list or the edges of a connection count once per row it may
+return. That is the ``first``/``last`` argument or, without one, the
+server-side row limit. The document is rejected when it nests deeper than CRM_MAX_QUERY_DEPTH or costs
+more than CRM_MAX_QUERY_COST; connection plumbing (edges, node, pageInfo)
+does not count towards the depth.
+"""
+
+from collections import namedtuple
+from django.conf import settings
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLInt,
+    GraphQLList,
+    GraphQLNonNull,
+    TypeInfo,
+    ValidationContext,
+    ValidationRule,
+    get_named_type,
+    is_composite_type,
+    value_from_ast,
+    visit,
+)
+from .pagination import get_list_max_limit
+
+
+# Weights of fields that cost more than fetching one object
+FIELD_COSTS = {
+    'crmStats': 25,
+    'totalCount': 1,
+}
+
+CONNECTION_FIELDS = ('edges', 'node', 'pageInfo')
+
+QueryCost = namedtuple('QueryCost', ['cost', 'depth'])
+
+
+def get_max_query_depth():
+    return getattr(settings, 'CRM_MAX_QUERY_DEPTH', 10)
+
+
+def get_max_query_cost():
+    return getattr(settings, 'CRM_MAX_QUERY_COST', 50000)
+
+
+def is_connection(graphql_type):
+    fields = getattr(graphql_type, 'fields', None) or {}
+    return 'edges' in fields and 'pageInfo' in fields
+
+
+def is_list(graphql_type):
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return isinstance(graphql_type, GraphQLList)
+
+
+class QueryCostRule(ValidationRule):
+    """
+    Report operations that are too deep or too expensive. The estimate of
+    the last operation checked is left in ``query_cost``.
+    """
+
+    def __init__(self, context, variables=None, operation_name=None,
+                 max_depth=None, max_cost=None):
+        super().__init__(context)
+        self.variables = variables or {}
+        self.operation_name = operation_name
+        self.max_depth = get_max_query_depth() if max_depth is None else max_depth
+        self.max_cost = get_max_query_cost() if max_cost is None else max_cost
+        self.query_cost = None
+
+    def enter_operation_definition(self, node, *args):
+        if self.operation_name and (node.name is None or node.name.value != self.operation_name):
+            return self.SKIP
+        schema = self.context.schema
+        root_type = schema.get_root_type(node.operation)
+        if root_type is None:
+            return self.SKIP
+        cost, depth = self.selection_cost(node.selection_set, root_type, 0)
+        self.query_cost = QueryCost(cost, depth)
+        if self.max_depth and depth > self.max_depth:
+            self.report_error(GraphQLError(
+                f"Query depth {depth} exceeds the maximum of {self.max_depth}.",
+                node,
+                extensions={'code': 'QUERY_TOO_DEEP', 'depth': depth, 'maxDepth': self.max_depth},
+            ))
+        if self.max_cost and cost > self.max_cost:
+            self.report_error(GraphQLError(
+                f"Query cost {cost} exceeds the maximum of {self.max_cost}.",
+                node,
+                extensions={'code': 'QUERY_TOO_COMPLEX', 'cost': cost, 'maxCost': self.max_cost},
+            ))
+        return self.SKIP
+
+    def selection_cost(self, selection_set, parent_type, depth, edge_rows=1):
+        """
+        Return (cost, depth) of selection_set on parent_type at depth.
+        edge_rows is the row count of the connection parent_type belongs to.
+        """
+        total = 0
+        deepest = depth
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                cost, field_depth = self.field_cost(selection, parent_type, depth, edge_rows)
+            else:
+                if isinstance(selection, FragmentSpreadNode):
+                    fragment = self.context.get_fragment(selection.name.value)
+                    if fragment is None:
+                        continue
+                    type_condition, fragment_selections = fragment.type_condition, fragment.selection_set
+                else:
+                    type_condition, fragment_selections = selection.type_condition, selection.selection_set
+                fragment_type = parent_type
+                if type_condition is not None:
+                    fragment_type = self.context.schema.get_type(type_condition.name.value) or parent_type
+                cost, field_depth = self.selection_cost(fragment_selections, fragment_type, depth, edge_rows)
+            total += cost
+            deepest = max(deepest, field_depth)
+        return total, deepest
+
+    def field_cost(self, node, parent_type, depth, edge_rows=1):
+        name = node.name.value
+        fields = getattr(parent_type, 'fields', None) or {}
+        field = fields.get(name)
+        if field is None or name.startswith('__'):
+            return 0, depth
+        field_type = get_named_type(field.type)
+        multiplier, depth_step = 1, 1
+        if name in CONNECTION_FIELDS and (is_connection(parent_type) or 'cursor' in fields):
+            # Each edge's node is one object; the connection's rows multiply its edges
+            weight = 1 if name == 'node' else 0
+            depth_step = 0
+            if name == 'edges':
+                multiplier = edge_rows
+        else:
+            weight = FIELD_COSTS.get(name, 1 if is_composite_type(field_type) else 0)
+            if is_connection(field_type):
+                edge_rows = self.rows(node, field)
+            else:
+                multiplier = self.rows(node, field)
+        child_cost, child_depth = 0, depth + depth_step
+        if node.selection_set is not None:
+            child_cost, child_depth = self.selection_cost(
+                node.selection_set, field_type, depth + depth_step, edge_rows
+            )
+        return multiplier * (weight + child_cost), child_depth
+
+    def rows(self, node, field):
+        """How many rows a list or connection field may return; 1 for other fields."""
+        connection = is_connection(get_named_type(field.type))
+        if not connection and not is_list(field.type):
+            return 1
+        for argument in node.arguments:
+            if argument.name.value in ('first', 'last'):
+                value = value_from_ast(argument.value, GraphQLInt, self.variables)
+                if isinstance(value, int) and value >= 0:
+                    return value
+        limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT if connection else get_list_max_limit()
+        return limit or 100
+
+
+def check_query_cost(schema, document, variables=None, operation_name=None):
+    """
+    Run QueryCostRule over document. Returns (QueryCost or None, errors).
+    """
+    errors = []
+    context = ValidationContext(schema, document, TypeInfo(schema), errors.append)
+    rule = QueryCostRule(context, variables, operation_name)
+    visit(document, rule)
+    return rule.query_cost, errors
@@ -1,8 +1,14 @@
 import os
 import sys
 from datetime import datetime
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
+
+# GraphQL query to test hello field
+HELLO_QUERY = """
+    query {
+        hello
+    }
+"""
+
 
 def log_crm_heartbeat():
     """
@@ -40,20 +46,10 @@ def log_crm_heartbeat():
             import django
             django.setup()
         
-        # GraphQL endpoint
-        GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
-        
-        # GraphQL query to test hello field
-        HELLO_QUERY = gql("""
-            query {
-                hello
-            }
-        """)
+        from crm.executor import execute_query, get_graphql_url
         
-        # Create GraphQL client and execute query
-        transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        result = client.execute(HELLO_QUERY)
+        # This checks the endpoint itself, so it goes over HTTP
+        result = execute_query(HELLO_QUERY, url=get_graphql_url())
         
         # Log successful GraphQL query
         graphql_status = f"{timestamp} GraphQL endpoint responsive: {result.get('hello', 'Unknown response')}\n"
@@ -71,7 +67,7 @@ def log_crm_heartbeat():
 
 def update_low_stock():
     """
-    Execute the UpdateLowStockProducts mutation via GraphQL endpoint.
+    Execute the UpdateLowStockProducts mutation against the schema in-process.
     Log updated product names and new stock levels.
     """
     # Get current timestamp
@@ -92,11 +88,10 @@ def update_low_stock():
             import django
             django.setup()
         
-        # GraphQL endpoint
-        GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
+        from crm.executor import execute_query
         
         # GraphQL mutation to update low stock products
-        UPDATE_LOW_STOCK_MUTATION = gql("""
+        UPDATE_LOW_STOCK_MUTATION = """
             mutation {
                 updateLowStockProducts {
                     success
@@ -109,12 +104,10 @@ def update_low_stock():
                     }
                 }
             }
-        """)
+        """
         
-        # Create GraphQL client and execute mutation
-        transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        result = client.execute(UPDATE_LOW_STOCK_MUTATION)
+        # Execute the mutation in-process
+        result = execute_query(UPDATE_LOW_STOCK_MUTATION)
         
         # Extract results
         mutation_result = result.get('updateLowStockProducts', {})
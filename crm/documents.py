@@ -0,0 +1,91 @@
+"""
+Cache of parsed and validated GraphQL documents.
+
+Clients send the same few dozen documents over and over, so the result of
+parsing and validating a query string is kept in a per-schema LRU cache
+keyed by the SHA-256 of the string. Only valid documents are cached;
+queries longer than CRM_DOCUMENT_CACHE_MAX_QUERY_LENGTH are parsed every
+time so a handful of huge documents cannot pin memory.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from graphql import GraphQLError, parse, validate
+
+
+DocumentCacheInfo = namedtuple('DocumentCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+def get_document_cache_size():
+    return getattr(settings, 'CRM_DOCUMENT_CACHE_SIZE', 256)
+
+
+def get_max_query_length():
+    return getattr(settings, 'CRM_DOCUMENT_CACHE_MAX_QUERY_LENGTH', 20000)
+
+
+class DocumentCache:
+    def __init__(self, schema, maxsize=256, max_query_length=20000):
+        self.schema = schema
+        self.maxsize = maxsize
+        self.max_query_length = max_query_length
+        self.hits = self.misses = 0
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        """
+        Return (document, errors) for query. errors is empty when the
+        document is valid, in which case it is served from the cache.
+        """
+        key = hashlib.sha256(query.encode()).digest()
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                self.hits += 1
+                return document, []
+            self.misses += 1
+
+        try:
+            document = parse(query)
+        except GraphQLError as error:
+            return None, [error]
+        errors = validate(self.schema, document)
+        if errors:
+            return None, errors
+
+        if self.maxsize and len(query) <= self.max_query_length:
+            with self._lock:
+                self._documents[key] = document
+                while len(self._documents) > self.maxsize:
+                    self._documents.popitem(last=False)
+        return document, []
+
+    def info(self):
+        with self._lock:
+            return DocumentCacheInfo(self.hits, self.misses, self.maxsize, len(self._documents))
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+            self.hits = self.misses = 0
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_document_cache(schema):
+    """Return the process-wide DocumentCache for schema (a GraphQLSchema)."""
+    cache = _caches.get(schema)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(schema)
+            if cache is None:
+                cache = _caches[schema] = DocumentCache(
+                    schema, get_document_cache_size(), get_max_query_length()
+                )
+    return cache
@@ -0,0 +1,77 @@
+"""
+Run GraphQL documents for scheduled jobs.
+
+Cron jobs and Celery tasks already run inside Django, so they execute
+documents directly against the project schema instead of making an HTTP
+round-trip (plus an introspection query) to the web tier. Pass ``url`` only
+for checks that are about the HTTP endpoint itself, such as the heartbeat.
+"""
+
+from django.conf import settings
+from django.http import HttpRequest
+from graphql import DocumentNode, execute, print_ast
+from .documents import get_document_cache
+
+
+class GraphQLExecutionError(Exception):
+    """The document failed to validate or execute; errors holds the formatted errors."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(
+            error.get('message', str(error)) if isinstance(error, dict) else str(error)
+            for error in errors
+        ))
+
+
+def get_graphql_url():
+    return getattr(settings, 'CRM_GRAPHQL_URL', 'http://localhost:8000/graphql')
+
+
+def get_schema():
+    from graphene_django.settings import graphene_settings
+
+    return graphene_settings.SCHEMA.graphql_schema
+
+
+def prepare(document):
+    """Parse and validate document (a string or gql() DocumentNode) once per process."""
+    if isinstance(document, DocumentNode):
+        document = print_ast(document)
+    document, errors = get_document_cache(get_schema()).get(document)
+    if errors:
+        raise GraphQLExecutionError([error.formatted for error in errors])
+    return document
+
+
+def make_context():
+    request = HttpRequest()
+    request.method = 'POST'
+    request.path = '/graphql'
+    return request
+
+
+def execute_query(document, variables=None, operation_name=None, url=None):
+    """
+    Execute document and return its data, raising GraphQLExecutionError if
+    the result has errors. Runs in-process unless url is given.
+    """
+    if url is not None:
+        return execute_remote(url, document, variables, operation_name)
+    result = execute(
+        get_schema(),
+        prepare(document),
+        context_value=make_context(),
+        variable_values=variables,
+        operation_name=operation_name,
+    )
+    if result.errors:
+        raise GraphQLExecutionError([error.formatted for error in result.errors])
+    return result.data
+
+
+def execute_remote(url, document, variables=None, operation_name=None):
+    """Execute document against the GraphQL endpoint at url over HTTP."""
+    from .client import get_client
+
+    return get_client(url).execute(document, variables, operation_name)
@@ -0,0 +1,178 @@
+import graphene
+from django.db.models.query import QuerySet
+from graphene_django.fields import DjangoConnectionField
+from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django.filter.utils import get_filtering_args_from_filterset
+from graphene_django.utils import maybe_queryset
+from graphql_relay import cursor_to_offset
+from .filters import filter_queryset, graphene_filterset
+from .loaders import get_loaders
+from .pagination import encode_cursor, get_keyset_ordering, paginate_keyset
+
+
+PAGINATION_ARGS = ('first', 'last', 'before', 'after', 'offset')
+
+
+def filter_args(args):
+    """The non-pagination arguments that were supplied."""
+    return {name: value for name, value in args.items() if value is not None and name not in PAGINATION_ARGS}
+
+
+def has_filter_args(args):
+    """Return True if any non-pagination argument was supplied."""
+    return bool(filter_args(args))
+
+
+def page_limit(args, fields):
+    """
+    Return how many rows per parent a connection page needs: the rows up to
+    the end of the page plus one to tell whether there is a next page, or
+    None when every row is needed (last, totalCount, or no first).
+
+    args are the connection arguments and fields the selection below the
+    connection.
+    """
+    first = args.get('first')
+    if first is None or first < 0 or args.get('last') is not None:
+        return None
+    if 'totalCount' in fields or not ('edges' in fields or 'pageInfo' in fields):
+        return None
+    start = args.get('offset') or 0
+    if args.get('after') is not None:
+        after = cursor_to_offset(args['after'])
+        if after is None:
+            return None
+        start += after + 1
+    return start + first + 1
+
+
+class CountableConnection(graphene.relay.Connection):
+    """Connection with a totalCount that only runs COUNT(*) when selected."""
+    
+    class Meta:
+        abstract = True
+    
+    total_count = graphene.Int()
+    
+    def resolve_total_count(self, info):
+        length = getattr(self, 'length', None)
+        if length is None:
+            iterable = self.iterable
+            length = iterable.count() if isinstance(iterable, QuerySet) else len(iterable)
+        return length
+
+
+class BatchedConnectionMixin:
+    """
+    Connection field that cooperates with the per-request DataLoaders.
+
+    Resolvers may return the (already batched) list from a loader instead of a
+    queryset, and the nodes on each resolved page are primed into the loaders
+    so their own relations are fetched in one query per level.
+    """
+
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver,
+                            max_limit, enforce_first_or_last, root, info, **args):
+        result = super().connection_resolver(
+            resolver, connection, default_manager, queryset_resolver,
+            max_limit, enforce_first_or_last, root, info, **args
+        )
+        edges = getattr(result, 'edges', None)
+        if edges is not None:
+            get_loaders(info).prime(edge.node for edge in edges)
+        return result
+
+
+class BatchedConnectionField(BatchedConnectionMixin, DjangoConnectionField):
+    pass
+
+
+class BatchedFilterConnectionField(BatchedConnectionMixin, DjangoFilterConnectionField):
+    @property
+    def filterset_class(self):
+        # Share one set-up filterset per FilterSet, and so its compiled filters
+        filterset_class = self._provided_filterset_class or self.node_type._meta.filterset_class
+        if filterset_class is None or self._fields or self._extra_filter_meta:
+            return super().filterset_class
+        return graphene_filterset(filterset_class)
+
+    @classmethod
+    def resolve_queryset(cls, connection, iterable, info, args, filtering_args, filterset_class):
+        # Loader results are only returned when no filter arguments were given,
+        # and re-filtering a prefetched queryset would throw its cache away
+        iterable = maybe_queryset(iterable)
+        if isinstance(iterable, list):
+            return iterable
+        if iterable._result_cache is not None and not has_filter_args(args):
+            return iterable
+        queryset = super(DjangoFilterConnectionField, cls).resolve_queryset(connection, iterable, info, args)
+        return filter_queryset(
+            queryset,
+            filterset_class,
+            {name: value for name, value in args.items() if name in filtering_args},
+        )
+
+
+class FilterListField(graphene.Field):
+    """
+    Plain list field taking the same filter arguments as the connection of
+    its type, e.g. ``orders(orderDate_Gte: ..., first: 10)``. The resolver
+    receives them as keyword arguments and applies them with
+    crm.filters.filter_queryset.
+    """
+
+    def __init__(self, _type, filterset_class=None, **kwargs):
+        self.filterset_class = graphene_filterset(filterset_class or _type._meta.filterset_class)
+        kwargs.setdefault('first', graphene.Int())
+        kwargs.setdefault('after', graphene.ID())
+        filtering_args = get_filtering_args_from_filterset(self.filterset_class, _type)
+        super().__init__(graphene.List(_type), **filtering_args, **kwargs)
+
+
+class KeysetConnectionField(BatchedFilterConnectionField):
+    """
+    Filter connection paginated by keyset rather than by offset.
+
+    Pages are ordered by the queryset ordering (the model's Meta.ordering by
+    default) plus the primary key, and cursors encode the sort key of the
+    edge, so every page costs the same no matter how deep it is.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        ordering = get_keyset_ordering(iterable) if isinstance(iterable, QuerySet) else None
+        if ordering is None:
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        first = args.get('first')
+        last = args.get('last')
+        if max_limit is not None and first is None and last is None:
+            first = max_limit
+
+        rows, has_previous_page, has_next_page = paginate_keyset(
+            iterable,
+            ordering,
+            first=first,
+            last=last,
+            after=args.get('after'),
+            before=args.get('before'),
+            offset=args.get('offset'),
+        )
+        edges = [
+            connection.Edge(node=row, cursor=encode_cursor(row, ordering))
+            for row in rows
+        ]
+        result = connection(
+            edges=edges,
+            page_info=graphene.relay.PageInfo(
+                start_cursor=edges[0].cursor if edges else None,
+                end_cursor=edges[-1].cursor if edges else None,
+                has_previous_page=has_previous_page,
+                has_next_page=has_next_page,
+            ),
+        )
+        result.iterable = iterable
+        result.length = None
+        return result
@@ -1,12 +1,37 @@
+from functools import lru_cache
 import django_filters
 from django_filters import rest_framework as filters
+from django.core.exceptions import ValidationError
 from django.db.models import Q
+from django.forms.utils import ErrorDict, ErrorList
+from graphene_django.filter.fields import convert_enum
+from graphene_django.filter.utils import get_filterset_class
 from .models import Customer, Product, Order
+from .search import search
 
 
-class CustomerFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
-    email = django_filters.CharFilter(lookup_expr='icontains')
+class SearchFilterSet(django_filters.FilterSet):
+    """FilterSet whose substring filters go through the search backend."""
+    
+    def filter_search(self, queryset, name, value):
+        """Substring match on name, ordered by relevance"""
+        if value:
+            return search(queryset, name, value, rank=True)
+        return queryset
+    
+    def filter_related_search(self, queryset, name, value):
+        """Substring match on a field of a related model"""
+        if value:
+            return search(queryset, name, value).distinct()
+        return queryset
+
+
+class CustomerFilter(SearchFilterSet):
+    name = django_filters.CharFilter(method='filter_search')
+    name__icontains = django_filters.CharFilter(field_name='name', method='filter_search')
+    email = django_filters.CharFilter(method='filter_search')
+    email__icontains = django_filters.CharFilter(field_name='email', method='filter_search')
+    phone__icontains = django_filters.CharFilter(field_name='phone', method='filter_search')
     created_at_gte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_at_lte = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
     phone_pattern = django_filters.CharFilter(method='filter_phone_pattern')
@@ -27,8 +52,9 @@ class CustomerFilter(django_filters.FilterSet):
         return queryset
 
 
-class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains')
+class ProductFilter(SearchFilterSet):
+    name = django_filters.CharFilter(method='filter_search')
+    name__icontains = django_filters.CharFilter(field_name='name', method='filter_search')
     price_gte = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
     price_lte = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
     stock_gte = django_filters.NumberFilter(field_name='stock', lookup_expr='gte')
@@ -50,13 +76,13 @@ class ProductFilter(django_filters.FilterSet):
         return queryset
 
 
-class OrderFilter(django_filters.FilterSet):
+class OrderFilter(SearchFilterSet):
     total_amount_gte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
     total_amount_lte = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
     order_date_gte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='gte')
     order_date_lte = django_filters.DateTimeFilter(field_name='order_date', lookup_expr='lte')
-    customer_name = django_filters.CharFilter(field_name='customer__name', lookup_expr='icontains')
-    product_name = django_filters.CharFilter(method='filter_product_name')
+    customer_name = django_filters.CharFilter(field_name='customer__name', method='filter_related_search')
+    product_name = django_filters.CharFilter(field_name='items__product__name', method='filter_related_search')
     product_id = django_filters.CharFilter(method='filter_product_id')
     
     class Meta:
@@ -67,14 +93,64 @@ class OrderFilter(django_filters.FilterSet):
             'customer': ['exact'],
         }
     
-    def filter_product_name(self, queryset, name, value):
-        """Filter orders that contain products with matching name"""
-        if value:
-            return queryset.filter(items__product__name__icontains=value).distinct()
-        return queryset
-    
     def filter_product_id(self, queryset, name, value):
         """Filter orders that contain a specific product ID"""
         if value:
             return queryset.filter(items__product__id=value).distinct()
-        return queryset 
\ No newline at end of file
+        return queryset 
+
+
+@lru_cache(maxsize=None)
+def graphene_filterset(filterset_class):
+    """filterset_class set up for GraphQL arguments (global IDs etc.), built once."""
+    return get_filterset_class(filterset_class)
+
+
+@lru_cache(maxsize=256)
+def compile_filters(filterset_class, names):
+    """
+    Return a function (queryset, values) -> queryset applying the filters of
+    filterset_class named in names, in declaration order.
+
+    The filterset, its form fields and bound filter methods are built once
+    per argument shape instead of once per request. Filters therefore never
+    see a request.
+    """
+    filterset = filterset_class()
+    bound = [
+        (name, filter_, filter_.field)
+        for name, filter_ in filterset.filters.items()
+        if name in names
+    ]
+
+    def apply(queryset, values):
+        cleaned = []
+        errors = ErrorDict()
+        for name, filter_, field in bound:
+            try:
+                cleaned.append((filter_, field.clean(values[name])))
+            except ValidationError as error:
+                errors[name] = ErrorList(error.error_list)
+        if errors:
+            raise ValidationError(errors.as_json())
+        for filter_, value in cleaned:
+            queryset = filter_.filter(queryset, value)
+        return queryset
+
+    return apply
+
+
+def filter_queryset(queryset, filterset_class, values):
+    """
+    Filter queryset with the filters of filterset_class given in values, a
+    mapping of filter name to value. Names that are not filters of the
+    filterset and None values are ignored.
+    """
+    values = {
+        name: convert_enum(value)
+        for name, value in values.items()
+        if value is not None and name in filterset_class.base_filters
+    }
+    if not values:
+        return queryset
+    return compile_filters(filterset_class, frozenset(values))(queryset, values)
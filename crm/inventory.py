@@ -0,0 +1,119 @@
+from collections import namedtuple
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.sql import UpdateQuery
+from django.utils import timezone
+from .cache import touch
+from .models import Product
+
+
+# A reservation that cannot be met because a concurrent order got there first
+# and left too few units behind is retried this many times before giving up
+RESERVE_ATTEMPTS = 3
+
+StockShortage = namedtuple('StockShortage', ['product_id', 'requested', 'available'])
+
+
+def reserve_stock(quantities):
+    """
+    Take quantities ({product pk: units}) out of stock, all or nothing.
+
+    The reservation is one conditional UPDATE (stock = stock - q WHERE
+    stock >= q for every line), so concurrent orders never lose updates and
+    never wait on row locks held across a read. Must run inside a
+    transaction. Returns the lines that could not be met, or an empty list
+    once the stock has been taken.
+    """
+    if not quantities:
+        return []
+    pks = list(quantities)
+    requested = Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+    for _ in range(RESERVE_ATTEMPTS):
+        with transaction.atomic():
+            reserved = Product.objects.filter(pk__in=pks, stock__gte=requested).update(
+                stock=F('stock') - requested,
+                updated_at=timezone.now(),
+            )
+            if reserved == len(pks):
+                touch(Product)
+                return []
+            transaction.set_rollback(True)
+        available = dict(Product.objects.filter(pk__in=pks).values_list('pk', 'stock'))
+        shortages = [
+            StockShortage(pk, quantity, available.get(pk, 0))
+            for pk, quantity in quantities.items()
+            if available.get(pk, 0) < quantity
+        ]
+        if shortages:
+            return shortages
+    # Lost every race without any line being short when re-read
+    return [
+        StockShortage(pk, quantity, available.get(pk, 0))
+        for pk, quantity in quantities.items()
+    ]
+
+
+def supports_update_returning(connection):
+    """Whether UPDATE ... RETURNING is available (PostgreSQL, SQLite 3.35+)."""
+    return connection.vendor in ('postgresql', 'sqlite') and connection.features.can_return_columns_from_insert
+
+
+def update_returning(queryset, **values):
+    """
+    Run queryset.update(**values) as one UPDATE ... RETURNING statement and
+    return the updated rows as model instances.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    query = queryset.order_by().query.chain(UpdateQuery)
+    query.add_update_values(values)
+    query.annotations = {}
+    sql, params = query.get_compiler(queryset.db).as_sql()
+
+    fields = model._meta.concrete_fields
+    columns = [field.get_col(model._meta.db_table) for field in fields]
+    returning = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with transaction.mark_for_rollback_on_error(using=queryset.db):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} RETURNING {returning}', params)
+            rows = cursor.fetchall()
+
+    converters = [
+        connection.ops.get_db_converters(column) + column.get_db_converters(connection)
+        for column in columns
+    ]
+    instances = []
+    for row in rows:
+        values = []
+        for value, column, column_converters in zip(row, columns, converters):
+            for converter in column_converters:
+                value = converter(value, column, connection)
+            values.append(value)
+        instances.append(model.from_db(queryset.db, [field.attname for field in fields], values))
+    return instances
+
+
+def restock_low_stock(threshold=10, increment=10):
+    """
+    Add increment units to every product with fewer than threshold in stock
+    and return the restocked products.
+
+    The restock is a single UPDATE ... SET stock = stock + increment, so it
+    never overwrites units taken by concurrent orders. Products at or above
+    the threshold are untouched, which makes a repeated run a no-op once
+    the low stock has been topped up.
+    """
+    low_stock = Product.objects.filter(stock__lt=threshold)
+    values = {'stock': F('stock') + increment, 'updated_at': timezone.now()}
+    if supports_update_returning(connections[low_stock.db]):
+        products = update_returning(low_stock, **values)
+    else:
+        with transaction.atomic():
+            pks = list(low_stock.select_for_update().values_list('pk', flat=True))
+            Product.objects.filter(pk__in=pks).update(**values)
+        products = list(Product.objects.filter(pk__in=pks))
+    touch(Product)
+    return products
@@ -0,0 +1,201 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.db.models.lookups import LessThanOrEqual
+from .filters import filter_queryset
+from .models import Customer, Product, Order, OrderItem
+
+
+class DataLoader:
+    """
+    Batching loader with a per-request cache.
+
+    GraphQL execution is synchronous here, so keys cannot be collected by
+    deferring resolvers. Instead, parent resolvers prime the loader with the
+    keys of every sibling on the page, and the first cache miss fetches all
+    queued keys in a single batch.
+    """
+
+    def __init__(self, batch_load_fn, default=None):
+        self.batch_load_fn = batch_load_fn
+        self.default = default
+        self._cache = {}
+        self._queue = {}
+
+    def prime(self, keys):
+        """Queue keys to be fetched together with the next cache miss."""
+        for key in keys:
+            if key is not None and key not in self._cache:
+                self._queue[key] = None
+
+    def load(self, key):
+        if key is None:
+            return self._default_value()
+        if key not in self._cache:
+            self._queue[key] = None
+            self._dispatch()
+        return self._cache[key]
+
+    def load_many(self, keys):
+        self.prime(keys)
+        return [self.load(key) for key in keys]
+
+    def _default_value(self):
+        return self.default() if callable(self.default) else self.default
+
+    def _dispatch(self):
+        keys = list(self._queue)
+        self._queue.clear()
+        results = self.batch_load_fn(keys)
+        for key in keys:
+            self._cache[key] = results.get(key, self._default_value())
+
+
+class CRMLoaders:
+    """The DataLoaders for one GraphQL request."""
+
+    def __init__(self):
+        self.customer = DataLoader(self._load_customers)
+        self.product = DataLoader(self._load_products)
+        self.order = DataLoader(self._load_orders)
+        self.orders_by_customer = DataLoader(self._load_orders_by_customer, default=list)
+        self.items_by_order = DataLoader(self._load_items_by_order, default=list)
+        self._subsets = {}
+
+    def prime(self, instances):
+        """
+        Queue the relation keys of freshly resolved instances.
+
+        Relations already loaded by select_related/prefetch_related and
+        foreign keys deferred by only() are skipped.
+        """
+        instances = [instance for instance in instances if instance is not None]
+        for instance in instances:
+            if isinstance(instance, Order):
+                self._prime_forward(self.customer, instance, 'customer')
+                self._prime_reverse('items_by_order', instance, 'items')
+            elif isinstance(instance, OrderItem):
+                self._prime_forward(self.order, instance, 'order')
+                self._prime_forward(self.product, instance, 'product')
+            elif isinstance(instance, Customer):
+                self._prime_reverse('orders_by_customer', instance, 'orders')
+        return instances
+
+    def subset(self, name, limit=None, filterset_class=None, filters=None):
+        """
+        Return a loader like the reverse loader name (orders_by_customer or
+        items_by_order) that only fetches the rows of each parent matching
+        filters, and only the first limit of them. It starts primed with the
+        keys primed on the full loader.
+        """
+        filters = filters or {}
+        key = (name, limit, filterset_class, tuple(sorted((k, repr(v)) for k, v in filters.items())))
+        loader = self._subsets.get(key)
+        if loader is None:
+            full = getattr(self, name)
+            batch_load_fn = partial(
+                getattr(self, f'_load_{name}'),
+                limit=limit, filterset_class=filterset_class, filters=filters,
+            )
+            loader = self._subsets[key] = DataLoader(batch_load_fn, default=list)
+            loader.prime([*full._cache, *full._queue])
+        return loader
+
+    @staticmethod
+    def _prime_forward(loader, instance, name):
+        field = instance._meta.get_field(name)
+        if not field.is_cached(instance):
+            loader.prime([instance.__dict__.get(field.attname)])
+
+    def _prime_reverse(self, loader_name, instance, name):
+        if prefetched(instance, name) is None:
+            getattr(self, loader_name).prime([instance.pk])
+            for key, loader in self._subsets.items():
+                if key[0] == loader_name:
+                    loader.prime([instance.pk])
+
+    def _load_customers(self, keys):
+        return Customer.objects.in_bulk(keys)
+
+    def _load_products(self, keys):
+        return Product.objects.in_bulk(keys)
+
+    def _load_orders(self, keys):
+        orders = Order.objects.in_bulk(keys)
+        self.prime(orders.values())
+        return orders
+
+    def _load_orders_by_customer(self, keys, **subset):
+        grouped = defaultdict(list)
+        orders = narrow(Order.objects.filter(customer_id__in=keys), 'customer_id', **subset)
+        for order in self.prime(orders):
+            grouped[order.customer_id].append(order)
+        return grouped
+
+    def _load_items_by_order(self, keys, **subset):
+        grouped = defaultdict(list)
+        items = narrow(OrderItem.objects.filter(order_id__in=keys), 'order_id', **subset)
+        for item in self.prime(items):
+            grouped[item.order_id].append(item)
+        return grouped
+
+
+def narrow(queryset, parent_field, limit=None, filterset_class=None, filters=None):
+    """Apply the filters and the per-parent limit of a subset loader to queryset."""
+    if filterset_class is not None:
+        queryset = filter_queryset(queryset, filterset_class, filters)
+    return first_per_parent(queryset, parent_field, limit)
+
+
+def first_per_parent(queryset, parent_field, limit):
+    """Keep the first limit rows of queryset for each parent_field value, or all of them."""
+    if limit is None:
+        return queryset
+    if not queryset.ordered:
+        queryset = queryset.order_by('pk')
+    order_by = [expr for expr, _ in queryset.query.get_compiler(queryset.db).get_order_by()]
+    window = Window(RowNumber(), partition_by=F(parent_field), order_by=order_by)
+    return queryset.filter(LessThanOrEqual(window, limit))
+
+
+def prefetched(instance, name):
+    """Return the rows prefetch_related() stored for relation name, or None."""
+    cache = getattr(instance, '_prefetched_objects_cache', {})
+    if name in cache:
+        return list(cache[name])
+    return None
+
+
+_isolated = ContextVar('crm_isolated_loaders', default=None)
+
+
+@contextmanager
+def isolated_loaders():
+    """
+    Give the code in the block loaders of its own instead of the request's.
+    DataLoader is not thread-safe, so each thread resolving part of one
+    request needs this.
+    """
+    token = _isolated.set(CRMLoaders())
+    try:
+        yield
+    finally:
+        _isolated.reset(token)
+
+
+def get_loaders(info):
+    """Return the loaders bound to the current request, creating them on first use."""
+    loaders = _isolated.get()
+    if loaders is not None:
+        return loaders
+    context = info.context
+    if context is None:
+        return CRMLoaders()
+    loaders = getattr(context, 'crm_loaders', None)
+    if loaders is None:
+        loaders = CRMLoaders()
+        setattr(context, 'crm_loaders', loaders)
+    return loaders
@@ -0,0 +1,56 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from crm.models import Customer, Order
+
+
+def inactive_customers(cutoff):
+    """
+    Customers created before cutoff with no order since then.
+
+    The NOT EXISTS probe is served by crm_order_customer_date_idx
+    (customer, -order_date), so each customer costs one index seek.
+    """
+    recent_orders = Order.objects.filter(customer=OuterRef('pk'), order_date__gte=cutoff)
+    return Customer.objects.filter(created_at__lt=cutoff).filter(~Exists(recent_orders))
+
+
+class Command(BaseCommand):
+    help = "Delete customers with no orders in the last year (or --days)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help="Inactivity period in days (default 365)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Customers deleted per transaction")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the inactive customers")
+
+    def handle(self, *args, days, batch_size, dry_run, **options):
+        if days < 1 or batch_size < 1:
+            raise CommandError("--days and --batch-size must be positive")
+        cutoff = timezone.now() - timedelta(days=days)
+        inactive = inactive_customers(cutoff)
+
+        if dry_run:
+            count = inactive.count()
+            self.stdout.write(f"Would delete {count} inactive customers")
+            return
+
+        deleted = orders = 0
+        last_pk = None
+        while True:
+            # Walk the candidates in pk order so no batch rescans earlier rows
+            batch = inactive.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            with transaction.atomic():
+                # Re-check inactivity: a customer may have ordered since the scan
+                _, counts = inactive.filter(pk__in=pks).delete()
+            deleted += counts.get(Customer._meta.label, 0)
+            orders += counts.get(Order._meta.label, 0)
+
+        self.stdout.write(f"Deleted {deleted} inactive customers ({orders} old orders)")
@@ -0,0 +1,60 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.management.base import BaseCommand, CommandError
+
+
+def summarize(payload):
+    """One line per span of an OTLP/JSON trace export: duration, name, path."""
+    lines = []
+    for resource_spans in payload.get('resourceSpans', ()):
+        for scope_spans in resource_spans.get('scopeSpans', ()):
+            for span in scope_spans.get('spans', ()):
+                duration = (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+                attributes = {item['key']: item['value'] for item in span.get('attributes', ())}
+                path = attributes.get('graphql.field.path', {}).get('stringValue', '')
+                indent = '  ' if span.get('parentSpanId') else ''
+                lines.append(f"{span['traceId'][:8]} {indent}{span['name']} {duration:.2f} ms {path}".rstrip())
+    return lines
+
+
+class Command(BaseCommand):
+    help = "Receive OTLP/JSON traces (CRM_OTLP_ENDPOINT) locally and print their spans."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=4318)
+
+    def handle(self, *args, host, port, **options):
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != '/v1/traces':
+                    self.send_error(404)
+                    return
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                except ValueError:
+                    self.send_error(400, "Body must be OTLP/JSON")
+                    return
+                for line in summarize(payload):
+                    stdout.write(line)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as exc:
+            raise CommandError(f"Cannot listen on {host}:{port}: {exc}")
+        self.stdout.write(f"Collecting traces on http://{host}:{port}/v1/traces")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
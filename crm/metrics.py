@@ -0,0 +1,384 @@
+"""
+Latency histograms and spans for GraphQL operations.
+
+CRMGraphQLView records, for every operation, its duration, the number and
+time of its SQL statements (from crm.budget), the size of its response and
+whether it failed. A fraction CRM_METRICS_SAMPLE_RATE of operations is
+also sampled: FieldMetricsMiddleware times each resolver that returns an
+object or a list (scalar fields are left alone), and the timings become
+per-field histograms and, when CRM_OTLP_ENDPOINT is set, OTLP/JSON spans
+posted to that collector in the background. Unsampled operations run with
+no resolver middleware, so the sample rate bounds the overhead.
+
+The metrics are kept per process and served in the Prometheus text format
+by MetricsView (/metrics) to staff users and, when CRM_METRICS_TOKEN is
+set, to scrapers sending it as a bearer token. Operation names come from clients, so only the
+first MAX_OPERATION_LABELS distinct names get their own series; later ones
+are counted as 'other'.
+"""
+
+import hmac
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from django.conf import settings
+from graphql import get_named_type, is_leaf_type
+from .budget import path_key
+
+
+logger = logging.getLogger(__name__)
+
+MAX_OPERATION_LABELS = 100
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def get_metrics_enabled():
+    return getattr(settings, 'CRM_METRICS_ENABLED', True)
+
+
+def get_sample_rate():
+    return getattr(settings, 'CRM_METRICS_SAMPLE_RATE', 0.01)
+
+
+def get_otlp_endpoint():
+    return getattr(settings, 'CRM_OTLP_ENDPOINT', '')
+
+
+def get_metrics_token():
+    return getattr(settings, 'CRM_METRICS_TOKEN', '')
+
+
+def can_read_metrics(request):
+    """Whether request may read /metrics: a staff user, or the CRM_METRICS_TOKEN bearer token."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    token = get_metrics_token()
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.strip(), token)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}_total{format_labels(self.labelnames, labels)} {format_value(value)}"
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * len(self.buckets), 0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = format_labels(self.labelnames, labels, f'le="{format_value(bound)}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            inf = format_labels(self.labelnames, labels, 'le="+Inf"')
+            yield f"{self.name}_bucket{inf} {count}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self._operations = set()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def operation_label(self, name):
+        """name, or 'other' once MAX_OPERATION_LABELS names have been seen."""
+        if name in self._operations:
+            return name
+        with self._lock:
+            if len(self._operations) < MAX_OPERATION_LABELS:
+                self._operations.add(name)
+                return name
+        return 'other'
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+OPERATION_DURATION = registry.register(Histogram(
+    'crm_graphql_operation_duration_seconds', "Time to answer a GraphQL request.",
+    ('operation', 'type'),
+))
+OPERATION_ERRORS = registry.register(Counter(
+    'crm_graphql_operation_errors', "GraphQL requests answered with errors.", ('operation',),
+))
+SQL_QUERIES = registry.register(Histogram(
+    'crm_graphql_operation_sql_queries', "SQL statements run per GraphQL operation.",
+    ('operation',), SQL_COUNT_BUCKETS,
+))
+SQL_DURATION = registry.register(Histogram(
+    'crm_graphql_operation_sql_duration_seconds', "Time spent in SQL per GraphQL operation.",
+    ('operation',),
+))
+RESPONSE_SIZE = registry.register(Histogram(
+    'crm_graphql_response_size_bytes', "Size of GraphQL response bodies.",
+    ('operation',), SIZE_BUCKETS,
+))
+FIELD_DURATION = registry.register(Histogram(
+    'crm_graphql_field_duration_seconds', "Time spent in resolvers of sampled operations.",
+    ('field',),
+))
+
+
+def should_sample():
+    rate = get_sample_rate()
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def record_operation(request, response, duration):
+    """Record the metrics of one /graphql request answered with response."""
+    operation_ast = getattr(request, 'crm_operation', None)
+    name = 'anonymous'
+    if operation_ast is not None and operation_ast.name is not None:
+        name = operation_ast.name.value
+    label = registry.operation_label(name)
+    operation_type = operation_ast.operation.value if operation_ast is not None else 'unknown'
+
+    OPERATION_DURATION.observe(duration, label, operation_type)
+    if response.status_code >= 400 or getattr(request, 'crm_errors', False):
+        OPERATION_ERRORS.inc(label)
+    tracker = getattr(request, 'crm_queries', None)
+    if tracker is not None:
+        SQL_QUERIES.observe(tracker.count, label)
+        SQL_DURATION.observe(tracker.duration, label)
+    if not response.streaming:
+        RESPONSE_SIZE.observe(len(response.content), label)
+
+    trace = getattr(request, 'crm_trace', None)
+    if trace is not None:
+        trace.end(name, operation_type, response.status_code)
+        exporter = get_exporter()
+        if exporter is not None:
+            exporter.export(trace)
+
+
+class Trace:
+    """The operation span and resolver spans of one sampled operation."""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.name = None
+        self.attributes = {}
+        self.fields = []
+
+    def add_field(self, path, field, start_ns, end_ns):
+        self.fields.append((path, field, start_ns, end_ns))
+
+    def end(self, name, operation_type, status_code):
+        self.end_ns = time.time_ns()
+        self.name = f"{operation_type} {name}"
+        self.attributes = {
+            'graphql.operation.name': name,
+            'graphql.operation.type': operation_type,
+            'http.status_code': status_code,
+        }
+
+    def spans(self):
+        """The spans in OTLP/JSON form, each resolver under its closest traced ancestor."""
+        spans = [self.span(self.span_id, None, self.name, 2, self.start_ns, self.end_ns, self.attributes)]
+        span_ids = {}
+        for path, field, start_ns, end_ns in self.fields:
+            span_id = os.urandom(8).hex()
+            span_ids.setdefault(path, span_id)
+            parent, parent_id = path, None
+            while parent_id is None and '.' in parent:
+                parent = parent.rsplit('.', 1)[0]
+                parent_id = span_ids.get(parent)
+            spans.append(self.span(
+                span_id, parent_id or self.span_id, field, 1, start_ns, end_ns, {'graphql.field.path': path},
+            ))
+        return spans
+
+    def span(self, span_id, parent_id, name, kind, start_ns, end_ns, attributes):
+        span = {
+            'traceId': self.trace_id,
+            'spanId': span_id,
+            'name': name,
+            'kind': kind,
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(end_ns),
+            'attributes': [
+                {'key': key, 'value': {'intValue': str(value)} if isinstance(value, int) else {'stringValue': str(value)}}
+                for key, value in attributes.items()
+            ],
+        }
+        if parent_id:
+            span['parentSpanId'] = parent_id
+        return span
+
+
+class FieldMetricsMiddleware:
+    """Graphene middleware that times the object and list resolvers of sampled operations."""
+
+    def __init__(self):
+        self.timed = {}
+
+    def resolve(self, next, root, info, **args):
+        key = (info.parent_type.name, info.field_name)
+        timed = self.timed.get(key)
+        if timed is None:
+            timed = self.timed[key] = not is_leaf_type(get_named_type(info.return_type))
+        if not timed:
+            return next(root, info, **args)
+        start_ns = time.time_ns()
+        try:
+            return next(root, info, **args)
+        finally:
+            end_ns = time.time_ns()
+            field = f'{key[0]}.{key[1]}'
+            FIELD_DURATION.observe((end_ns - start_ns) / 1e9, field)
+            trace = getattr(info.context, 'crm_trace', None)
+            if trace is not None:
+                trace.add_field(path_key(info.path), field, start_ns, end_ns)
+
+
+class OTLPExporter:
+    """
+    Post traces as OTLP/JSON to endpoint from a daemon thread. Traces are
+    dropped, not queued without bound, when the collector falls behind.
+    """
+
+    def __init__(self, endpoint, max_queue=1000, batch_size=50, timeout=2):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self.run, name='crm-otlp-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, trace):
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        import requests
+
+        session = requests.Session()
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                session.post(self.endpoint, json=self.payload(batch), timeout=self.timeout).raise_for_status()
+            except requests.RequestException as exc:
+                logger.warning("Could not export %d traces to %s: %s", len(batch), self.endpoint, exc)
+
+    @staticmethod
+    def payload(traces):
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'crm'}}]},
+                'scopeSpans': [{
+                    'scope': {'name': 'crm.metrics'},
+                    'spans': [span for trace in traces for span in trace.spans()],
+                }],
+            }],
+        }
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporter():
+    """The process-wide OTLPExporter for CRM_OTLP_ENDPOINT, or None when it is not set."""
+    endpoint = get_otlp_endpoint()
+    if not endpoint:
+        return None
+    exporter = _exporters.get(endpoint)
+    if exporter is None:
+        with _exporters_lock:
+            exporter = _exporters.get(endpoint)
+            if exporter is None:
+                exporter = _exporters[endpoint] = OTLPExporter(endpoint)
+    return exporter
@@ -0,0 +1,100 @@
+"""
+Search indexes for the *_icontains filters (see crm/search.py).
+
+PostgreSQL: pg_trgm GIN indexes on UPPER(field), which serve Django's
+icontains lookups directly.
+
+SQLite: an external-content FTS5 table per model using the trigram
+tokenizer, kept in sync by triggers; the update trigger only fires when a
+searched column changes. 0008_search_rowids replaces these tables with
+ones keyed on stable rowids.
+"""
+
+from django.db import migrations
+
+
+SEARCH_FIELDS = {
+    'crm_customer': ('name', 'email', 'phone'),
+    'crm_product': ('name',),
+}
+
+
+def postgresql_forwards(schema_editor):
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, fields in SEARCH_FIELDS.items():
+        for field in fields:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_{field}_trgm" '
+                f'ON "{table}" USING gin (UPPER("{field}") gin_trgm_ops)'
+            )
+
+
+def postgresql_backwards(schema_editor):
+    for table, fields in SEARCH_FIELDS.items():
+        for field in fields:
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{table}_{field}_trgm"')
+
+
+def sqlite_forwards(schema_editor):
+    for table, fields in SEARCH_FIELDS.items():
+        search_table = f'{table}_search'
+        columns = ', '.join(f'"{field}"' for field in fields)
+        new_values = ', '.join(f'new."{field}"' for field in fields)
+        old_values = ', '.join(f'old."{field}"' for field in fields)
+        delete_old = (
+            f'INSERT INTO "{search_table}"("{search_table}", rowid, {columns}) '
+            f"VALUES ('delete', old.rowid, {old_values});"
+        )
+        insert_new = (
+            f'INSERT INTO "{search_table}"(rowid, {columns}) VALUES (new.rowid, {new_values});'
+        )
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE "{search_table}" USING fts5('
+            f"{columns}, content='{table}', content_rowid='rowid', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_ai" AFTER INSERT ON "{table}" BEGIN {insert_new} END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_ad" AFTER DELETE ON "{table}" BEGIN {delete_old} END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_au" AFTER UPDATE OF {columns} ON "{table}" '
+            f'BEGIN {delete_old} {insert_new} END'
+        )
+        schema_editor.execute(f'INSERT INTO "{search_table}"("{search_table}") VALUES (\'rebuild\')')
+
+
+def sqlite_backwards(schema_editor):
+    for table in SEARCH_FIELDS:
+        search_table = f'{table}_search'
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{search_table}_{suffix}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{search_table}"')
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        postgresql_forwards(schema_editor)
+    elif vendor == 'sqlite':
+        sqlite_forwards(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        postgresql_backwards(schema_editor)
+    elif vendor == 'sqlite':
+        sqlite_backwards(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0002_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 03:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0004_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderReminder',
+            fields=[
+                ('order', models.OneToOneField(help_text='Order the reminder covered', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reminder', serialize=False, to='crm.order')),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Order Reminder',
+                'verbose_name_plural': 'Order Reminders',
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0005_order_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersistedQuery',
+            fields=[
+                ('sha256', models.CharField(help_text='Hex SHA-256 of the query', max_length=64, primary_key=True, serialize=False)),
+                ('query', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Persisted Query',
+                'verbose_name_plural': 'Persisted Queries',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
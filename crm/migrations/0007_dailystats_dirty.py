@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0006_persisted_query'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystats',
+            name='dirty',
+            field=models.BooleanField(default=False, help_text='Rows of this day changed after they were rolled up; read live until recomputed'),
+        ),
+    ]
@@ -0,0 +1,102 @@
+"""
+Stable rowids for the SQLite search tables of 0003_search_indexes.
+
+crm_customer and crm_product have UUID primary keys, so their rowid is
+SQLite's implicit one, which VACUUM may renumber; an FTS5 table keyed on it
+can silently point at the wrong rows. Each searched table now gets a
+``<db_table>_search_ids`` table mapping an INTEGER PRIMARY KEY (a true
+rowid alias, never renumbered) to the primary key, and the FTS5 table reads
+its content through a view joining the two. As before, SQLite migrations
+that rebuild crm_customer or crm_product drop the triggers, so such a
+migration must reverse and re-apply this one around the rebuild.
+
+Nothing changes on other databases.
+"""
+
+from importlib import import_module
+from django.db import migrations
+
+
+search_indexes = import_module('crm.migrations.0003_search_indexes')
+
+SEARCH_FIELDS = search_indexes.SEARCH_FIELDS
+
+PK_COLUMN = 'id'
+
+
+def sqlite_forwards(schema_editor):
+    search_indexes.sqlite_backwards(schema_editor)
+    for table, fields in SEARCH_FIELDS.items():
+        search_table = f'{table}_search'
+        ids_table = f'{search_table}_ids'
+        content_view = f'{search_table}_content'
+        columns = ', '.join(f'"{field}"' for field in fields)
+        new_values = ', '.join(f'new."{field}"' for field in fields)
+        old_values = ', '.join(f'old."{field}"' for field in fields)
+        new_rowid = f'(SELECT rowid FROM "{ids_table}" WHERE "{PK_COLUMN}" = new."{PK_COLUMN}")'
+        old_rowid = f'(SELECT rowid FROM "{ids_table}" WHERE "{PK_COLUMN}" = old."{PK_COLUMN}")'
+        delete_old = (
+            f'INSERT INTO "{search_table}"("{search_table}", rowid, {columns}) '
+            f"VALUES ('delete', {old_rowid}, {old_values});"
+        )
+        insert_new = f'INSERT INTO "{search_table}"(rowid, {columns}) VALUES ({new_rowid}, {new_values});'
+
+        schema_editor.execute(
+            f'CREATE TABLE "{ids_table}" ('
+            f'"rowid" integer NOT NULL PRIMARY KEY AUTOINCREMENT, "{PK_COLUMN}" char(32) NOT NULL UNIQUE)'
+        )
+        schema_editor.execute(f'INSERT INTO "{ids_table}"("{PK_COLUMN}") SELECT "{PK_COLUMN}" FROM "{table}"')
+        schema_editor.execute(
+            f'CREATE VIEW "{content_view}" AS SELECT "{ids_table}"."rowid" AS "search_rowid", '
+            + ', '.join(f'"{table}"."{field}"' for field in fields)
+            + f' FROM "{ids_table}" JOIN "{table}" ON "{table}"."{PK_COLUMN}" = "{ids_table}"."{PK_COLUMN}"'
+        )
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE "{search_table}" USING fts5('
+            f"{columns}, content='{content_view}', content_rowid='search_rowid', tokenize='trigram')"
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_ai" AFTER INSERT ON "{table}" BEGIN '
+            f'INSERT INTO "{ids_table}"("{PK_COLUMN}") VALUES (new."{PK_COLUMN}"); {insert_new} END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_ad" AFTER DELETE ON "{table}" BEGIN {delete_old} '
+            f'DELETE FROM "{ids_table}" WHERE "{PK_COLUMN}" = old."{PK_COLUMN}"; END'
+        )
+        schema_editor.execute(
+            f'CREATE TRIGGER "{search_table}_au" AFTER UPDATE OF {columns} ON "{table}" '
+            f'BEGIN {delete_old} {insert_new} END'
+        )
+        schema_editor.execute(f'INSERT INTO "{search_table}"("{search_table}") VALUES (\'rebuild\')')
+
+
+def sqlite_backwards(schema_editor):
+    for table in SEARCH_FIELDS:
+        search_table = f'{table}_search'
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS "{search_table}_{suffix}"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{search_table}"')
+        schema_editor.execute(f'DROP VIEW IF EXISTS "{search_table}_content"')
+        schema_editor.execute(f'DROP TABLE IF EXISTS "{search_table}_ids"')
+    search_indexes.sqlite_forwards(schema_editor)
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        sqlite_forwards(schema_editor)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        sqlite_backwards(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0007_dailystats_dirty'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
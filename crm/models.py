@@ -1,6 +1,8 @@
 from django.db import models
+from django.db.models import F, Q, Sum
 from django.core.validators import MinValueValidator, RegexValidator
 from django.utils import timezone
+import hashlib
 import uuid
 
 
@@ -27,6 +29,10 @@ class Customer(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='crm_customer_created_idx'),
+            models.Index(fields=['name'], name='crm_customer_name_idx'),
+        ]
         verbose_name = 'Customer'
         verbose_name_plural = 'Customers'
     
@@ -54,6 +60,13 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='crm_product_name_idx'),
+            models.Index(fields=['price'], name='crm_product_price_idx'),
+            models.Index(fields=['stock'], name='crm_product_stock_idx'),
+            # Serves the low_stock filter and UpdateLowStockProducts
+            models.Index(fields=['stock'], condition=Q(stock__lt=10), name='crm_product_low_stock_idx'),
+        ]
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
     
@@ -89,6 +102,13 @@ class Order(models.Model):
     
     class Meta:
         ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['-order_date', 'id'], name='crm_order_date_idx'),
+            models.Index(fields=['customer', '-order_date'], name='crm_order_customer_date_idx'),
+            models.Index(fields=['total_amount'], name='crm_order_total_idx'),
+            # Serves the incremental scan of crm.rollup
+            models.Index(fields=['created_at'], name='crm_order_created_idx'),
+        ]
         verbose_name = 'Order'
         verbose_name_plural = 'Orders'
     
@@ -97,9 +117,12 @@ class Order(models.Model):
     
     def calculate_total(self):
         """Calculate total amount from order items."""
-        total = sum(item.subtotal for item in self.items.all())
+        subtotal = F('quantity') * F('unit_price')
+        total = self.items.aggregate(
+            total=Sum(subtotal, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+        )['total'] or 0
         self.total_amount = total
-        self.save()
+        self.save(update_fields=['total_amount', 'updated_at'])
         return total
 
 
@@ -149,4 +172,82 @@ class OrderItem(models.Model):
             self.unit_price = self.product.price
         super().save(*args, **kwargs)
         # Update order total
-        self.order.calculate_total() 
\ No newline at end of file
+        self.order.calculate_total()
+
+
+class DailyStats(models.Model):
+    """Pre-aggregated orders, revenue and new customers per day (see crm.rollup)."""
+    
+    date = models.DateField(primary_key=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    new_customers = models.PositiveIntegerField(default=0)
+    dirty = models.BooleanField(
+        default=False,
+        help_text="Rows of this day changed after they were rolled up; read live until recomputed"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date']
+        verbose_name = 'Daily Stats'
+        verbose_name_plural = 'Daily Stats'
+    
+    def __str__(self):
+        return f"{self.date}: {self.order_count} orders, ${self.revenue}"
+
+
+class RollupState(models.Model):
+    """High-water mark of a rollup: rows created up to this time are aggregated."""
+    
+    name = models.CharField(max_length=50, unique=True)
+    high_water_mark = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Rollup State'
+        verbose_name_plural = 'Rollup States'
+    
+    def __str__(self):
+        return f"{self.name} up to {self.high_water_mark}"
+
+
+class OrderReminder(models.Model):
+    """Records that a reminder covering this order was sent (see crm.reminders)."""
+    
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='reminder',
+        help_text="Order the reminder covered"
+    )
+    sent_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        verbose_name = 'Order Reminder'
+        verbose_name_plural = 'Order Reminders'
+    
+    def __str__(self):
+        return f"Reminder for Order {self.order_id} sent {self.sent_at}"
+
+
+class PersistedQuery(models.Model):
+    """A query document clients run by its SHA-256 hash (see crm.persisted)."""
+    
+    sha256 = models.CharField(max_length=64, primary_key=True, help_text="Hex SHA-256 of the query")
+    query = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = 'Persisted Query'
+        verbose_name_plural = 'Persisted Queries'
+    
+    def save(self, *args, **kwargs):
+        if not self.sha256:
+            self.sha256 = hashlib.sha256(self.query.encode()).hexdigest()
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return self.sha256
@@ -0,0 +1,259 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from itertools import islice
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Q
+from graphql_relay import from_global_id
+
+
+CURSOR_PREFIX = 'keyset:'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_list_max_limit():
+    return getattr(settings, 'CRM_LIST_MAX_LIMIT', 100)
+
+
+def get_stream_chunk_size():
+    return getattr(settings, 'CRM_STREAM_CHUNK_SIZE', 500)
+
+
+def get_keyset_ordering(queryset):
+    """
+    Return the ordering of queryset as (field_name, descending) pairs with the
+    primary key appended as a tie-breaker, or None if the ordering cannot be
+    used for keyset pagination (expressions, lookups across relations).
+    """
+    model = queryset.model
+    order_by = queryset.query.order_by or model._meta.ordering
+    pk_name = model._meta.pk.name
+    ordering = []
+    for term in order_by:
+        if not isinstance(term, str):
+            return None
+        descending = term.startswith('-')
+        name = term.lstrip('-')
+        if name == 'pk':
+            name = pk_name
+        if '__' in name or name == '?':
+            return None
+        if not any(field.name == name for field in model._meta.concrete_fields):
+            # Annotations such as the search rank
+            return None
+        ordering.append((name, descending))
+    if pk_name not in [name for name, _ in ordering]:
+        ordering.append((pk_name, False))
+    return ordering
+
+
+def _key_alias(index):
+    return f'keyset_key_{index}'
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if value is None or isinstance(value, (int, float, bool)):
+        return value
+    return str(value)
+
+
+def encode_cursor(row, ordering):
+    values = [_serialize(getattr(row, _key_alias(index))) for index in range(len(ordering))]
+    payload = json.dumps(values, separators=(',', ':'))
+    return base64.b64encode((CURSOR_PREFIX + payload).encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        decoded = base64.b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    if not decoded.startswith(CURSOR_PREFIX):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    try:
+        values = json.loads(decoded[len(CURSOR_PREFIX):])
+    except ValueError:
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(f"Cursor does not match the ordering: {cursor}")
+    return [
+        model._meta.get_field(name).to_python(value)
+        for (name, _), value in zip(ordering, values)
+    ]
+
+
+def nulls_order_largest(queryset):
+    """Whether the database of queryset sorts NULL after every value (PostgreSQL) or before (SQLite)."""
+    return connections[queryset.db].features.nulls_order_largest
+
+
+def keyset_filter(ordering, values, backwards=False, nulls_largest=False):
+    """
+    Build the row-value comparison that selects rows strictly after values in
+    ordering, or strictly before them when backwards is True. NULL sort keys
+    are placed where the database sorts them: after every value when
+    nulls_largest, before every value otherwise.
+    """
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(ordering, values):
+        greater = descending == backwards
+        if value is None:
+            # Only the non-NULL values can follow NULL, and only when NULL sorts first
+            if greater != nulls_largest:
+                condition |= equal & Q(**{f'{name}__isnull': False})
+            equal &= Q(**{f'{name}__isnull': True})
+            continue
+        beyond = Q(**{f"{name}__{'gt' if greater else 'lt'}": value})
+        if greater == nulls_largest:
+            beyond |= Q(**{f'{name}__isnull': True})
+        condition |= equal & beyond
+        equal &= Q(**{name: value})
+    return condition
+
+
+def order_for_keyset(queryset, ordering, backwards=False):
+    """Apply ordering and select the sort keys so cursors survive only()."""
+    terms = [
+        f"{'-' if descending != backwards else ''}{name}"
+        for name, descending in ordering
+    ]
+    annotations = {_key_alias(index): F(name) for index, (name, _) in enumerate(ordering)}
+    return queryset.annotate(**annotations).order_by(*terms)
+
+
+def paginate_keyset(queryset, ordering, first=None, last=None, after=None, before=None, offset=0):
+    """
+    Return (rows, has_previous_page, has_next_page) for one page.
+
+    Every page is a single indexed range scan whatever its depth. The page
+    before an ``after`` cursor (and after a ``before`` cursor) is assumed to
+    exist rather than counted.
+    """
+    model = queryset.model
+    nulls_largest = nulls_order_largest(queryset)
+    if after:
+        queryset = queryset.filter(
+            keyset_filter(ordering, decode_cursor(after, model, ordering), nulls_largest=nulls_largest)
+        )
+    if before:
+        queryset = queryset.filter(keyset_filter(
+            ordering, decode_cursor(before, model, ordering), backwards=True, nulls_largest=nulls_largest,
+        ))
+    offset = offset or 0
+
+    if last is not None and first is None:
+        queryset = order_for_keyset(queryset, ordering, backwards=True)
+        rows = list(queryset[offset:offset + last + 1])
+        has_previous_page = len(rows) > last
+        rows = rows[:last][::-1]
+        return rows, has_previous_page, bool(before) or offset > 0
+
+    queryset = order_for_keyset(queryset, ordering)
+    if first is None:
+        rows = list(queryset[offset:])
+        has_next_page = False
+    else:
+        rows = list(queryset[offset:offset + first + 1])
+        has_next_page = len(rows) > first
+        rows = rows[:first]
+    has_previous_page = bool(after) or offset > 0
+    if last is not None and len(rows) > last:
+        rows = rows[-last:]
+        has_previous_page = True
+    return rows, has_previous_page, has_next_page
+
+
+def iterate_keyset(queryset, ordering, page_size):
+    """
+    Yield every row of queryset in ordering, fetching page_size rows per
+    query. Each page resumes from the cursor of the previous one, so rows
+    that drop out of queryset meanwhile (e.g. marked as processed) do not
+    shift the pages.
+    """
+    cursor = None
+    while True:
+        rows, _, has_next_page = paginate_keyset(queryset, ordering, first=page_size, after=cursor)
+        yield from rows
+        if not has_next_page:
+            return
+        cursor = encode_cursor(rows[-1], ordering)
+
+
+def _values_after(queryset, ordering, after):
+    """Read the sort key of the row identified by after (a global or raw id)."""
+    resolved = from_global_id(after)
+    pk = resolved.id if resolved.type else after
+    names = [name for name, _ in ordering]
+    try:
+        values = queryset.model._default_manager.filter(pk=pk).values_list(*names).first()
+    except (ValueError, TypeError):
+        values = None
+    if values is None:
+        raise InvalidCursor(f"Invalid after: no {queryset.model._meta.verbose_name} with id {after}")
+    return list(values)
+
+
+def paginate_list(info, queryset, first=None, after=None):
+    """
+    Bound a plain list field to at most CRM_LIST_MAX_LIMIT rows.
+
+    ``after`` is the id of the last row the client already has; the next
+    rows are found with a keyset comparison on the queryset ordering. When
+    the request is being streamed (see crm.views.GraphQLStreamView) the
+    next chunk of the stream is returned instead.
+    """
+    stream = getattr(info.context, 'crm_stream', None)
+    if stream is not None:
+        return stream.next_chunk(queryset)
+
+    max_limit = get_list_max_limit()
+    if first is None:
+        first = max_limit
+    if first < 0:
+        raise ValueError(f"`first` on the `{info.field_name}` field must be positive.")
+    if max_limit is not None and first > max_limit:
+        raise ValueError(
+            f"Requesting {first} records on the `{info.field_name}` field exceeds "
+            f"the limit of {max_limit} records."
+        )
+    ordering = get_keyset_ordering(queryset)
+    if after:
+        if ordering is None:
+            raise ValueError(f"`after` is not supported with the ordering of `{info.field_name}`.")
+        queryset = queryset.filter(keyset_filter(
+            ordering, _values_after(queryset, ordering, after), nulls_largest=nulls_order_largest(queryset),
+        ))
+    if ordering is not None:
+        # With the primary key as tie-breaker, so every page follows the same order
+        queryset = queryset.order_by(*[
+            f"{'-' if descending else ''}{name}" for name, descending in ordering
+        ])
+    return list(queryset[:first])
+
+
+class StreamWindow:
+    """
+    Hands out successive chunks of one queryset.iterator() across the
+    per-chunk executions of a streamed document.
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or get_stream_chunk_size()
+        self.exhausted = False
+        self._iterator = None
+
+    def next_chunk(self, queryset):
+        if self._iterator is None:
+            self._iterator = queryset.iterator(chunk_size=self.chunk_size)
+        rows = list(islice(self._iterator, self.chunk_size))
+        if len(rows) < self.chunk_size:
+            self.exhausted = True
+        return rows
@@ -0,0 +1,108 @@
+"""
+Automatic persisted queries (APQ).
+
+A client sends only the SHA-256 of its query in the ``persistedQuery``
+request extension. If the server does not know the hash, it answers
+PersistedQueryNotFound and the client retries with the full text. Once
+that text has parsed and validated, it is kept in the cache for
+CRM_PERSISTED_QUERY_TTL seconds, so clients cannot register unbounded
+junk. After that the hash alone is enough, so POST bodies shrink to a few
+bytes and persisted queries can be sent as cacheable GET requests.
+
+PersistedQuery holds the queries added through the admin, which never
+expire. With CRM_PERSISTED_QUERIES_ONLY they become an allowlist: only
+they are run and clients cannot register new ones.
+"""
+
+import hashlib
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .cache import get_cache
+from .models import PersistedQuery
+
+
+NOT_FOUND = ('PersistedQueryNotFound', 'PERSISTED_QUERY_NOT_FOUND')
+HASH_MISMATCH = ('provided sha does not match query', 'INVALID_PERSISTED_QUERY')
+UNSUPPORTED_VERSION = ('Unsupported persisted query version', 'INVALID_PERSISTED_QUERY')
+INVALID_EXTENSION = ('persistedQuery must be an object', 'INVALID_PERSISTED_QUERY')
+NOT_ALLOWED = ('Only persisted queries are allowed', 'PERSISTED_QUERY_NOT_ALLOWED')
+
+
+def persisted_queries_only():
+    return getattr(settings, 'CRM_PERSISTED_QUERIES_ONLY', False)
+
+
+def get_persisted_query_max_age():
+    return getattr(settings, 'CRM_PERSISTED_QUERY_MAX_AGE', 0)
+
+
+def get_persisted_query_ttl():
+    return getattr(settings, 'CRM_PERSISTED_QUERY_TTL', 86400)
+
+
+class PersistedQueryError(Exception):
+    def __init__(self, error):
+        self.message, self.code = error
+        super().__init__(self.message)
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def cache_key(sha256):
+    return f'crm:apq:{sha256}'
+
+
+def get_persisted_query(sha256):
+    """Return the query stored under sha256, or None."""
+    cache = get_cache()
+    query = cache.get(cache_key(sha256))
+    if query is None:
+        try:
+            query = PersistedQuery.objects.values_list('query', flat=True).get(sha256=sha256)
+        except PersistedQuery.DoesNotExist:
+            return None
+        cache.set(cache_key(sha256), query, None)
+    return query
+
+
+def register_query(sha256, query):
+    """Remember query under sha256 for CRM_PERSISTED_QUERY_TTL seconds. Call once it has validated."""
+    get_cache().set(cache_key(sha256), query, get_persisted_query_ttl())
+
+
+@receiver(post_delete, sender=PersistedQuery)
+def forget_persisted_query(sender, instance, **kwargs):
+    get_cache().delete(cache_key(instance.sha256))
+
+
+def resolve_query(query, persisted):
+    """
+    Return (text, sha256) for a request with the given query (may be None)
+    and persistedQuery extension (may be None). text is the query to run;
+    sha256 is set when the client sent a new query along with its hash, to
+    be passed to register_query() once the query validates. Raises
+    PersistedQueryError.
+    """
+    if not persisted:
+        if query and persisted_queries_only() and get_persisted_query(query_hash(query)) is None:
+            raise PersistedQueryError(NOT_ALLOWED)
+        return query, None
+
+    if not isinstance(persisted, dict):
+        raise PersistedQueryError(INVALID_EXTENSION)
+    if persisted.get('version', 1) != 1:
+        raise PersistedQueryError(UNSUPPORTED_VERSION)
+    sha256 = str(persisted.get('sha256Hash') or '').lower()
+    stored = get_persisted_query(sha256)
+    if stored is not None:
+        return stored, None
+    if not query:
+        raise PersistedQueryError(NOT_FOUND)
+    if query_hash(query) != sha256:
+        raise PersistedQueryError(HASH_MISMATCH)
+    if persisted_queries_only():
+        raise PersistedQueryError(NOT_ALLOWED)
+    return query, sha256
@@ -0,0 +1,145 @@
+from django.db.models import Manager, Prefetch, QuerySet
+from graphql import value_from_ast_untyped
+from graphql.language import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from graphene.utils.str_converters import to_snake_case
+from .fields import PAGINATION_ARGS, page_limit
+from .loaders import first_per_parent
+
+
+_model_fields_cache = {}
+
+
+def get_model_fields(model):
+    """Map GraphQL field names (snake_case) to model fields and relations."""
+    if model not in _model_fields_cache:
+        fields = {}
+        for field in model._meta.get_fields():
+            if field.auto_created and not field.concrete:
+                fields[field.get_accessor_name()] = field
+            else:
+                fields[field.name] = field
+        _model_fields_cache[model] = fields
+    return _model_fields_cache[model]
+
+
+def collect_fields(info, nodes):
+    """Merge the sub-selections of nodes by field name, expanding fragments."""
+    fields = {}
+    for node in nodes:
+        selection_set = getattr(node, 'selection_set', None)
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments[selection.name.value]
+                for name, field_nodes in collect_fields(info, [fragment]).items():
+                    fields.setdefault(name, []).extend(field_nodes)
+            elif isinstance(selection, InlineFragmentNode):
+                for name, field_nodes in collect_fields(info, [selection]).items():
+                    fields.setdefault(name, []).extend(field_nodes)
+    return fields
+
+
+def unwrap_connection(info, fields):
+    """Return the node selection when fields select a Relay connection."""
+    if 'edges' not in fields:
+        return fields
+    edges = collect_fields(info, fields['edges'])
+    return collect_fields(info, edges.get('node', []))
+
+
+def has_filter_arguments(nodes):
+    return any(
+        argument.name.value not in PAGINATION_ARGS
+        for node in nodes
+        for argument in node.arguments or ()
+    )
+
+
+def argument_values(info, node):
+    return {
+        argument.name.value: value_from_ast_untyped(argument.value, info.variable_values)
+        for argument in node.arguments or ()
+    }
+
+
+class QueryPlan:
+    """The columns and relations a selection set needs from one model."""
+
+    def __init__(self, model):
+        self.model = model
+        self.only = {model._meta.pk.name}
+        self.select_related = set()
+        self.prefetch_related = []
+        self.related_models = {'': model}
+
+    def add_selection(self, info, fields, prefix=''):
+        model_fields = get_model_fields(self.related_models[prefix])
+        for name, nodes in fields.items():
+            field = model_fields.get(to_snake_case(name))
+            if field is None:
+                continue
+            path = prefix + field.name
+            if (field.many_to_one or field.one_to_one) and field.concrete:
+                related = field.related_model
+                self.only.add(path)
+                self.only.add(f'{path}__{related._meta.pk.name}')
+                self.select_related.add(path)
+                self.related_models[f'{path}__'] = related
+                self.add_selection(info, collect_fields(info, nodes), prefix=f'{path}__')
+            elif field.one_to_many or field.many_to_many:
+                if has_filter_arguments(nodes):
+                    # The resolver builds its own filtered queryset
+                    continue
+                lookup = prefix + (field.get_accessor_name() if not field.concrete else field.name)
+                selection = collect_fields(info, nodes)
+                nested = plan_for_model(field.related_model, info, unwrap_connection(info, selection))
+                if field.one_to_many:
+                    nested.only.add(field.field.name)
+                queryset = nested.apply(field.related_model._default_manager.all())
+                if field.one_to_many:
+                    limit = page_limit(argument_values(info, nodes[0]), selection)
+                    queryset = first_per_parent(queryset, field.field.attname, limit)
+                self.prefetch_related.append(Prefetch(lookup, queryset=queryset))
+            elif field.concrete:
+                self.only.add(path)
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset.only(*sorted(self.only))
+
+
+def plan_for_model(model, info, fields):
+    plan = QueryPlan(model)
+    plan.add_selection(info, fields)
+    return plan
+
+
+def plan_queryset(queryset, info):
+    """
+    Apply select_related, prefetch_related and only() to queryset based on
+    the fields the client selected below the current field.
+
+    Connection selections (edges { node { ... } }) are unwrapped, nested
+    relations that carry filter arguments are left to their own resolvers,
+    and nested reverse foreign key connections given first only prefetch the
+    rows their page needs.
+    """
+    if isinstance(queryset, Manager):
+        queryset = queryset.get_queryset()
+    if not isinstance(queryset, QuerySet) or queryset._result_cache is not None:
+        # Lists from the loaders and querysets filled by prefetch_related()
+        return queryset
+    fields = unwrap_connection(info, collect_fields(info, info.field_nodes))
+    if not fields:
+        return queryset
+    plan = plan_for_model(queryset.model, info, fields)
+    # Related managers set their instance on every row through the foreign
+    # key, which would otherwise be deferred and read with a query per row
+    plan.only.update(field.name for field in queryset._known_related_objects)
+    return plan.apply(queryset)
@@ -0,0 +1,129 @@
+"""
+Order reminder pipeline.
+
+Recent orders that have not been reminded yet are streamed in keyset pages
+ordered by (customer, order date), so each customer's orders arrive
+together and become a single reminder. Reminders are handed to the
+configured sender on a bounded thread pool, and the orders of every
+reminder that was sent are recorded in OrderReminder. A rerun therefore
+skips everything already sent and only pays for the new orders.
+"""
+
+import logging
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from itertools import groupby
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Order, OrderReminder
+from .pagination import iterate_keyset
+
+
+logger = logging.getLogger(__name__)
+
+Reminder = namedtuple('Reminder', ['customer', 'orders'])
+
+# Customer first so a customer's orders are adjacent; served by
+# crm_order_customer_date_idx (customer, -order_date)
+REMINDER_ORDERING = [('customer_id', False), ('order_date', True), ('id', False)]
+
+ReminderResult = namedtuple('ReminderResult', ['reminders', 'orders', 'failed'])
+
+
+class LogFileSender:
+    """Appends each reminder to a log file; a stand-in for a real delivery channel."""
+
+    def __init__(self, path=None):
+        self.path = path or ('C:/temp/order_reminders_log.txt' if os.name == 'nt' else '/tmp/order_reminders_log.txt')
+        self._lock = threading.Lock()
+
+    def send(self, reminder):
+        timestamp = timezone.now().strftime("%Y-%m-%d %H:%M:%S")
+        customer = reminder.customer
+        orders = ', '.join(f"{order.id} ({order.order_date:%Y-%m-%d})" for order in reminder.orders)
+        line = f"{timestamp}: Reminder to {customer.name} ({customer.email}) - Orders: {orders}\n"
+        with self._lock:
+            with open(self.path, 'a') as log:
+                log.write(line)
+
+
+class EmailSender:
+    """Sends each reminder with Django's configured email backend."""
+
+    def send(self, reminder):
+        lines = [f"- Order {order.id} placed {order.order_date:%Y-%m-%d}" for order in reminder.orders]
+        send_mail(
+            subject="Your recent orders",
+            message=f"Hello {reminder.customer.name},\n\n" + "\n".join(lines),
+            from_email=None,
+            recipient_list=[reminder.customer.email],
+        )
+
+
+def get_reminder_sender():
+    return import_string(getattr(settings, 'CRM_REMINDER_SENDER', 'crm.reminders.LogFileSender'))()
+
+
+def pending_orders(since):
+    """Orders placed since `since` that no reminder has covered yet."""
+    reminded = OrderReminder.objects.filter(order=OuterRef('pk'))
+    return (
+        Order.objects.filter(order_date__gte=since)
+        .filter(~Exists(reminded))
+        .select_related('customer')
+        .only('id', 'order_date', 'customer__id', 'customer__name', 'customer__email')
+    )
+
+
+def group_by_customer(orders):
+    for _, customer_orders in groupby(orders, key=lambda order: order.customer_id):
+        customer_orders = list(customer_orders)
+        yield Reminder(customer_orders[0].customer, customer_orders)
+
+
+def send_order_reminders(since=None, sender=None, workers=None, page_size=500):
+    """
+    Send one reminder per customer covering their unreminded orders placed
+    since `since` (default: the last 7 days). Returns a ReminderResult.
+    """
+    since = since or timezone.now() - timedelta(days=7)
+    sender = sender or get_reminder_sender()
+    workers = workers or getattr(settings, 'CRM_REMINDER_WORKERS', 4)
+    result = {'reminders': 0, 'orders': 0, 'failed': 0}
+
+    def record(done):
+        # Sent-state is written here on the calling thread, so the workers
+        # never touch the database
+        sent = []
+        for future in done:
+            reminder = in_flight.pop(future)
+            if future.exception() is not None:
+                logger.warning(
+                    "Sending reminder to %s failed", reminder.customer.email, exc_info=future.exception()
+                )
+                result['failed'] += 1
+                continue
+            sent.extend(reminder.orders)
+            result['reminders'] += 1
+        OrderReminder.objects.bulk_create(
+            [OrderReminder(order=order) for order in sent], ignore_conflicts=True
+        )
+        result['orders'] += len(sent)
+
+    in_flight = {}
+    orders = iterate_keyset(pending_orders(since), REMINDER_ORDERING, page_size)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for reminder in group_by_customer(orders):
+            # Bound the backlog so a slow sender applies back-pressure
+            if len(in_flight) >= workers * 2:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                record(done)
+            in_flight[pool.submit(sender.send, reminder)] = reminder
+        record(wait(in_flight).done)
+    return ReminderResult(**result)
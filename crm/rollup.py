@@ -0,0 +1,196 @@
+"""
+The DailyStats rollup of orders (by order_date) and new customers (by
+created_at).
+
+update_daily_rollup folds the rows created since the high-water mark into
+DailyStats. Rows folded earlier can still change: an order's total is
+recalculated when its items change, and orders and customers are deleted,
+directly or by cascade. The receivers below mark the days of such rows
+dirty; crm.stats reads dirty days from the live tables, and the next
+update recomputes them. Bulk updates send no signals, so code that changes
+order totals or dates with QuerySet.update() must call mark_dirty() itself.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import touch
+from .models import Customer, DailyStats, Order, RollupState
+
+
+ROLLUP_NAME = 'daily_stats'
+
+
+def get_rollup_lag():
+    """
+    Rows created less than this long ago are left for the next run, so
+    transactions still in flight when the high-water mark moves past their
+    created_at are not skipped.
+    """
+    return timedelta(seconds=getattr(settings, 'CRM_ROLLUP_LAG_SECONDS', 300))
+
+
+def get_high_water_mark():
+    return (
+        RollupState.objects.filter(name=ROLLUP_NAME)
+        .values_list('high_water_mark', flat=True).first()
+    )
+
+
+def created_after(queryset, mark):
+    """Rows of queryset not yet folded into the rollup."""
+    if mark is None:
+        return queryset
+    return queryset.filter(created_at__gt=mark)
+
+
+def on_days(orders, customers, days):
+    """The orders and customers of queryset pairs dated on one of days."""
+    return orders.filter(order_date__date__in=days), customers.filter(created_at__date__in=days)
+
+
+def daily_deltas(orders, customers):
+    """
+    Aggregate orders by order_date and customers by created_at into
+    {date: {'order_count', 'revenue', 'new_customers'}}.
+    """
+    deltas = defaultdict(lambda: {'order_count': 0, 'revenue': Decimal('0'), 'new_customers': 0})
+    order_rows = (
+        orders.annotate(day=TruncDate('order_date')).order_by()
+        .values('day').annotate(order_count=Count('pk'), revenue=Sum('total_amount'))
+    )
+    for row in order_rows:
+        deltas[row['day']]['order_count'] += row['order_count']
+        deltas[row['day']]['revenue'] += Decimal(row['revenue'] or 0)
+    customer_rows = (
+        customers.annotate(day=TruncDate('created_at')).order_by()
+        .values('day').annotate(new_customers=Count('pk'))
+    )
+    for row in customer_rows:
+        deltas[row['day']]['new_customers'] += row['new_customers']
+    return deltas
+
+
+def update_daily_rollup(now=None):
+    """
+    Fold orders and customers created since the high-water mark into
+    DailyStats, recompute the dirty days and advance the mark. Each run
+    reads only the new rows and the rows of dirty days, so its cost does
+    not grow with the size of the tables.
+
+    Returns the number of days touched.
+    """
+    upper = (now or timezone.now()) - get_rollup_lag()
+    with transaction.atomic():
+        state, _ = RollupState.objects.select_for_update().get_or_create(name=ROLLUP_NAME)
+        lower = state.high_water_mark
+        if lower is not None and lower >= upper:
+            upper = lower
+
+        orders = Order.objects.filter(created_at__lte=upper)
+        customers = Customer.objects.filter(created_at__lte=upper)
+        deltas = daily_deltas(created_after(orders, lower), created_after(customers, lower))
+        existing = {
+            stats.date: stats
+            for stats in DailyStats.objects.select_for_update().filter(Q(date__in=list(deltas)) | Q(dirty=True))
+        }
+        dirty = [day for day, stats in existing.items() if stats.dirty]
+        if dirty:
+            # Every row of a dirty day up to the new mark, replacing its totals
+            recomputed = daily_deltas(*on_days(orders, customers, dirty))
+            for day in dirty:
+                stats = existing[day]
+                stats.order_count = stats.revenue = stats.new_customers = 0
+                stats.dirty = False
+                deltas[day] = recomputed[day]
+
+        created = []
+        for day, delta in deltas.items():
+            stats = existing.get(day)
+            if stats is None:
+                created.append(DailyStats(date=day, **delta))
+                continue
+            stats.order_count += delta['order_count']
+            stats.revenue += delta['revenue']
+            stats.new_customers += delta['new_customers']
+            stats.updated_at = timezone.now()
+        DailyStats.objects.bulk_create(created)
+        DailyStats.objects.bulk_update(
+            existing.values(), ['order_count', 'revenue', 'new_customers', 'dirty', 'updated_at']
+        )
+        touch(DailyStats)
+
+        state.high_water_mark = upper
+        state.save(update_fields=['high_water_mark', 'updated_at'])
+    return len(deltas)
+
+
+def rebuild_daily_rollup(now=None):
+    """
+    Recompute DailyStats from scratch, e.g. after bulk changes that did not
+    call mark_dirty().
+    """
+    with transaction.atomic():
+        DailyStats.objects.all().delete()
+        RollupState.objects.filter(name=ROLLUP_NAME).update(high_water_mark=None)
+        return update_daily_rollup(now)
+
+
+def mark_dirty(days):
+    """Have crm.stats read days live, and the next update recompute them."""
+    days = {day for day in days if day is not None}
+    if days:
+        DailyStats.objects.filter(date__in=days, dirty=False).update(dirty=True)
+
+
+def local_date(value):
+    """The day TruncDate puts value in."""
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def rolled_up(instance):
+    """Whether instance may already be counted in DailyStats."""
+    created_at = instance.created_at
+    return created_at is not None and created_at <= timezone.now() - get_rollup_lag()
+
+
+@receiver(pre_save, sender=Order, dispatch_uid='crm_rollup_order_moved')
+def _order_moved(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or not rolled_up(instance):
+        return
+    if update_fields is not None and 'order_date' not in update_fields:
+        return
+    old = Order.objects.filter(pk=instance.pk).values_list('order_date', flat=True).first()
+    if old is not None and old != instance.order_date:
+        mark_dirty([local_date(old)])
+
+
+@receiver(post_save, sender=Order, dispatch_uid='crm_rollup_order_saved')
+def _order_saved(sender, instance, created, **kwargs):
+    # New orders are picked up through the high-water mark
+    if not created and rolled_up(instance):
+        mark_dirty([local_date(instance.order_date)])
+
+
+@receiver(post_delete, sender=Order, dispatch_uid='crm_rollup_order_deleted')
+@receiver(post_delete, sender=Customer, dispatch_uid='crm_rollup_customer_deleted')
+def _deleted(sender, instance, origin=None, **kwargs):
+    if not rolled_up(instance):
+        return
+    day = local_date(instance.order_date if sender is Order else instance.created_at)
+    # One delete() cascading to many rows marks each day once
+    marked = getattr(origin, '_crm_rollup_marked', None)
+    if marked is None:
+        marked = set()
+        if origin is not None:
+            origin._crm_rollup_marked = marked
+    if day not in marked:
+        marked.add(day)
+        mark_dirty([day])
@@ -1,45 +1,154 @@
+import re
 import graphene
-from graphene_django import DjangoObjectType
-from graphene_django.filter import DjangoFilterConnectionField
+from graphene_django import DjangoObjectType, bypass_get_queryset
+from graphene_django.debug import DjangoDebug
 from django_filters import FilterSet, OrderingFilter
 from django.db.models import Q
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
+from django.utils import timezone
 from .models import Customer, Product, Order, OrderItem
-from .filters import CustomerFilter, ProductFilter, OrderFilter
+from .filters import CustomerFilter, ProductFilter, OrderFilter, filter_queryset, graphene_filterset
+from .fields import (
+    BatchedConnectionField,
+    BatchedFilterConnectionField,
+    CountableConnection,
+    FilterListField,
+    KeysetConnectionField,
+    filter_args,
+    page_limit,
+)
+from .cache import touch
+from .inventory import reserve_stock, restock_low_stock
+from .loaders import get_loaders, prefetched
+from .pagination import paginate_list
+from .planner import collect_fields, plan_queryset
+from .stats import crm_stats
+
+
+PHONE_PATTERN = re.compile(r'^(\+?1?\d{9,15}|(\d{3}-){2}\d{4})$')
+
+# Rows inserted (and, in partial mode, rolled back) together by BulkCreateCustomers
+BULK_CREATE_CHUNK_SIZE = 1000
 
 
 # GraphQL Types
 class CustomerType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(
+        lambda: OrderType,
+        required=True,
+        description="Orders placed by this customer"
+    )
+    
     class Meta:
         model = Customer
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
         filterset_class = CustomerFilter
+    
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return plan_queryset(queryset, info)
+    
+    def resolve_orders(self, info, **kwargs):
+        limit = page_limit(kwargs, collect_fields(info, info.field_nodes))
+        filters = filter_args(kwargs)
+        if filters:
+            # Filtered in one query for every customer on the page
+            loader = get_loaders(info).subset(
+                'orders_by_customer', limit, graphene_filterset(OrderFilter), filters,
+            )
+            return loader.load(self.pk)
+        orders = prefetched(self, 'orders')
+        if orders is not None:
+            return orders
+        if limit is not None:
+            return get_loaders(info).subset('orders_by_customer', limit).load(self.pk)
+        return get_loaders(info).orders_by_customer.load(self.pk)
 
 
 class ProductType(DjangoObjectType):
+    orders = BatchedFilterConnectionField(
+        lambda: OrderType,
+        required=True,
+        description="Orders that contain this product"
+    )
+    
     class Meta:
         model = Product
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
         filterset_class = ProductFilter
+    
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return plan_queryset(queryset, info)
 
 
 class OrderItemType(DjangoObjectType):
     class Meta:
         model = OrderItem
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
+    
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return plan_queryset(queryset, info)
+    
+    @bypass_get_queryset
+    def resolve_order(self, info):
+        if OrderItem.order.is_cached(self):
+            return self.order
+        return get_loaders(info).order.load(self.order_id)
+    
+    @bypass_get_queryset
+    def resolve_product(self, info):
+        if OrderItem.product.is_cached(self):
+            return self.product
+        return get_loaders(info).product.load(self.product_id)
 
 
 class OrderType(DjangoObjectType):
+    products = BatchedFilterConnectionField(
+        ProductType,
+        required=True,
+        description="Products in this order"
+    )
+    items = BatchedConnectionField(
+        OrderItemType,
+        required=True,
+        description="Line items of this order"
+    )
+    
     class Meta:
         model = Order
         interfaces = (graphene.relay.Node,)
+        connection_class = CountableConnection
         fields = '__all__'
         filterset_class = OrderFilter
+    
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return plan_queryset(queryset, info)
+    
+    @bypass_get_queryset
+    def resolve_customer(self, info):
+        if Order.customer.is_cached(self):
+            return self.customer
+        return get_loaders(info).customer.load(self.customer_id)
+    
+    def resolve_items(self, info, **kwargs):
+        items = prefetched(self, 'items')
+        if items is not None:
+            return items
+        limit = page_limit(kwargs, collect_fields(info, info.field_nodes))
+        if limit is not None:
+            return get_loaders(info).subset('items_by_order', limit).load(self.pk)
+        return get_loaders(info).items_by_order.load(self.pk)
 
 
 # Input Types for Filtering
@@ -78,6 +187,27 @@ class OrderFilterInput(graphene.InputObjectType):
     order_by = graphene.String()
 
 
+# Filter input fields whose FilterSet filter is named differently
+FILTER_INPUT_ALIASES = {
+    'name_icontains': 'name__icontains',
+    'email_icontains': 'email__icontains',
+    # filteredCustomers(filter: {phone}) is a substring match, allCustomers(phone:) an exact one
+    'phone': 'phone__icontains',
+    'phone_icontains': 'phone__icontains',
+}
+
+
+def apply_filter_input(queryset, filterset_class, filter):
+    """Filter and order queryset by a *FilterInput through filterset_class."""
+    if not filter:
+        return queryset
+    values = {FILTER_INPUT_ALIASES.get(name, name): value for name, value in filter.items()}
+    queryset = filter_queryset(queryset, graphene_filterset(filterset_class), values)
+    if filter.order_by:
+        queryset = queryset.order_by(filter.order_by)
+    return queryset
+
+
 # Input Types for Mutations
 class CreateCustomerInput(graphene.InputObjectType):
     name = graphene.String(required=True)
@@ -97,9 +227,15 @@ class CreateProductInput(graphene.InputObjectType):
     stock = graphene.Int()
 
 
+class OrderLineInput(graphene.InputObjectType):
+    product_id = graphene.ID(required=True)
+    quantity = graphene.Int(default_value=1)
+
+
 class CreateOrderInput(graphene.InputObjectType):
     customer_id = graphene.ID(required=True)
-    product_ids = graphene.List(graphene.ID, required=True)
+    product_ids = graphene.List(graphene.ID, description="Products ordered once each")
+    items = graphene.List(graphene.NonNull(OrderLineInput), description="Products with quantities")
     order_date = graphene.DateTime()
 
 
@@ -122,10 +258,18 @@ class CreateProductPayload(graphene.ObjectType):
     message = graphene.String()
 
 
+class OrderLineError(graphene.ObjectType):
+    product_id = graphene.ID()
+    requested = graphene.Int()
+    available = graphene.Int()
+    message = graphene.String()
+
+
 class CreateOrderPayload(graphene.ObjectType):
     order = graphene.Field(OrderType)
     success = graphene.Boolean()
     message = graphene.String()
+    line_errors = graphene.List(graphene.NonNull(OrderLineError))
 
 
 class UpdateLowStockProductsPayload(graphene.ObjectType):
@@ -134,6 +278,55 @@ class UpdateLowStockProductsPayload(graphene.ObjectType):
     message = graphene.String()
 
 
+# Report Types
+class StatsGroupBy(graphene.Enum):
+    DAY = 'day'
+    WEEK = 'week'
+    CUSTOMER = 'customer'
+    PRODUCT = 'product'
+
+
+class CRMStatsGroupType(graphene.ObjectType):
+    key = graphene.String(required=True)
+    label = graphene.String()
+    orders = graphene.Int()
+    revenue = graphene.Decimal()
+    units = graphene.Int(description="Units sold (product groups only)")
+    new_customers = graphene.Int(description="Customers created in the period (day and week groups only)")
+
+
+class CRMStatsType(graphene.ObjectType):
+    start = graphene.DateTime()
+    end = graphene.DateTime()
+    total_customers = graphene.Int()
+    total_orders = graphene.Int()
+    total_revenue = graphene.Decimal()
+    groups = graphene.List(graphene.NonNull(CRMStatsGroupType))
+
+
+def create_customer_chunk(chunk):
+    """
+    Insert one chunk under its own savepoint. If a concurrent insert took
+    some of its emails, drop those rows and retry the rest once.
+    """
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create(chunk), []
+    except IntegrityError:
+        pass
+    taken = set(
+        Customer.objects.filter(email__in=[customer.email for customer in chunk])
+        .order_by().values_list('email', flat=True)
+    )
+    errors = [f"Email {customer.email} already exists" for customer in chunk if customer.email in taken]
+    chunk = [customer for customer in chunk if customer.email not in taken]
+    try:
+        with transaction.atomic():
+            return Customer.objects.bulk_create(chunk), errors
+    except IntegrityError as e:
+        return [], errors + [f"Error creating {customer.email}: {str(e)}" for customer in chunk]
+
+
 # Mutations
 class CreateCustomer(graphene.Mutation):
     class Arguments:
@@ -153,9 +346,7 @@ class CreateCustomer(graphene.Mutation):
             
             # Validate phone format if provided
             if input.phone:
-                import re
-                phone_pattern = r'^(\+?1?\d{9,15}|(\d{3}-){2}\d{4})$'
-                if not re.match(phone_pattern, input.phone):
+                if not PHONE_PATTERN.match(input.phone):
                     return CreateCustomerPayload(
                         customer=None,
                         message="Invalid phone format. Use +1234567890 or 123-456-7890",
@@ -185,38 +376,61 @@ class CreateCustomer(graphene.Mutation):
 class BulkCreateCustomers(graphene.Mutation):
     class Arguments:
         input = graphene.List(BulkCreateCustomerInput, required=True)
+        partial = graphene.Boolean(
+            default_value=True,
+            description="Create the valid rows even if others fail; otherwise create none"
+        )
     
     Output = BulkCreateCustomersPayload
     
-    def mutate(self, info, input):
+    def mutate(self, info, input, partial=True):
         customers = []
         errors = []
         
-        with transaction.atomic():
-            for customer_data in input:
-                try:
-                    # Validate email uniqueness
-                    if Customer.objects.filter(email=customer_data.email).exists():
-                        errors.append(f"Email {customer_data.email} already exists")
-                        continue
-                    
-                    # Validate phone format if provided
-                    if customer_data.phone:
-                        import re
-                        phone_pattern = r'^(\+?1?\d{9,15}|(\d{3}-){2}\d{4})$'
-                        if not re.match(phone_pattern, customer_data.phone):
-                            errors.append(f"Invalid phone format for {customer_data.email}")
-                            continue
-                    
-                    customer = Customer.objects.create(
-                        name=customer_data.name,
-                        email=customer_data.email,
-                        phone=customer_data.phone or None
-                    )
-                    customers.append(customer)
-                    
-                except Exception as e:
-                    errors.append(f"Error creating {customer_data.email}: {str(e)}")
+        # Validate the whole batch in memory
+        rows = [customer_data for customer_data in input if customer_data is not None]
+        existing = set(
+            Customer.objects.filter(email__in={row.email for row in rows})
+            .order_by().values_list('email', flat=True)
+        )
+        seen = set()
+        pending = []
+        for customer_data in rows:
+            if customer_data.email in existing:
+                errors.append(f"Email {customer_data.email} already exists")
+                continue
+            if customer_data.email in seen:
+                errors.append(f"Email {customer_data.email} is duplicated in this batch")
+                continue
+            if customer_data.phone and not PHONE_PATTERN.match(customer_data.phone):
+                errors.append(f"Invalid phone format for {customer_data.email}")
+                continue
+            seen.add(customer_data.email)
+            pending.append(Customer(
+                name=customer_data.name,
+                email=customer_data.email,
+                phone=customer_data.phone or None
+            ))
+        
+        if errors and not partial:
+            return BulkCreateCustomersPayload(customers=[], errors=errors, success=False)
+        
+        try:
+            with transaction.atomic():
+                for start in range(0, len(pending), BULK_CREATE_CHUNK_SIZE):
+                    chunk = pending[start:start + BULK_CREATE_CHUNK_SIZE]
+                    if partial:
+                        chunk, chunk_errors = create_customer_chunk(chunk)
+                        errors.extend(chunk_errors)
+                    else:
+                        Customer.objects.bulk_create(chunk)
+                    customers.extend(chunk)
+                # bulk_create sends no post_save for the response cache
+                touch(Customer)
+        except IntegrityError as e:
+            # Only reachable when not partial: a concurrent insert took an email
+            customers = []
+            errors.append(f"Error creating customers: {str(e)}")
         
         return BulkCreateCustomersPayload(
             customers=customers,
@@ -288,46 +502,95 @@ class CreateOrder(graphene.Mutation):
                     success=False
                 )
             
+            lines = [(product_id, 1) for product_id in input.product_ids or []]
+            lines += [(line.product_id, line.quantity) for line in input.items or []]
+            
             # Validate at least one product
-            if not input.product_ids:
+            if not lines:
                 return CreateOrderPayload(
                     order=None,
                     message="At least one product must be selected",
                     success=False
                 )
             
-            # Validate products exist
-            products = []
-            for product_id in input.product_ids:
+            # Repeated products are merged into a single line
+            quantities = {}
+            requested = {}
+            line_errors = []
+            for product_id, quantity in lines:
                 try:
-                    product = Product.objects.get(id=product_id)
-                    products.append(product)
-                except Product.DoesNotExist:
-                    return CreateOrderPayload(
-                        order=None,
-                        message=f"Invalid product ID: {product_id}",
-                        success=False
-                    )
+                    pk = Product._meta.pk.to_python(product_id)
+                except ValidationError:
+                    pk = None
+                requested.setdefault(pk, product_id)
+                if quantity is None or quantity < 1:
+                    line_errors.append(OrderLineError(
+                        product_id=product_id,
+                        requested=quantity,
+                        message=f"Quantity for product {product_id} must be at least 1"
+                    ))
+                    continue
+                quantities[pk] = quantities.get(pk, 0) + quantity
             
-            # Create order
-            order = Order.objects.create(
-                customer=customer,
-                order_date=input.order_date or None
+            # Validate products exist with a single query
+            products = Product.objects.only('id', 'name', 'price').in_bulk(
+                [pk for pk in requested if pk]
             )
+            for pk, product_id in requested.items():
+                if pk not in products:
+                    line_errors.append(OrderLineError(
+                        product_id=product_id,
+                        requested=quantities.get(pk),
+                        message=f"Invalid product ID: {product_id}"
+                    ))
             
-            # Add products to order
-            total_amount = 0
-            for product in products:
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    unit_price=product.price
+            if line_errors:
+                return CreateOrderPayload(
+                    order=None,
+                    message=line_errors[0].message,
+                    line_errors=line_errors,
+                    success=False
                 )
-                total_amount += product.price
             
-            # Update order total
-            order.total_amount = total_amount
-            order.save()
+            items = [
+                OrderItem(product=products[pk], quantity=quantity, unit_price=products[pk].price)
+                for pk, quantity in quantities.items()
+            ]
+            
+            with transaction.atomic():
+                # Take the stock before writing anything, so a short line
+                # leaves nothing to roll back
+                shortages = reserve_stock(quantities)
+                if shortages:
+                    return CreateOrderPayload(
+                        order=None,
+                        message="Insufficient stock",
+                        line_errors=[
+                            OrderLineError(
+                                product_id=requested[shortage.product_id],
+                                requested=shortage.requested,
+                                available=shortage.available,
+                                message=(
+                                    f"Insufficient stock for {products[shortage.product_id].name}: "
+                                    f"requested {shortage.requested}, available {shortage.available}"
+                                )
+                            )
+                            for shortage in shortages
+                        ],
+                        success=False
+                    )
+                
+                # The total is known up front, so the order is written once
+                order = Order.objects.create(
+                    customer=customer,
+                    order_date=input.order_date or timezone.now(),
+                    total_amount=sum(item.subtotal for item in items)
+                )
+                # bulk_create skips OrderItem.save() and its calculate_total()
+                for item in items:
+                    item.order = order
+                OrderItem.objects.bulk_create(items)
+                touch(OrderItem)
             
             return CreateOrderPayload(
                 order=order,
@@ -344,27 +607,30 @@ class CreateOrder(graphene.Mutation):
 
 
 class UpdateLowStockProducts(graphene.Mutation):
+    class Arguments:
+        threshold = graphene.Int(default_value=10, description="Restock products with less stock than this")
+        increment = graphene.Int(default_value=10, description="Units added to each restocked product")
+    
     Output = UpdateLowStockProductsPayload
     
-    def mutate(self, info):
+    def mutate(self, info, threshold=10, increment=10):
+        if threshold < 1 or increment < 1:
+            return UpdateLowStockProductsPayload(
+                updated_products=[],
+                success=False,
+                message="Threshold and increment must be positive"
+            )
+        
         try:
-            # Query products with stock < 10
-            low_stock_products = Product.objects.filter(stock__lt=10)
+            updated_products = restock_low_stock(threshold, increment)
             
-            if not low_stock_products.exists():
+            if not updated_products:
                 return UpdateLowStockProductsPayload(
                     updated_products=[],
                     success=True,
                     message="No low stock products found"
                 )
             
-            # Increment stock by 10 for each low stock product
-            updated_products = []
-            for product in low_stock_products:
-                product.stock += 10
-                product.save()
-                updated_products.append(product)
-            
             return UpdateLowStockProductsPayload(
                 updated_products=updated_products,
                 success=True,
@@ -382,133 +648,95 @@ class UpdateLowStockProducts(graphene.Mutation):
 # Query Class
 class Query(graphene.ObjectType):
     # Basic queries
-    customers = graphene.List(CustomerType)
-    products = graphene.List(ProductType)
-    orders = graphene.List(OrderType)
+    customers = FilterListField(CustomerType)
+    products = FilterListField(ProductType)
+    orders = FilterListField(OrderType)
     customer = graphene.Field(CustomerType, id=graphene.ID(required=True))
     product = graphene.Field(ProductType, id=graphene.ID(required=True))
     order = graphene.Field(OrderType, id=graphene.ID(required=True))
     
     # Filtered queries with Relay connections
-    all_customers = DjangoFilterConnectionField(CustomerType)
-    all_products = DjangoFilterConnectionField(ProductType)
-    all_orders = DjangoFilterConnectionField(OrderType)
+    all_customers = KeysetConnectionField(CustomerType)
+    all_products = KeysetConnectionField(ProductType)
+    all_orders = KeysetConnectionField(OrderType)
     
     # Custom filtered queries
     filtered_customers = graphene.List(
         CustomerType,
-        filter=graphene.Argument(CustomerFilterInput)
+        filter=graphene.Argument(CustomerFilterInput),
+        first=graphene.Int(),
+        after=graphene.ID()
     )
     
     filtered_products = graphene.List(
         ProductType,
-        filter=graphene.Argument(ProductFilterInput)
+        filter=graphene.Argument(ProductFilterInput),
+        first=graphene.Int(),
+        after=graphene.ID()
     )
     
     filtered_orders = graphene.List(
         OrderType,
-        filter=graphene.Argument(OrderFilterInput)
+        filter=graphene.Argument(OrderFilterInput),
+        first=graphene.Int(),
+        after=graphene.ID()
     )
     
-    def resolve_customers(self, info):
-        return Customer.objects.all()
+    # Aggregated report
+    crm_stats = graphene.Field(
+        CRMStatsType,
+        start=graphene.DateTime(description="Only count orders and customers from this time on"),
+        end=graphene.DateTime(description="Only count orders and customers before this time"),
+        group_by=StatsGroupBy()
+    )
+    
+    # SQL and exceptions of the operation; null unless it is traced (see crm.tracing)
+    debug = graphene.Field(DjangoDebug, name='_debug')
+    
+    def resolve_customers(self, info, first=None, after=None, **filters):
+        queryset = filter_queryset(plan_queryset(Customer.objects.all(), info), graphene_filterset(CustomerFilter), filters)
+        return get_loaders(info).prime(paginate_list(info, queryset, first, after))
     
-    def resolve_products(self, info):
-        return Product.objects.all()
+    def resolve_products(self, info, first=None, after=None, **filters):
+        queryset = filter_queryset(plan_queryset(Product.objects.all(), info), graphene_filterset(ProductFilter), filters)
+        return paginate_list(info, queryset, first, after)
     
-    def resolve_orders(self, info):
-        return Order.objects.all()
+    def resolve_orders(self, info, first=None, after=None, **filters):
+        queryset = filter_queryset(plan_queryset(Order.objects.all(), info), graphene_filterset(OrderFilter), filters)
+        return get_loaders(info).prime(paginate_list(info, queryset, first, after))
     
     def resolve_customer(self, info, id):
         try:
-            return Customer.objects.get(id=id)
+            return plan_queryset(Customer.objects.all(), info).get(id=id)
         except Customer.DoesNotExist:
             return None
     
     def resolve_product(self, info, id):
         try:
-            return Product.objects.get(id=id)
+            return plan_queryset(Product.objects.all(), info).get(id=id)
         except Product.DoesNotExist:
             return None
     
     def resolve_order(self, info, id):
         try:
-            return Order.objects.get(id=id)
+            return plan_queryset(Order.objects.all(), info).get(id=id)
         except Order.DoesNotExist:
             return None
     
-    def resolve_filtered_customers(self, info, filter=None):
-        queryset = Customer.objects.all()
-        
-        if filter:
-            if filter.name:
-                queryset = queryset.filter(name__icontains=filter.name)
-            if filter.name_icontains:
-                queryset = queryset.filter(name__icontains=filter.name_icontains)
-            if filter.email:
-                queryset = queryset.filter(email__icontains=filter.email)
-            if filter.email_icontains:
-                queryset = queryset.filter(email__icontains=filter.email_icontains)
-            if filter.phone:
-                queryset = queryset.filter(phone__icontains=filter.phone)
-            if filter.phone_icontains:
-                queryset = queryset.filter(phone__icontains=filter.phone_icontains)
-            if filter.phone_pattern:
-                queryset = queryset.filter(phone__startswith=filter.phone_pattern)
-            if filter.created_at_gte:
-                queryset = queryset.filter(created_at__gte=filter.created_at_gte)
-            if filter.created_at_lte:
-                queryset = queryset.filter(created_at__lte=filter.created_at_lte)
-            if filter.order_by:
-                queryset = queryset.order_by(filter.order_by)
-        
-        return queryset
+    def resolve_filtered_customers(self, info, filter=None, first=None, after=None):
+        queryset = apply_filter_input(plan_queryset(Customer.objects.all(), info), CustomerFilter, filter)
+        return get_loaders(info).prime(paginate_list(info, queryset, first, after))
     
-    def resolve_filtered_products(self, info, filter=None):
-        queryset = Product.objects.all()
-        
-        if filter:
-            if filter.name:
-                queryset = queryset.filter(name__icontains=filter.name)
-            if filter.name_icontains:
-                queryset = queryset.filter(name__icontains=filter.name_icontains)
-            if filter.price_gte:
-                queryset = queryset.filter(price__gte=filter.price_gte)
-            if filter.price_lte:
-                queryset = queryset.filter(price__lte=filter.price_lte)
-            if filter.stock_gte:
-                queryset = queryset.filter(stock__gte=filter.stock_gte)
-            if filter.stock_lte:
-                queryset = queryset.filter(stock__lte=filter.stock_lte)
-            if filter.low_stock:
-                queryset = queryset.filter(stock__lt=10)
-            if filter.order_by:
-                queryset = queryset.order_by(filter.order_by)
-        
-        return queryset
+    def resolve_filtered_products(self, info, filter=None, first=None, after=None):
+        queryset = apply_filter_input(plan_queryset(Product.objects.all(), info), ProductFilter, filter)
+        return paginate_list(info, queryset, first, after)
     
-    def resolve_filtered_orders(self, info, filter=None):
-        queryset = Order.objects.all()
-        
-        if filter:
-            if filter.total_amount_gte:
-                queryset = queryset.filter(total_amount__gte=filter.total_amount_gte)
-            if filter.total_amount_lte:
-                queryset = queryset.filter(total_amount__lte=filter.total_amount_lte)
-            if filter.order_date_gte:
-                queryset = queryset.filter(order_date__gte=filter.order_date_gte)
-            if filter.order_date_lte:
-                queryset = queryset.filter(order_date__lte=filter.order_date_lte)
-            if filter.customer_name:
-                queryset = queryset.filter(customer__name__icontains=filter.customer_name)
-            if filter.product_name:
-                queryset = queryset.filter(items__product__name__icontains=filter.product_name).distinct()
-            if filter.product_id:
-                queryset = queryset.filter(items__product__id=filter.product_id).distinct()
-            if filter.order_by:
-                queryset = queryset.order_by(filter.order_by)
-        
-        return queryset
+    def resolve_filtered_orders(self, info, filter=None, first=None, after=None):
+        queryset = apply_filter_input(plan_queryset(Order.objects.all(), info), OrderFilter, filter)
+        return get_loaders(info).prime(paginate_list(info, queryset, first, after))
+    
+    def resolve_crm_stats(self, info, start=None, end=None, group_by=None):
+        return crm_stats(start, end, group_by.value if group_by else None)
 
 
 # Mutation Class
@@ -0,0 +1,136 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+from .models import Customer, Product
+
+
+# Text fields that have a search index (pg_trgm GIN index on PostgreSQL,
+# FTS5 trigram shadow table on SQLite); see migrations 0003_search_indexes
+# and 0008_search_rowids.
+SEARCH_FIELDS = {
+    Customer: ('name', 'email', 'phone'),
+    Product: ('name',),
+}
+
+# Trigram indexes cannot match shorter terms
+MIN_INDEXED_TERM_LENGTH = 3
+
+RANK_ANNOTATION = 'search_rank'
+
+
+def split_field_path(model, field_path):
+    """Split 'items__product__name' into ('items__product', Product, 'name')."""
+    *relations, field_name = field_path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return '__'.join(relations), model, field_name
+
+
+class IContainsSearchBackend:
+    """Plain LIKE '%term%' matching; used where no search index exists."""
+
+    def is_indexed(self, model, field_name, term):
+        return False
+
+    def matching(self, model, field_name, term):
+        """Return a Q object selecting rows of model whose field contains term."""
+        return Q(**{f'{field_name}__icontains': term})
+
+    def rank(self, queryset, field_name, term):
+        return queryset
+
+    def search(self, queryset, field_path, term, rank=False):
+        """
+        Restrict queryset to rows whose field_path contains term and, when
+        rank is True, order them by relevance.
+        """
+        prefix, model, field_name = split_field_path(queryset.model, field_path)
+        if not self.is_indexed(model, field_name, term):
+            return queryset.filter(**{f'{field_path}__icontains': term})
+        if prefix:
+            matches = model._default_manager.filter(self.matching(model, field_name, term))
+            return queryset.filter(**{f'{prefix}__in': matches.values('pk')})
+        queryset = queryset.filter(self.matching(model, field_name, term))
+        if rank:
+            queryset = self.rank(queryset, field_name, term)
+        return queryset
+
+
+class TrigramSearchBackend(IContainsSearchBackend):
+    """
+    PostgreSQL backend. icontains compiles to UPPER(field) LIKE UPPER(...),
+    which the pg_trgm GIN indexes on UPPER(field) serve directly; relevance
+    is the trigram similarity to the term.
+    """
+
+    def is_indexed(self, model, field_name, term):
+        return field_name in SEARCH_FIELDS.get(model, ()) and len(term) >= MIN_INDEXED_TERM_LENGTH
+
+    def rank(self, queryset, field_name, term):
+        from django.contrib.postgres.search import TrigramSimilarity
+
+        return queryset.annotate(
+            **{RANK_ANNOTATION: TrigramSimilarity(field_name, term)}
+        ).order_by(F(RANK_ANNOTATION).desc(), 'pk')
+
+
+class FTS5SearchBackend(IContainsSearchBackend):
+    """
+    SQLite backend. Each searchable model has an external-content FTS5 table
+    ``<db_table>_search`` using the trigram tokenizer, so a phrase MATCH has
+    the same substring semantics as icontains; relevance is bm25(). Its
+    rowids are those of ``<db_table>_search_ids``, which maps them to the
+    primary key (the implicit rowid of a table with a UUID key is not stable).
+    """
+
+    def is_indexed(self, model, field_name, term):
+        return field_name in SEARCH_FIELDS.get(model, ()) and len(term) >= MIN_INDEXED_TERM_LENGTH
+
+    @staticmethod
+    def phrase(term):
+        return '"' + term.replace('"', '""') + '"'
+
+    def matching(self, model, field_name, term):
+        table = model._meta.db_table
+        pk_column = model._meta.pk.column
+        return Q(pk__in=RawSQL(
+            f'SELECT "{pk_column}" FROM "{table}_search_ids" WHERE rowid IN '
+            f'(SELECT rowid FROM "{table}_search" WHERE "{table}_search"."{field_name}" MATCH %s)',
+            [self.phrase(term)],
+        ))
+
+    def rank(self, queryset, field_name, term):
+        table = queryset.model._meta.db_table
+        pk_column = queryset.model._meta.pk.column
+        rank = RawSQL(
+            f'SELECT bm25("{table}_search") FROM "{table}_search" '
+            f'JOIN "{table}_search_ids" ON "{table}_search_ids".rowid = "{table}_search".rowid '
+            f'WHERE "{table}_search_ids"."{pk_column}" = "{table}"."{pk_column}" '
+            f'AND "{table}_search"."{field_name}" MATCH %s',
+            [self.phrase(term)],
+        )
+        # bm25() is lower for better matches
+        return queryset.annotate(**{RANK_ANNOTATION: rank}).order_by(RANK_ANNOTATION, 'pk')
+
+
+BACKENDS = {
+    'postgresql': TrigramSearchBackend,
+    'sqlite': FTS5SearchBackend,
+}
+
+
+def get_search_backend():
+    """
+    Return the backend named by the CRM_SEARCH_BACKEND setting (a dotted
+    path), or the one matching the database vendor when it is 'auto'.
+    """
+    path = getattr(settings, 'CRM_SEARCH_BACKEND', 'auto')
+    if path != 'auto':
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, IContainsSearchBackend)()
+
+
+def search(queryset, field_path, term, rank=False):
+    return get_search_backend().search(queryset, field_path, term, rank=rank)
@@ -28,4 +28,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'update-crm-rollup': {
+        'task': 'crm.tasks.update_crm_rollup',
+        'schedule': crontab(minute=15),
+    },
 } 
\ No newline at end of file
@@ -0,0 +1,185 @@
+from datetime import time, timedelta
+from decimal import Decimal
+from django.db.models import Count, DecimalField, F, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import Customer, DailyStats, Order, OrderItem
+from .rollup import created_after, daily_deltas, get_high_water_mark, on_days
+
+
+GROUP_BY_CHOICES = ('day', 'week', 'customer', 'product')
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+CENTS = Decimal('0.01')
+
+
+def _revenue(expression):
+    return Coalesce(Sum(expression, output_field=MONEY), Value(Decimal('0.00')), output_field=MONEY)
+
+
+def _money(value):
+    # SQLite hands back aggregates of decimals unscaled
+    return Decimal(value).quantize(CENTS)
+
+
+def _in_range(queryset, field, start=None, end=None):
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+
+def _day_bounds(start, end):
+    """
+    Return the first and last-plus-one dates of [start, end) when both fall
+    on midnight (or are open), or None when the range splits a day.
+    """
+    bounds = []
+    for value in (start, end):
+        if value is None:
+            bounds.append(None)
+            continue
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        if value.time() != time(0):
+            return None
+        bounds.append(value.date())
+    return bounds
+
+
+def _rolled_up_days(orders, customers, first_day, end_day):
+    """
+    Per-day totals read from DailyStats, plus the rows created since its
+    high-water mark and every row of its dirty days aggregated live.
+    """
+    mark = get_high_water_mark()
+    if mark is None:
+        return daily_deltas(orders, customers)
+    rows = DailyStats.objects.all()
+    if first_day is not None:
+        rows = rows.filter(date__gte=first_day)
+    if end_day is not None:
+        rows = rows.filter(date__lt=end_day)
+    rows = list(rows.values('date', 'order_count', 'revenue', 'new_customers', 'dirty'))
+    dirty = [row['date'] for row in rows if row['dirty']]
+    days = daily_deltas(created_after(orders, mark), created_after(customers, mark))
+    if dirty:
+        # The rolled-up rows of dirty days, which their DailyStats rows no longer match
+        folded = on_days(orders.filter(created_at__lte=mark), customers.filter(created_at__lte=mark), dirty)
+        for day, values in daily_deltas(*folded).items():
+            for name, value in values.items():
+                days[day][name] += value
+    for row in rows:
+        if row['dirty']:
+            continue
+        day = days[row['date']]
+        day['order_count'] += row['order_count']
+        day['revenue'] += row['revenue']
+        day['new_customers'] += row['new_customers']
+    return days
+
+
+def _period_groups(days, weekly=False):
+    """Orders, revenue and new customers per day or week, oldest first."""
+    periods = {}
+    for day, values in days.items():
+        period = day - timedelta(days=day.weekday()) if weekly else day
+        group = periods.setdefault(period, {'orders': 0, 'revenue': Decimal('0'), 'new_customers': 0})
+        group['orders'] += values['order_count']
+        group['revenue'] += values['revenue']
+        group['new_customers'] += values['new_customers']
+    return [
+        {'key': period.isoformat(), 'label': period.isoformat(), **values, 'revenue': _money(values['revenue'])}
+        for period, values in sorted(periods.items())
+    ]
+
+
+def _customer_groups(orders):
+    """Orders and revenue per customer, highest revenue first."""
+    rows = (
+        orders.order_by().values('customer_id', 'customer__name')
+        .annotate(orders=Count('pk'), revenue=_revenue('total_amount'))
+        .order_by('-revenue', 'customer_id')
+    )
+    return [
+        {
+            'key': str(row['customer_id']),
+            'label': row['customer__name'],
+            'orders': row['orders'],
+            'revenue': _money(row['revenue']),
+        }
+        for row in rows
+    ]
+
+
+def _product_groups(start=None, end=None):
+    """Orders, units and line revenue per product, highest revenue first."""
+    items = _in_range(OrderItem.objects.all(), 'order__order_date', start, end)
+    rows = (
+        items.order_by().values('product_id', 'product__name')
+        .annotate(
+            orders=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=_revenue(F('quantity') * F('unit_price')),
+        )
+        .order_by('-revenue', 'product_id')
+    )
+    return [
+        {
+            'key': str(row['product_id']),
+            'label': row['product__name'],
+            'orders': row['orders'],
+            'units': row['units'],
+            'revenue': _money(row['revenue']),
+        }
+        for row in rows
+    ]
+
+
+def crm_stats(start=None, end=None, group_by=None):
+    """
+    Customer, order and revenue totals computed with SQL aggregates.
+
+    start and end bound Order.order_date (and Customer.created_at for the
+    customer count) as a half-open range [start, end). group_by is one of
+    GROUP_BY_CHOICES and adds a breakdown under 'groups'. Revenue is an
+    exact Decimal.
+
+    Totals and day/week groups over whole days are read from the DailyStats
+    rollup (see crm.rollup), so they cost O(days) rather than O(orders).
+    """
+    if group_by is not None and group_by not in GROUP_BY_CHOICES:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY_CHOICES)}")
+
+    orders = _in_range(Order.objects.all(), 'order_date', start, end)
+    customers = _in_range(Customer.objects.all(), 'created_at', start, end)
+
+    groups = []
+    if group_by in (None, 'day', 'week'):
+        bounds = _day_bounds(start, end)
+        if bounds is not None:
+            days = _rolled_up_days(orders, customers, *bounds)
+        else:
+            days = daily_deltas(orders, customers)
+        total_orders = sum(day['order_count'] for day in days.values())
+        total_revenue = sum((day['revenue'] for day in days.values()), Decimal('0'))
+        if group_by is not None:
+            groups = _period_groups(days, weekly=group_by == 'week')
+    else:
+        totals = orders.order_by().aggregate(orders=Count('pk'), revenue=_revenue('total_amount'))
+        total_orders, total_revenue = totals['orders'], totals['revenue']
+        if group_by == 'customer':
+            groups = _customer_groups(orders)
+        else:
+            groups = _product_groups(start, end)
+
+    return {
+        'start': start,
+        'end': end,
+        'total_customers': customers.order_by().count(),
+        'total_orders': total_orders,
+        'total_revenue': _money(total_revenue),
+        'groups': groups,
+    }
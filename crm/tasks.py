@@ -2,14 +2,12 @@ import os
 import sys
 from datetime import datetime
 from celery import shared_task
-from gql import gql, Client
-from gql.transport.requests import RequestsHTTPTransport
 
 @shared_task
 def generate_crm_report():
     """
-    Generate a weekly CRM report using GraphQL queries.
-    Fetches total customers, orders, and revenue.
+    Generate a weekly CRM report.
+    Fetches total customers, orders, and revenue from crm.stats.crm_stats().
     """
     # Get current timestamp
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -29,35 +27,15 @@ def generate_crm_report():
             import django
             django.setup()
         
-        # GraphQL endpoint
-        GRAPHQL_ENDPOINT = "http://localhost:8000/graphql"
+        from crm.rollup import update_daily_rollup
+        from crm.stats import crm_stats
         
-        # GraphQL query to get CRM statistics
-        CRM_STATS_QUERY = gql("""
-            query {
-                customers {
-                    id
-                }
-                orders {
-                    id
-                    totalAmount
-                }
-            }
-        """)
-        
-        # Create GraphQL client and execute query
-        transport = RequestsHTTPTransport(url=GRAPHQL_ENDPOINT)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        result = client.execute(CRM_STATS_QUERY)
-        
-        # Extract data
-        customers = result.get('customers', [])
-        orders = result.get('orders', [])
-        
-        # Calculate statistics
-        total_customers = len(customers)
-        total_orders = len(orders)
-        total_revenue = sum(float(order.get('totalAmount', 0)) for order in orders)
+        # Bring the daily rollup up to date, then read the totals from it
+        update_daily_rollup()
+        stats = crm_stats()
+        total_customers = stats['total_customers']
+        total_orders = stats['total_orders']
+        total_revenue = stats['total_revenue']
         
         # Format the report
         report_message = f"{timestamp} - Report: {total_customers} customers, {total_orders} orders, ${total_revenue:.2f} revenue"
@@ -73,7 +51,8 @@ def generate_crm_report():
             'success': True,
             'customers': total_customers,
             'orders': total_orders,
-            'revenue': total_revenue,
+            # Decimal is not JSON serializable; keep it exact as a string
+            'revenue': str(total_revenue),
             'message': report_message
         }
         
@@ -90,4 +69,16 @@ def generate_crm_report():
             'success': False,
             'error': str(e),
             'message': error_message
-        } 
\ No newline at end of file
+        }
+
+
+@shared_task
+def update_crm_rollup(rebuild=False):
+    """
+    Fold orders and customers created since the last run into the DailyStats
+    rollup. With rebuild=True the rollup is recomputed from scratch.
+    """
+    from crm.rollup import rebuild_daily_rollup, update_daily_rollup
+    
+    days = rebuild_daily_rollup() if rebuild else update_daily_rollup()
+    return {'success': True, 'days': days}
@@ -0,0 +1,45 @@
+"""
+Test helpers for GraphQL query budgets.
+
+assert_query_budget() executes an operation against the project schema
+and fails if it runs more SQL than allowed, so a resolver that starts
+fetching per row fails the suite instead of showing up in production. It
+works in Django TestCases and in pytest-django tests (with the ``db``
+fixture):
+
+    def test_orders_page(db):
+        assert_query_budget("query { orders { id customer { name } } }", max_queries=3)
+"""
+
+from django.test import RequestFactory
+from .budget import QueryBudgetMiddleware, track_queries
+
+
+def assert_query_budget(query, max_queries, variables=None, max_repeats=None):
+    """
+    Execute query and return its data, raising AssertionError if it has
+    errors, runs more than max_queries statements, or runs one statement
+    more than max_repeats times.
+    """
+    from graphene_django.settings import graphene_settings
+
+    with track_queries(budget=max_queries, action='log', repeat_threshold=max_repeats) as tracker:
+        result = graphene_settings.SCHEMA.execute(
+            query,
+            variable_values=variables,
+            context_value=RequestFactory().post('/graphql'),
+            middleware=[QueryBudgetMiddleware()],
+        )
+    if result.errors:
+        raise AssertionError(f"Operation failed: {result.errors}")
+    if tracker.count > max_queries:
+        raise AssertionError(
+            f"Operation ran {tracker.count} SQL queries, more than its budget of {max_queries}:\n"
+            + tracker.summary()
+        )
+    if tracker.repeated:
+        sql, count = tracker.repeated[0]
+        raise AssertionError(
+            f"Operation repeated a query {count} times (at most {max_repeats} allowed): {sql}"
+        )
+    return result.data
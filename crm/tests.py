@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from decimal import Decimal
 from .models import Customer, Product, Order, OrderItem
 
@@ -53,4 +53,1367 @@ class OrderModelTest(TestCase):
         self.assertEqual(self.order.total_amount, Decimal("0"))
     
     def test_order_str(self):
-        self.assertEqual(str(self.order), f"Order {self.order.id} - Test Customer") 
\ No newline at end of file
+        self.assertEqual(str(self.order), f"Order {self.order.id} - Test Customer") 
+
+
+class GraphQLQueryTestCase(TestCase):
+    """Base class for tests that execute documents against the project schema."""
+    
+    def execute(self, query, variables=None):
+        from django.test import RequestFactory
+        from graphene_django.settings import graphene_settings
+        
+        request = RequestFactory().post('/graphql')
+        result = graphene_settings.SCHEMA.execute(
+            query, variable_values=variables, context_value=request
+        )
+        self.assertIsNone(result.errors, result.errors)
+        return result.data
+
+
+class DataLoaderBatchingTest(GraphQLQueryTestCase):
+    def setUp(self):
+        products = [
+            Product.objects.create(name=f"Product {i}", price=Decimal("10.00"), stock=5)
+            for i in range(3)
+        ]
+        for i in range(4):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"c{i}@example.com")
+            order = Order.objects.create(customer=customer)
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+    
+    def test_primed_keys_load_in_one_batch(self):
+        from .loaders import CRMLoaders
+        
+        loaders = CRMLoaders()
+        orders = loaders.prime(Order.objects.all())
+        # customers, items
+        with self.assertNumQueries(2):
+            for order in orders:
+                self.assertIsNotNone(loaders.customer.load(order.customer_id))
+                self.assertEqual(len(loaders.items_by_order.load(order.pk)), 3)
+        # items were primed with their product ids when they were loaded
+        with self.assertNumQueries(1):
+            for order in orders:
+                for item in loaders.items_by_order.load(order.pk):
+                    loaders.product.load(item.product_id)
+    
+    def test_customer_orders_batched_through_connection(self):
+        query = """
+            query {
+                allCustomers {
+                    edges { node { orders { edges { node { totalAmount } } } } }
+                }
+            }
+        """
+        # customers page, orders for every customer
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+        for edge in data['allCustomers']['edges']:
+            self.assertEqual(len(edge['node']['orders']['edges']), 1)
+    
+    def test_filtered_customer_orders_load_in_one_query(self):
+        customer = Customer.objects.first()
+        Order.objects.create(customer=customer)
+        query = """
+            query {
+                customers {
+                    name
+                    orders(totalAmount_Gte: 1) { edges { node { id totalAmount } } }
+                }
+            }
+        """
+        # customers, matching orders of every customer
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+        self.assertEqual(len(data['customers']), 4)
+        for node in data['customers']:
+            self.assertEqual(len(node['orders']['edges']), 1)
+    
+    def test_paginated_relations_fetch_only_their_page(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .loaders import CRMLoaders
+        
+        for customer in Customer.objects.all():
+            Order.objects.create(customer=customer)
+            Order.objects.create(customer=customer)
+        query = """
+            query($first: Int) {
+                customers {
+                    orders(first: $first) { edges { node { id } } pageInfo { hasNextPage } }
+                }
+            }
+        """
+        with CaptureQueriesContext(connection) as context:
+            data = self.execute(query, {'first': 1})
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertIn('ROW_NUMBER()', context.captured_queries[1]['sql'])
+        for customer in data['customers']:
+            self.assertEqual(len(customer['orders']['edges']), 1)
+            self.assertTrue(customer['orders']['pageInfo']['hasNextPage'])
+        
+        loaders = CRMLoaders()
+        customers = loaders.prime(Customer.objects.all())
+        with self.assertNumQueries(1):
+            for customer in customers:
+                self.assertEqual(len(loaders.subset('orders_by_customer', 2).load(customer.pk)), 2)
+
+
+class QueryPlannerTest(GraphQLQueryTestCase):
+    def setUp(self):
+        product = Product.objects.create(name="Widget", price=Decimal("5.00"), stock=3)
+        for i in range(3):
+            customer = Customer.objects.create(name=f"Customer {i}", email=f"p{i}@example.com")
+            order = Order.objects.create(customer=customer)
+            OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+    
+    def test_nested_relations_use_select_and_prefetch_related(self):
+        query = """
+            query {
+                orders {
+                    customer { email }
+                    items { edges { node { product { name } } } }
+                }
+            }
+        """
+        # orders joined with customers, items joined with products
+        with self.assertNumQueries(2):
+            data = self.execute(query)
+        self.assertEqual(len(data['orders']), 3)
+        self.assertEqual(data['orders'][0]['items']['edges'][0]['node']['product']['name'], "Widget")
+    
+    def test_only_selected_columns_are_read(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        with CaptureQueriesContext(connection) as context:
+            self.execute("query { orders { id totalAmount } }")
+        sql = context.captured_queries[0]['sql']
+        select_list = sql.split(' FROM ')[0]
+        self.assertIn('"total_amount"', select_list)
+        self.assertNotIn('"customer_id"', select_list)
+        self.assertNotIn('"created_at"', select_list)
+
+
+class KeysetPaginationTest(GraphQLQueryTestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        customer = Customer.objects.create(name="Keyset", email="keyset@example.com")
+        now = timezone.now()
+        self.orders = [
+            Order.objects.create(customer=customer, order_date=now - timedelta(days=i % 3))
+            for i in range(5)
+        ]
+    
+    def fetch_page(self, after=None):
+        query = """
+            query($after: String) {
+                allOrders(first: 2, after: $after) {
+                    edges { cursor node { id } }
+                    pageInfo { hasNextPage endCursor }
+                }
+            }
+        """
+        return self.execute(query, {'after': after})['allOrders']
+    
+    def test_pages_cover_every_row_once_without_count_or_offset(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        
+        seen = []
+        after = None
+        with CaptureQueriesContext(connection) as context:
+            while True:
+                page = self.fetch_page(after)
+                seen.extend(edge['node']['id'] for edge in page['edges'])
+                if not page['pageInfo']['hasNextPage']:
+                    break
+                after = page['pageInfo']['endCursor']
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'])
+            self.assertNotIn('OFFSET', query['sql'])
+    
+    def test_total_count_only_when_selected(self):
+        data = self.execute("query { allOrders(first: 1) { totalCount } }")
+        self.assertEqual(data['allOrders']['totalCount'], 5)
+    
+    def test_null_sort_keys_page_in_database_order(self):
+        from .pagination import get_keyset_ordering, iterate_keyset
+        
+        for i, phone in enumerate([None, "555-000-0001", None, "555-000-0002"]):
+            Customer.objects.create(name=f"Phone {i}", email=f"phone{i}@example.com", phone=phone)
+        query = """
+            query($orderBy: String, $after: ID) {
+                filteredCustomers(filter: {orderBy: $orderBy}, first: 1, after: $after) { id name }
+            }
+        """
+        for order_by in ("phone", "-phone"):
+            expected = list(Customer.objects.order_by(order_by, 'pk').values_list('name', flat=True))
+            names, after = [], None
+            while True:
+                page = self.execute(query, {'orderBy': order_by, 'after': after})['filteredCustomers']
+                if not page:
+                    break
+                names.append(page[0]['name'])
+                after = page[0]['id']
+            self.assertEqual(names, expected)
+            
+            queryset = Customer.objects.order_by(order_by)
+            rows = iterate_keyset(queryset, get_keyset_ordering(queryset), page_size=2)
+            self.assertEqual([row.name for row in rows], expected)
+
+
+class ListLimitAndStreamTest(GraphQLQueryTestCase):
+    def setUp(self):
+        for i in range(5):
+            Product.objects.create(name=f"Item {i}", price=Decimal("1.00"), stock=i)
+    
+    def test_first_and_after_page_through_list_field(self):
+        first_page = self.execute("query { products(first: 3) { id name } }")['products']
+        self.assertEqual([p['name'] for p in first_page], ["Item 0", "Item 1", "Item 2"])
+        rest = self.execute(
+            "query($after: ID) { products(after: $after) { name } }",
+            {'after': first_page[-1]['id']},
+        )['products']
+        self.assertEqual([p['name'] for p in rest], ["Item 3", "Item 4"])
+    
+    def test_server_side_limit_is_enforced(self):
+        from django.test import RequestFactory, override_settings
+        from graphene_django.settings import graphene_settings
+        
+        with override_settings(CRM_LIST_MAX_LIMIT=2):
+            data = self.execute("query { products { name } }")
+            self.assertEqual(len(data['products']), 2)
+            result = graphene_settings.SCHEMA.execute(
+                "query { products(first: 3) { name } }",
+                context_value=RequestFactory().post('/graphql'),
+            )
+        self.assertIn("exceeds the limit of 2", str(result.errors[0]))
+    
+    def test_stream_view_returns_every_row_as_ndjson(self):
+        import json
+        from django.test import override_settings
+        
+        with override_settings(CRM_LIST_MAX_LIMIT=1, CRM_STREAM_CHUNK_SIZE=2):
+            response = self.client.post(
+                '/graphql/stream',
+                data=json.dumps({'query': "query { filteredProducts(filter: {lowStock: true}) { name } }"}),
+                content_type='application/json',
+            )
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['name'] for line in lines], [f"Item {i}" for i in range(5)])
+    
+    def test_stream_view_rejects_non_list_queries(self):
+        response = self.client.post(
+            '/graphql/stream',
+            data='{"query": "query { hello }"}',
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_stream_view_rejects_bodies_that_are_not_objects(self):
+        for body in ('[]', '"x"', '1'):
+            response = self.client.post('/graphql/stream', data=body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['errors'][0]['message'], "Request body must be a JSON object.")
+
+
+class SearchBackendTest(GraphQLQueryTestCase):
+    def setUp(self):
+        Customer.objects.create(name="Alice Alison", email="alice@example.com")
+        Customer.objects.create(name="Malik Stone", email="malik@example.com")
+        Customer.objects.create(name="Bob Brown", email="bob@example.com")
+    
+    def test_icontains_filters_match_substrings(self):
+        data = self.execute("""
+            query {
+                allCustomers(name_Icontains: "ALI") { edges { node { name } } }
+                filteredCustomers(filter: {email: "ik@ex"}) { name }
+            }
+        """)
+        names = sorted(edge['node']['name'] for edge in data['allCustomers']['edges'])
+        self.assertEqual(names, ["Alice Alison", "Malik Stone"])
+        self.assertEqual([c['name'] for c in data['filteredCustomers']], ["Malik Stone"])
+    
+    def test_results_are_ordered_by_relevance(self):
+        data = self.execute('query { filteredCustomers(filter: {name: "ali"}) { name } }')
+        self.assertEqual(data['filteredCustomers'][0]['name'], "Alice Alison")
+    
+    def test_short_terms_and_updates(self):
+        data = self.execute('query { filteredCustomers(filter: {name: "bo"}) { name } }')
+        self.assertEqual([c['name'] for c in data['filteredCustomers']], ["Bob Brown"])
+        Customer.objects.filter(name="Bob Brown").update(name="Robert Brown")
+        data = self.execute('query { filteredCustomers(filter: {name: "robert"}) { name } }')
+        self.assertEqual([c['name'] for c in data['filteredCustomers']], ["Robert Brown"])
+    
+    def test_phone_argument_is_exact_on_connections(self):
+        Customer.objects.filter(name="Bob Brown").update(phone="555-123-4567")
+        Customer.objects.filter(name="Malik Stone").update(phone="1555-123-4567")
+        data = self.execute("""
+            query {
+                allCustomers(phone: "555-123-4567") { edges { node { name } } }
+                filteredCustomers(filter: {phone: "555-123"}) { name }
+            }
+        """)
+        self.assertEqual([edge['node']['name'] for edge in data['allCustomers']['edges']], ["Bob Brown"])
+        self.assertEqual(sorted(c['name'] for c in data['filteredCustomers']), ["Bob Brown", "Malik Stone"])
+    
+    def test_updates_of_other_columns_do_not_reindex(self):
+        from django.db import connection
+        
+        if connection.vendor != 'sqlite':
+            self.skipTest("FTS triggers are SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'crm_customer_search_au'")
+            sql = cursor.fetchone()[0]
+        self.assertIn('AFTER UPDATE OF "name", "email", "phone" ON "crm_customer"', sql)
+    
+    def test_order_filters_search_related_names(self):
+        product = Product.objects.create(name="Gadget Pro", price=Decimal("2.00"), stock=1)
+        order = Order.objects.create(customer=Customer.objects.get(name="Bob Brown"))
+        OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+        data = self.execute("""
+            query {
+                allOrders(productName: "gadget", customerName: "brow") { edges { node { id } } }
+            }
+        """)
+        self.assertEqual(len(data['allOrders']['edges']), 1)
+
+
+class SearchRowidTest(TransactionTestCase):
+    """VACUUM cannot run inside the transaction of a TestCase."""
+    
+    def test_index_is_keyed_on_stable_rowids(self):
+        from django.db import connection
+        from .search import search
+        
+        if connection.vendor != 'sqlite':
+            self.skipTest("FTS tables are SQLite only")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'crm_customer_search'")
+            self.assertIn("content_rowid='search_rowid'", cursor.fetchone()[0])
+            # An INTEGER PRIMARY KEY is an alias of the rowid, which VACUUM keeps
+            cursor.execute('SELECT name, type, pk FROM pragma_table_info(\'crm_customer_search_ids\')')
+            self.assertIn(('rowid', 'INTEGER', 1), cursor.fetchall())
+        customers = [
+            Customer.objects.create(name=f"Vacuum {i}", email=f"vacuum{i}@example.com") for i in range(6)
+        ]
+        Customer.objects.filter(pk__in=[c.pk for c in customers[:4]]).delete()
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
+        names = search(Customer.objects.all(), 'name', "vacuum", rank=True).values_list('name', flat=True)
+        self.assertEqual(sorted(names), ["Vacuum 4", "Vacuum 5"])
+        self.assertEqual(list(search(Customer.objects.all(), 'name', "cuum 5").values_list('name', flat=True)), ["Vacuum 5"])
+
+
+class FilterCompilationTest(GraphQLQueryTestCase):
+    def setUp(self):
+        from datetime import datetime, timezone
+        
+        customer = Customer.objects.create(name="Ann Lee", email="ann@example.com", phone="555-123-4567")
+        Order.objects.create(customer=customer, order_date=datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.recent = Order.objects.create(customer=customer, order_date=datetime(2024, 3, 1, tzinfo=timezone.utc))
+    
+    def test_every_path_applies_the_same_filters(self):
+        data = self.execute("""
+            query($since: DateTime!) {
+                orders(orderDate_Gte: $since) { id }
+                allOrders(orderDate_Gte: $since) { edges { node { id } } }
+                filteredOrders(filter: {orderDateGte: $since}) { id }
+                customers(phone_Icontains: "123") { name }
+                filteredCustomers(filter: {phoneIcontains: "123"}) { name }
+            }
+        """, {'since': "2024-02-01T00:00:00+00:00"})
+        expected = [data['allOrders']['edges'][0]['node']['id']]
+        self.assertEqual(len(data['allOrders']['edges']), 1)
+        self.assertEqual([o['id'] for o in data['orders']], expected)
+        self.assertEqual([o['id'] for o in data['filteredOrders']], expected)
+        self.assertEqual(data['customers'], data['filteredCustomers'])
+        self.assertEqual(data['customers'], [{'name': "Ann Lee"}])
+    
+    def test_filters_are_compiled_once_per_argument_shape(self):
+        from .filters import compile_filters
+        
+        compile_filters.cache_clear()
+        for since in ("2023-01-01T00:00:00+00:00", "2024-02-01T00:00:00+00:00"):
+            self.execute("""
+                query($since: DateTime!) {
+                    orders(orderDate_Gte: $since) { id }
+                    allOrders(orderDate_Gte: $since) { edges { node { id } } }
+                }
+            """, {'since': since})
+        info = compile_filters.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 3))
+    
+    def test_invalid_filter_values_are_reported(self):
+        from django.test import RequestFactory
+        from graphene_django.settings import graphene_settings
+        
+        result = graphene_settings.SCHEMA.execute(
+            'query { orders(customer: "not-a-global-id") { id } }',
+            context_value=RequestFactory().post('/graphql'),
+        )
+        self.assertIn('customer', result.errors[0].message)
+
+
+class CreateOrderMutationTest(GraphQLQueryTestCase):
+    MUTATION = """
+        mutation($input: CreateOrderInput!) {
+            createOrder(input: $input) {
+                success
+                message
+                order { totalAmount items { edges { node { quantity product { name } } } } }
+                lineErrors { productId requested available message }
+            }
+        }
+    """
+    
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Buyer", email="buyer@example.com")
+        self.products = [
+            Product.objects.create(name=f"Item {i}", price=Decimal("1.50"), stock=10)
+            for i in range(6)
+        ]
+    
+    def create_order(self, product_ids=None, items=None):
+        return self.execute(self.MUTATION, {
+            'input': {'customerId': str(self.customer.id), 'productIds': product_ids, 'items': items},
+        })['createOrder']
+    
+    def test_query_count_does_not_grow_with_the_cart(self):
+        ids = [str(product.id) for product in self.products]
+        with self.assertNumQueries(11):
+            small = self.create_order(ids[:1])
+        with self.assertNumQueries(11):
+            large = self.create_order(ids)
+        self.assertTrue(small['success'], small['message'])
+        self.assertEqual(Decimal(small['order']['totalAmount']), Decimal("1.50"))
+        self.assertEqual(Decimal(large['order']['totalAmount']), Decimal("9.00"))
+        self.assertEqual(len(large['order']['items']['edges']), 6)
+    
+    def test_repeated_products_become_quantities(self):
+        product_id = str(self.products[0].id)
+        result = self.create_order([product_id, product_id])
+        self.assertEqual(Decimal(result['order']['totalAmount']), Decimal("3.00"))
+        self.assertEqual(result['order']['items']['edges'][0]['node']['quantity'], 2)
+        self.assertIsNotNone(Order.objects.get().order_date)
+    
+    def test_invalid_product_creates_nothing(self):
+        missing = "00000000-0000-0000-0000-000000000000"
+        result = self.create_order([str(self.products[0].id), missing])
+        self.assertFalse(result['success'])
+        self.assertEqual(result['message'], f"Invalid product ID: {missing}")
+        self.assertFalse(Order.objects.exists())
+    
+    def test_quantities_are_taken_from_stock(self):
+        product = self.products[0]
+        result = self.create_order(items=[{'productId': str(product.id), 'quantity': 4}])
+        self.assertTrue(result['success'], result['message'])
+        self.assertEqual(Decimal(result['order']['totalAmount']), Decimal("6.00"))
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 6)
+    
+    def test_short_lines_are_reported_and_nothing_is_reserved(self):
+        plenty, scarce = self.products[:2]
+        result = self.create_order(items=[
+            {'productId': str(plenty.id), 'quantity': 2},
+            {'productId': str(scarce.id), 'quantity': 11},
+        ])
+        self.assertFalse(result['success'])
+        self.assertEqual(result['lineErrors'], [{
+            'productId': str(scarce.id),
+            'requested': 11,
+            'available': 10,
+            'message': "Insufficient stock for Item 1: requested 11, available 10",
+        }])
+        self.assertEqual(
+            list(Product.objects.filter(pk__in=[plenty.pk, scarce.pk]).values_list('stock', flat=True)),
+            [10, 10]
+        )
+        self.assertFalse(Order.objects.exists())
+    
+    def test_stock_is_never_oversold(self):
+        product = self.products[0]
+        line = [{'productId': str(product.id), 'quantity': 4}]
+        results = [self.create_order(items=line) for _ in range(3)]
+        self.assertEqual([result['success'] for result in results], [True, True, False])
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 2)
+
+
+class BulkCreateCustomersMutationTest(GraphQLQueryTestCase):
+    MUTATION = """
+        mutation($input: [BulkCreateCustomerInput]!, $partial: Boolean) {
+            bulkCreateCustomers(input: $input, partial: $partial) {
+                customers { email }
+                errors
+                success
+            }
+        }
+    """
+    
+    def setUp(self):
+        Customer.objects.create(name="Existing", email="taken@example.com")
+    
+    def bulk_create(self, rows, partial=True):
+        return self.execute(self.MUTATION, {'input': rows, 'partial': partial})['bulkCreateCustomers']
+    
+    def rows(self, count):
+        return [{'name': f"Row {i}", 'email': f"row{i}@example.com"} for i in range(count)]
+    
+    def test_query_count_does_not_grow_with_the_batch(self):
+        with self.assertNumQueries(6):
+            self.bulk_create(self.rows(2))
+        with self.assertNumQueries(6):
+            result = self.bulk_create(self.rows(50)[2:])
+        self.assertTrue(result['success'], result['errors'])
+        self.assertEqual(Customer.objects.count(), 51)
+    
+    def test_invalid_rows_are_reported_and_the_rest_created(self):
+        rows = self.rows(2) + [
+            {'name': "Dup", 'email': "row0@example.com"},
+            {'name': "Taken", 'email': "taken@example.com"},
+            {'name': "Phone", 'email': "phone@example.com", 'phone': "12"},
+        ]
+        result = self.bulk_create(rows)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['errors'], [
+            "Email row0@example.com is duplicated in this batch",
+            "Email taken@example.com already exists",
+            "Invalid phone format for phone@example.com",
+        ])
+        self.assertEqual([c['email'] for c in result['customers']], ["row0@example.com", "row1@example.com"])
+    
+    def test_all_or_nothing_mode(self):
+        result = self.bulk_create(self.rows(2) + [{'name': "Taken", 'email': "taken@example.com"}], partial=False)
+        self.assertFalse(result['success'])
+        self.assertEqual(result['customers'], [])
+        self.assertEqual(Customer.objects.count(), 1)
+    
+    def test_chunk_skips_emails_taken_concurrently(self):
+        from .schema import create_customer_chunk
+        
+        chunk = [Customer(name="Late", email="taken@example.com"), Customer(name="New", email="new@example.com")]
+        created, errors = create_customer_chunk(chunk)
+        self.assertEqual([customer.email for customer in created], ["new@example.com"])
+        self.assertEqual(errors, ["Email taken@example.com already exists"])
+
+
+class UpdateLowStockProductsMutationTest(GraphQLQueryTestCase):
+    MUTATION = """
+        mutation($threshold: Int, $increment: Int) {
+            updateLowStockProducts(threshold: $threshold, increment: $increment) {
+                success
+                message
+                updatedProducts { name stock price }
+            }
+        }
+    """
+    
+    def setUp(self):
+        Product.objects.create(name="Empty", price=Decimal("1.25"), stock=0)
+        Product.objects.create(name="Low", price=Decimal("2.50"), stock=4)
+        Product.objects.create(name="Plenty", price=Decimal("5.00"), stock=40)
+    
+    def restock(self, **variables):
+        return self.execute(self.MUTATION, variables)['updateLowStockProducts']
+    
+    def test_restock_is_a_single_statement(self):
+        with self.assertNumQueries(1):
+            result = self.restock(threshold=5, increment=20)
+        products = sorted(result['updatedProducts'], key=lambda product: product['name'])
+        self.assertEqual(products, [
+            {'name': "Empty", 'stock': 20, 'price': "1.25"},
+            {'name': "Low", 'stock': 24, 'price': "2.50"},
+        ])
+        self.assertEqual(Product.objects.get(name="Plenty").stock, 40)
+    
+    def test_repeated_run_is_a_no_op(self):
+        self.restock()
+        result = self.restock()
+        self.assertEqual(result['message'], "No low stock products found")
+        self.assertEqual(
+            dict(Product.objects.values_list('name', 'stock')),
+            {"Empty": 10, "Low": 14, "Plenty": 40}
+        )
+
+
+class CRMStatsTest(GraphQLQueryTestCase):
+    def setUp(self):
+        from datetime import datetime, timezone as dt_timezone
+        
+        self.day = lambda d: datetime(2024, 1, d, 12, tzinfo=dt_timezone.utc)
+        alice = Customer.objects.create(name="Alice", email="alice@example.com")
+        bob = Customer.objects.create(name="Bob", email="bob@example.com")
+        pen = Product.objects.create(name="Pen", price=Decimal("0.10"), stock=100)
+        for customer, day, units in [(alice, 1, 1), (alice, 2, 2), (bob, 9, 4)]:
+            order = Order.objects.create(customer=customer, order_date=self.day(day), total_amount=pen.price * units)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=pen, quantity=units, unit_price=pen.price)])
+    
+    def test_totals_are_exact_aggregates(self):
+        with self.assertNumQueries(4):
+            data = self.execute('query { crmStats { totalCustomers totalOrders totalRevenue groups { key } } }')
+        self.assertEqual(data['crmStats'], {
+            'totalCustomers': 2, 'totalOrders': 3, 'totalRevenue': "0.70", 'groups': [],
+        })
+    
+    def test_group_by_and_date_range(self):
+        data = self.execute("""
+            query($start: DateTime, $end: DateTime) {
+                byDay: crmStats(start: $start, end: $end, groupBy: DAY) { totalRevenue groups { key orders revenue } }
+                byCustomer: crmStats(groupBy: CUSTOMER) { groups { label orders revenue } }
+                byProduct: crmStats(groupBy: PRODUCT) { groups { label orders units revenue } }
+            }
+        """, {'start': self.day(1).isoformat(), 'end': self.day(3).isoformat()})
+        self.assertEqual(data['byDay'], {'totalRevenue': "0.30", 'groups': [
+            {'key': "2024-01-01", 'orders': 1, 'revenue': "0.10"},
+            {'key': "2024-01-02", 'orders': 1, 'revenue': "0.20"},
+        ]})
+        self.assertEqual(data['byCustomer']['groups'], [
+            {'label': "Bob", 'orders': 1, 'revenue': "0.40"},
+            {'label': "Alice", 'orders': 2, 'revenue': "0.30"},
+        ])
+        self.assertEqual(data['byProduct']['groups'], [
+            {'label': "Pen", 'orders': 3, 'units': 7, 'revenue': "0.70"},
+        ])
+    
+    def test_report_task_uses_aggregates(self):
+        from .tasks import generate_crm_report
+        
+        result = generate_crm_report()
+        self.assertTrue(result['success'], result)
+        self.assertEqual((result['customers'], result['orders'], result['revenue']), (2, 3, "0.70"))
+
+
+@override_settings(CRM_ROLLUP_LAG_SECONDS=0)
+class DailyRollupTest(TestCase):
+    def setUp(self):
+        from datetime import datetime, timezone as dt_timezone
+        
+        self.day = lambda d: datetime(2024, 1, d, 12, tzinfo=dt_timezone.utc)
+        self.customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        self.order(1, "1.00")
+        self.order(1, "2.50")
+        self.order(3, "4.00")
+    
+    def order(self, day, total):
+        return Order.objects.create(customer=self.customer, order_date=self.day(day), total_amount=Decimal(total))
+    
+    def test_rollup_is_incremental(self):
+        from .models import DailyStats
+        from .rollup import update_daily_rollup
+        
+        self.assertEqual(update_daily_rollup(), 3)
+        self.assertEqual(
+            list(DailyStats.objects.values_list('date', 'order_count', 'revenue').filter(order_count__gt=0)),
+            [(self.day(1).date(), 2, Decimal("3.50")), (self.day(3).date(), 1, Decimal("4.00"))]
+        )
+        self.order(3, "1.00")
+        with self.assertNumQueries(8):
+            self.assertEqual(update_daily_rollup(), 1)
+        self.assertEqual(DailyStats.objects.get(date=self.day(3).date()).revenue, Decimal("5.00"))
+        self.assertEqual(update_daily_rollup(), 0)
+    
+    def test_stats_combine_rollup_and_new_rows(self):
+        from .rollup import rebuild_daily_rollup
+        from .stats import crm_stats
+        
+        rebuild_daily_rollup()
+        self.order(2, "0.25")
+        stats = crm_stats(group_by='day')
+        self.assertEqual((stats['total_orders'], stats['total_revenue']), (4, Decimal("7.75")))
+        self.assertEqual(
+            [(group['key'], group['orders'], group['revenue']) for group in stats['groups'] if group['orders']],
+            [("2024-01-01", 2, Decimal("3.50")), ("2024-01-02", 1, Decimal("0.25")), ("2024-01-03", 1, Decimal("4.00"))]
+        )
+        # A range that splits a day is aggregated live
+        self.assertEqual(crm_stats(start=self.day(1))['total_orders'], 4)
+        self.assertEqual(crm_stats(start=self.day(2))['total_revenue'], Decimal("4.25"))
+    
+    def test_edits_and_deletes_after_the_rollup(self):
+        from django.db.models import Count, Sum
+        from .models import DailyStats
+        from .rollup import update_daily_rollup
+        from .stats import crm_stats
+        
+        product = Product.objects.create(name="Widget", price=Decimal("3.00"), stock=10)
+        edited = self.order(3, "0.00")
+        update_daily_rollup()
+        OrderItem.objects.create(order=edited, product=product, quantity=2)
+        Order.objects.filter(total_amount=Decimal("1.00")).delete()
+        
+        def check():
+            live = Order.objects.aggregate(orders=Count('pk'), revenue=Sum('total_amount'))
+            stats = crm_stats(group_by='day')
+            self.assertEqual((stats['total_orders'], stats['total_revenue']), (3, Decimal("12.50")))
+            self.assertEqual((stats['total_orders'], stats['total_revenue']), (live['orders'], live['revenue']))
+        
+        check()
+        self.assertEqual(
+            sorted(DailyStats.objects.filter(dirty=True).values_list('date', flat=True)),
+            [self.day(1).date(), self.day(3).date()]
+        )
+        update_daily_rollup()
+        self.assertFalse(DailyStats.objects.filter(dirty=True).exists())
+        check()
+        self.assertEqual(DailyStats.objects.get(date=self.day(3).date()).revenue, Decimal("10.00"))
+
+
+class InProcessExecutorTest(TestCase):
+    def test_execute_query_runs_against_the_schema(self):
+        from .executor import execute_query, prepare
+        
+        Product.objects.create(name="Low", price=Decimal("1.00"), stock=1)
+        query = 'query($first: Int) { products(first: $first) { name stock } }'
+        self.assertEqual(execute_query(query, {'first': 5}), {'products': [{'name': "Low", 'stock': 1}]})
+        self.assertIs(prepare(query), prepare(query))
+    
+    def test_errors_are_raised(self):
+        from .executor import GraphQLExecutionError, execute_query
+        
+        with self.assertRaises(GraphQLExecutionError) as raised:
+            execute_query('query { products { nope } }')
+        self.assertIn("Cannot query field 'nope'", str(raised.exception))
+    
+    def test_cron_jobs_do_not_use_http(self):
+        from unittest import mock
+        from .cron import update_low_stock
+        
+        product = Product.objects.create(name="Low", price=Decimal("1.00"), stock=1)
+        with mock.patch('crm.executor.execute_remote') as execute_remote:
+            update_low_stock()
+        execute_remote.assert_not_called()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 11)
+
+
+class GraphQLClientTest(TestCase):
+    def make_client(self):
+        from graphene_django.settings import graphene_settings
+        from graphql import build_schema
+        from .client import GraphQLClient
+        
+        snapshot = build_schema(str(graphene_settings.SCHEMA))
+        return GraphQLClient('http://crm.test/graphql', schema=snapshot)
+    
+    def test_documents_are_validated_against_the_snapshot_once(self):
+        from unittest import mock
+        from graphql import validate as graphql_validate
+        
+        client = self.make_client()
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {'data': {'hello': "Hello, GraphQL!"}}
+        with mock.patch.object(client.session, 'post', return_value=response) as post, \
+                mock.patch('crm.client.validate', wraps=graphql_validate) as validate:
+            for _ in range(3):
+                self.assertEqual(client.execute('query { hello }'), {'hello': "Hello, GraphQL!"})
+        self.assertEqual(post.call_count, 3)
+        self.assertEqual(validate.call_count, 1)
+        self.assertEqual(post.call_args.kwargs['json'], {'query': "{\n  hello\n}"})
+    
+    def test_invalid_documents_are_not_sent(self):
+        from unittest import mock
+        from .executor import GraphQLExecutionError
+        
+        client = self.make_client()
+        with mock.patch.object(client.session, 'post') as post:
+            with self.assertRaises(GraphQLExecutionError):
+                client.execute('query { nope }')
+        post.assert_not_called()
+
+
+class CleanInactiveCustomersCommandTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        now = timezone.now()
+        self.active = Customer.objects.create(name="Active", email="active@example.com")
+        self.newcomer = Customer.objects.create(name="New", email="new@example.com")
+        self.inactive = [
+            Customer.objects.create(name=f"Gone {i}", email=f"gone{i}@example.com") for i in range(3)
+        ]
+        Customer.objects.exclude(pk=self.newcomer.pk).update(created_at=now - timedelta(days=800))
+        Order.objects.create(customer=self.active, order_date=now - timedelta(days=10))
+        Order.objects.create(customer=self.inactive[0], order_date=now - timedelta(days=500))
+    
+    def call(self, *args):
+        from io import StringIO
+        from django.core.management import call_command
+        
+        out = StringIO()
+        call_command('clean_inactive_customers', *args, stdout=out)
+        return out.getvalue().strip()
+    
+    def test_dry_run_only_counts(self):
+        self.assertEqual(self.call('--dry-run'), "Would delete 3 inactive customers")
+        self.assertEqual(Customer.objects.count(), 5)
+    
+    def test_deletes_in_batches(self):
+        # Each batch also marks the days of its customers dirty in the rollup
+        with self.assertNumQueries(18):
+            output = self.call('--batch-size', '2')
+        self.assertEqual(output, "Deleted 3 inactive customers (1 old orders)")
+        self.assertEqual(
+            sorted(Customer.objects.values_list('name', flat=True)),
+            ["Active", "New"]
+        )
+
+
+class OrderReminderPipelineTest(TestCase):
+    class RecordingSender:
+        def __init__(self, fail_for=()):
+            import threading
+            
+            self.sent = []
+            self.fail_for = fail_for
+            self.lock = threading.Lock()
+        
+        def send(self, reminder):
+            if reminder.customer.email in self.fail_for:
+                raise ConnectionError("mail server down")
+            with self.lock:
+                self.sent.append((reminder.customer.name, len(reminder.orders)))
+    
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        
+        now = timezone.now()
+        self.busy = Customer.objects.create(name="Busy", email="busy@example.com")
+        self.quiet = Customer.objects.create(name="Quiet", email="quiet@example.com")
+        for days in (1, 2, 3, 4, 5):
+            Order.objects.create(customer=self.busy, order_date=now - timedelta(days=days))
+        Order.objects.create(customer=self.quiet, order_date=now - timedelta(days=1))
+        Order.objects.create(customer=self.quiet, order_date=now - timedelta(days=30))
+    
+    def send(self, sender, **kwargs):
+        from .reminders import send_order_reminders
+        
+        return send_order_reminders(sender=sender, workers=2, page_size=2, **kwargs)
+    
+    def test_one_reminder_per_customer(self):
+        sender = self.RecordingSender()
+        result = self.send(sender)
+        self.assertEqual(sorted(sender.sent), [("Busy", 5), ("Quiet", 1)])
+        self.assertEqual((result.reminders, result.orders, result.failed), (2, 6, 0))
+    
+    def test_reruns_only_send_new_orders(self):
+        from django.utils import timezone
+        
+        self.send(self.RecordingSender())
+        sender = self.RecordingSender()
+        with self.assertNumQueries(1):
+            self.send(sender)
+        self.assertEqual(sender.sent, [])
+        Order.objects.create(customer=self.quiet, order_date=timezone.now())
+        self.send(sender)
+        self.assertEqual(sender.sent, [("Quiet", 1)])
+    
+    def test_failed_reminders_are_retried(self):
+        with self.assertLogs('crm.reminders', 'WARNING'):
+            result = self.send(self.RecordingSender(fail_for={"busy@example.com"}))
+        self.assertEqual((result.reminders, result.failed), (1, 1))
+        sender = self.RecordingSender()
+        self.send(sender)
+        self.assertEqual(sender.sent, [("Busy", 5)])
+
+
+@override_settings(CRM_RESPONSE_CACHE_TIMEOUT=60)
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from .cache import connect_invalidation, disconnect_invalidation
+        
+        cache.clear()
+        connect_invalidation()
+        self.addCleanup(disconnect_invalidation)
+        self.product = Product.objects.create(name="Widget", price=Decimal("1.00"), stock=5)
+        Customer.objects.create(name="Ann Lee", email="ann@example.com")
+    
+    def post(self, query, variables=None):
+        import json
+        
+        response = self.client.post(
+            '/graphql',
+            data=json.dumps({'query': query, 'variables': variables}),
+            content_type='application/json',
+        )
+        return response.json()
+    
+    def test_repeated_queries_are_served_from_the_cache(self):
+        first = self.post("query { products { name stock } }")
+        with self.assertNumQueries(0):
+            again = self.post("query {\n  products {\n    name\n    stock\n  }\n}")
+        self.assertEqual(first, again)
+        with self.assertNumQueries(1):
+            self.post('query($name: String) { products(name: $name) { name } }', {'name': "wid"})
+    
+    def test_writes_invalidate_the_models_they_touch(self):
+        self.post("query { products { name stock } }")
+        self.post("query { customers { name } }")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 2
+            self.product.save()
+        with self.assertNumQueries(0):
+            self.post("query { customers { name } }")
+        data = self.post("query { products { name stock } }")
+        self.assertEqual(data['data']['products'], [{'name': "Widget", 'stock': 2}])
+    
+    def test_many_to_many_fields_are_invalidated_with_their_through_model(self):
+        order = Order.objects.create(customer=Customer.objects.get(name="Ann Lee"))
+        item = OrderItem.objects.create(order=order, product=self.product, unit_price=self.product.price)
+        query = "query { orders { id products { edges { node { name } } } } }"
+        self.assertEqual(len(self.post(query)['data']['orders'][0]['products']['edges']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderItem.objects.filter(pk=item.pk).delete()
+        self.assertEqual(self.post(query)['data']['orders'][0]['products']['edges'], [])
+    
+    def test_filters_on_related_models_are_invalidated_with_them(self):
+        customer = Customer.objects.get(name="Ann Lee")
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.create(order=order, product=self.product, unit_price=self.product.price)
+        query = """query {
+            filteredOrders(filter: {productName: "Widget"}) { totalAmount }
+            orders(customerName: "Ann") { totalAmount }
+        }"""
+        self.assertEqual(len(self.post(query)['data']['orders']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Gadget"
+            self.product.save()
+            customer.name = "Bob"
+            customer.save()
+        self.assertEqual(self.post(query)['data'], {'filteredOrders': [], 'orders': []})
+    
+    def test_mutations_bypass_the_cache(self):
+        mutation = 'mutation { createProduct(input: {name: "Gizmo", price: "2.00"}) { success } }'
+        self.post("query { products { name } }")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post(mutation)
+            self.post(mutation)
+        self.assertEqual(Product.objects.filter(name="Gizmo").count(), 2)
+        data = self.post("query { products { name } }")
+        self.assertEqual(len(data['data']['products']), 3)
+
+
+class DocumentCacheTest(TestCase):
+    def setUp(self):
+        from graphene_django.settings import graphene_settings
+        from .documents import DocumentCache
+        
+        self.cache = DocumentCache(graphene_settings.SCHEMA.graphql_schema, maxsize=2)
+    
+    def test_valid_documents_are_parsed_once(self):
+        first, errors = self.cache.get("query { hello }")
+        self.assertEqual(errors, [])
+        self.assertIs(self.cache.get("query { hello }")[0], first)
+        self.assertEqual(self.cache.info(), (1, 1, 2, 1))
+    
+    def test_invalid_documents_are_not_cached(self):
+        for query in ("query { nope }", "query {"):
+            document, errors = self.cache.get(query)
+            self.assertIsNone(document)
+            self.assertEqual(len(errors), 1)
+        self.assertEqual(self.cache.info().currsize, 0)
+    
+    def test_least_recently_used_documents_are_evicted(self):
+        for query in ("{ hello }", "{ products { name } }", "{ hello }", "{ orders { id } }"):
+            self.cache.get(query)
+        self.cache.get("{ hello }")
+        self.cache.get("{ products { name } }")
+        self.assertEqual(self.cache.info(), (2, 4, 2, 2))
+    
+    def test_view_reuses_cached_documents(self):
+        import json
+        from graphene_django.settings import graphene_settings
+        from .documents import get_document_cache
+        
+        cache = get_document_cache(graphene_settings.SCHEMA.graphql_schema)
+        cache.clear()
+        for _ in range(3):
+            response = self.client.post(
+                '/graphql',
+                data=json.dumps({'query': "query { hello }"}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.json()['data'], {'hello': "Hello, GraphQL!"})
+        self.assertEqual(cache.info()[:2], (2, 1))
+
+
+class PersistedQueryTest(TestCase):
+    QUERY = "query { products { name } }"
+    
+    def setUp(self):
+        import hashlib
+        from django.core.cache import cache
+        
+        cache.clear()
+        Product.objects.create(name="Widget", price=Decimal("1.00"), stock=5)
+        self.sha256 = hashlib.sha256(self.QUERY.encode()).hexdigest()
+        self.extensions = {'persistedQuery': {'version': 1, 'sha256Hash': self.sha256}}
+    
+    def post(self, body):
+        import json
+        
+        return self.client.post('/graphql', data=json.dumps(body), content_type='application/json').json()
+    
+    def get(self):
+        import json
+        
+        return self.client.get(
+            '/graphql', {'extensions': json.dumps(self.extensions)}, HTTP_ACCEPT='application/json'
+        )
+    
+    def test_hash_is_registered_on_first_miss(self):
+        from .models import PersistedQuery
+        
+        data = self.post({'extensions': self.extensions})
+        self.assertEqual(data['errors'][0]['message'], "PersistedQueryNotFound")
+        data = self.post({'query': self.QUERY, 'extensions': self.extensions})
+        self.assertEqual(data['data'], {'products': [{'name': "Widget"}]})
+        self.assertEqual(self.post({'extensions': self.extensions})['data'], data['data'])
+        # Registered hashes live in the cache only; PersistedQuery is the admin's store
+        self.assertFalse(PersistedQuery.objects.exists())
+    
+    def test_invalid_queries_are_not_registered(self):
+        import hashlib
+        
+        query = "this is not graphql {{{"
+        extensions = {'persistedQuery': {'version': 1, 'sha256Hash': hashlib.sha256(query.encode()).hexdigest()}}
+        self.assertIn('errors', self.post({'query': query, 'extensions': extensions}))
+        self.assertEqual(self.post({'extensions': extensions})['errors'][0]['message'], "PersistedQueryNotFound")
+    
+    def test_hash_must_match_query(self):
+        self.extensions['persistedQuery']['sha256Hash'] = "0" * 64
+        data = self.post({'query': self.QUERY, 'extensions': self.extensions})
+        self.assertEqual(data['errors'][0]['extensions']['code'], "INVALID_PERSISTED_QUERY")
+    
+    def test_extension_must_be_an_object(self):
+        data = self.post({'query': self.QUERY, 'extensions': {'persistedQuery': "x"}})
+        self.assertEqual(data['errors'][0]['extensions']['code'], "INVALID_PERSISTED_QUERY")
+    
+    @override_settings(CRM_PERSISTED_QUERY_MAX_AGE=60)
+    def test_persisted_queries_can_be_sent_as_cacheable_get_requests(self):
+        from .models import PersistedQuery
+        
+        PersistedQuery.objects.create(query=self.QUERY)
+        response = self.get()
+        self.assertEqual(response.json()['data'], {'products': [{'name': "Widget"}]})
+        self.assertIn('max-age=60', response['Cache-Control'])
+    
+    @override_settings(CRM_PERSISTED_QUERIES_ONLY=True)
+    def test_allowlist_mode_only_runs_stored_queries(self):
+        from .models import PersistedQuery
+        
+        data = self.post({'query': self.QUERY, 'extensions': self.extensions})
+        self.assertEqual(data['errors'][0]['extensions']['code'], "PERSISTED_QUERY_NOT_ALLOWED")
+        self.assertIn('errors', self.post({'query': self.QUERY}))
+        PersistedQuery.objects.create(query=self.QUERY)
+        self.assertEqual(self.post({'query': self.QUERY})['data'], {'products': [{'name': "Widget"}]})
+        PersistedQuery.objects.all().delete()
+        self.assertEqual(self.post({'extensions': self.extensions})['errors'][0]['message'], "PersistedQueryNotFound")
+    
+    @override_settings(CRM_PERSISTED_QUERIES_ONLY=True)
+    def test_allowlist_applies_to_the_stream_view(self):
+        import json
+        from .models import PersistedQuery
+        
+        def stream(body):
+            return self.client.post('/graphql/stream', data=json.dumps(body), content_type='application/json')
+        
+        response = stream({'query': self.QUERY})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], "PERSISTED_QUERY_NOT_ALLOWED")
+        PersistedQuery.objects.create(query=self.QUERY)
+        response = stream({'extensions': self.extensions})
+        self.assertEqual(b''.join(response.streaming_content), b'{"name": "Widget"}\n')
+
+
+class QueryCostTest(TestCase):
+    def check(self, query, variables=None):
+        from graphene_django.settings import graphene_settings
+        from graphql import parse
+        from .complexity import check_query_cost
+        
+        return check_query_cost(graphene_settings.SCHEMA.graphql_schema, parse(query), variables)
+    
+    def test_cost_multiplies_by_list_sizes(self):
+        cost, errors = self.check("""
+            query($n: Int) {
+                allCustomers(first: $n) { totalCount edges { node { name orders(first: 5) { edges { node { id } } } } } }
+            }
+        """, {'n': 10})
+        self.assertEqual(errors, [])
+        # The connection and its totalCount, then 10 customers x (node + orders connection + 5 orders)
+        self.assertEqual(cost, (1 + 1 + 10 * (1 + 1 + 5 * 1), 3))
+    
+    def test_fragments_are_counted(self):
+        cost, _ = self.check("query { ...F } fragment F on Query { products(first: 2) { name } }")
+        self.assertEqual(cost.cost, 2)
+    
+    @override_settings(CRM_MAX_QUERY_DEPTH=3)
+    def test_deep_reverse_relations_are_rejected(self):
+        import json
+        
+        query = """
+            query {
+                customers(first: 1) {
+                    orders(first: 1) { edges { node { products(first: 1) { edges { node {
+                        orders(first: 1) { edges { node { id } } }
+                    } } } } } }
+                }
+            }
+        """
+        response = self.client.post('/graphql', data=json.dumps({'query': query}), content_type='application/json')
+        body = response.json()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body['errors'][0]['extensions']['code'], "QUERY_TOO_DEEP")
+        self.assertEqual(body['extensions']['cost']['depth'], 5)
+    
+    @override_settings(CRM_MAX_QUERY_COST=50)
+    def test_expensive_queries_are_rejected_and_cost_is_reported(self):
+        import json
+        
+        def post(query):
+            return self.client.post('/graphql', data=json.dumps({'query': query}), content_type='application/json').json()
+        
+        body = post("query { products { name } }")
+        self.assertEqual(body['errors'][0]['extensions']['code'], "QUERY_TOO_COMPLEX")
+        body = post("query { products(first: 50) { name } }")
+        self.assertEqual(body['data'], {'products': []})
+        self.assertEqual(body['extensions']['cost'], {'requested': 50, 'maximum': 50, 'depth': 2})
+    
+    @override_settings(CRM_MAX_QUERY_COST=50)
+    def test_stream_view_enforces_the_limits(self):
+        import json
+        
+        response = self.client.post(
+            '/graphql/stream', data=json.dumps({'query': "query { products { name } }"}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['extensions']['code'], "QUERY_TOO_COMPLEX")
+
+
+class QueryBudgetTest(TestCase):
+    """The operations of test_basic_graphql.py and test_task_queries.py, with their SQL budgets."""
+    
+    def setUp(self):
+        product = Product.objects.create(name="Laptop", price=Decimal("999.99"), stock=5)
+        for i in range(5):
+            customer = Customer.objects.create(name=f"Alice {i}", email=f"alice{i}@example.com", phone=f"+1555000{i}")
+            order = Order.objects.create(customer=customer)
+            OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+    
+    def test_smoke_operations_stay_within_budget(self):
+        from .testing import assert_query_budget
+        
+        operations = [
+            ("query { hello }", 0),
+            ("query { __schema { types { name } } }", 0),
+            ("""query { allCustomers(name_Icontains: "Ali", createdAt_Gte: "2025-01-01T00:00:00Z") {
+                edges { node { id name email createdAt } } } }""", 2),
+            ("""query { allProducts(price_Gte: 100, price_Lte: 1000) {
+                edges { node { id name price stock } } } }""", 1),
+            ("""query { allOrders(customerName: "Alice", productName: "Laptop", totalAmount_Gte: 500) {
+                edges { node { id customer { name } totalAmount orderDate } } } }""", 1),
+            ("""query { filteredCustomers(filter: { nameIcontains: "Ali", phonePattern: "+1" }) {
+                id name email phone } }""", 1),
+            ("""query { filteredProducts(filter: { priceGte: 100, lowStock: true, orderBy: "-stock" }) {
+                id name price stock } }""", 1),
+            ("""query { filteredOrders(filter: { customerName: "Alice", totalAmountGte: 500, orderBy: "total_amount" }) {
+                id customer { name } items { edges { node { product { name } } } } totalAmount orderDate } }""", 2),
+        ]
+        for query, max_queries in operations:
+            with self.subTest(query=query):
+                assert_query_budget(query, max_queries=max_queries, max_repeats=1)
+    
+    def test_assert_query_budget_reports_the_expensive_path(self):
+        from .testing import assert_query_budget
+        
+        with self.assertRaisesMessage(AssertionError, "allOrders"):
+            assert_query_budget("query { allOrders { edges { node { id } } } }", max_queries=0)
+    
+    def test_repeated_queries_are_logged(self):
+        from .budget import track_queries
+        
+        with self.assertLogs('crm.budget', 'WARNING') as logs:
+            with track_queries(budget=100, repeat_threshold=3) as tracker:
+                for customer in Customer.objects.all():
+                    list(customer.orders.all())
+            tracker.report('Loop')
+        self.assertEqual(tracker.count, 6)
+        self.assertIn("Possible N+1 in operation Loop: 5 identical queries", logs.output[0])
+    
+    @override_settings(CRM_QUERY_BUDGET=1, CRM_QUERY_BUDGET_ACTION='raise')
+    def test_raise_mode_stops_the_operation(self):
+        import json
+        
+        query = "query { allOrders { edges { node { id items { edges { node { id } } } } } } }"
+        response = self.client.post('/graphql', data=json.dumps({'query': query}), content_type='application/json')
+        body = response.json()
+        self.assertIn("exceeded its budget of 1 SQL queries", body['errors'][0]['message'])
+
+
+class TracingTest(TestCase):
+    def setUp(self):
+        Product.objects.create(name="Widget", price=Decimal("5.00"), stock=3)
+    
+    def post(self, query, **headers):
+        import json
+        
+        return self.client.post(
+            '/graphql', data=json.dumps({'query': query}), content_type='application/json', **headers
+        ).json()
+    
+    def test_resolvers_are_not_wrapped_by_default(self):
+        from graphene_django.settings import graphene_settings
+        from .views import CRMGraphQLView
+        
+        self.assertEqual(graphene_settings.MIDDLEWARE, [])
+        request = self.client.get('/graphql').wsgi_request
+        self.assertIsNone(CRMGraphQLView().get_middleware(request))
+        body = self.post("query { products { name } _debug { sql { rawSql } } }", HTTP_X_GRAPHQL_DEBUG='1')
+        self.assertEqual(body['data'], {'products': [{'name': "Widget"}], '_debug': None})
+    
+    @override_settings(CRM_GRAPHQL_DEBUG=True)
+    def test_debug_selection_traces_the_operation(self):
+        body = self.post("query { products { name } _debug { sql { rawSql } } }")
+        self.assertEqual(body['data']['products'], [{'name': "Widget"}])
+        self.assertEqual(len(body['data']['_debug']['sql']), 1)
+        self.assertIn("crm_product", body['data']['_debug']['sql'][0]['rawSql'])
+    
+    @override_settings(CRM_GRAPHQL_DEBUG=True)
+    def test_debug_header_logs_sql_per_field(self):
+        with self.assertLogs('crm.budget', 'INFO') as logs:
+            body = self.post("query Widgets { products { name } }", HTTP_X_GRAPHQL_DEBUG='1')
+        self.assertEqual(body['data'], {'products': [{'name': "Widget"}]})
+        self.assertIn("Operation Widgets ran 1 SQL queries", logs.output[0])
+        self.assertIn("products: 1 queries", logs.output[0])
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="Widget", price=Decimal("5.00"), stock=3)
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+    
+    def post(self, query):
+        import json
+        
+        return self.client.post('/graphql', data=json.dumps({'query': query}), content_type='application/json')
+    
+    @override_settings(CRM_METRICS_SAMPLE_RATE=0, CRM_METRICS_TOKEN='scrape-me')
+    def test_operations_are_exported_on_metrics(self):
+        self.post("query MetricsProducts { products { name } }")
+        self.post("query MetricsBroken { products { nope } }")
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn("# TYPE crm_graphql_operation_duration_seconds histogram", text)
+        self.assertIn('crm_graphql_operation_duration_seconds_count{operation="MetricsProducts",type="query"} 1', text)
+        self.assertIn('crm_graphql_operation_sql_queries_bucket{operation="MetricsProducts",le="1"} 1', text)
+        self.assertIn('crm_graphql_response_size_bytes_count{operation="MetricsProducts"} 1', text)
+        self.assertIn('crm_graphql_operation_errors_total{operation="anonymous"}', text)
+        self.assertNotIn('crm_graphql_operation_errors_total{operation="MetricsProducts"}', text)
+    
+    @override_settings(CRM_METRICS_SAMPLE_RATE=1.0, CRM_OTLP_ENDPOINT='http://collector/v1/traces')
+    def test_sampled_operations_time_fields_and_export_spans(self):
+        from unittest import mock
+        from .management.commands.otlp_collector import summarize
+        from .metrics import FIELD_DURATION, OTLPExporter
+        
+        before = FIELD_DURATION.count('OrderType.customer')
+        exporter = mock.Mock()
+        with mock.patch('crm.metrics.get_exporter', return_value=exporter):
+            self.post("query MetricsOrders { orders { customer { name } } }")
+        self.assertEqual(FIELD_DURATION.count('OrderType.customer'), before + 1)
+        
+        trace, = exporter.export.call_args[0]
+        root, *fields = trace.spans()
+        self.assertEqual(root['name'], "query MetricsOrders")
+        self.assertEqual([span['name'] for span in fields], ["Query.orders", "OrderType.customer"])
+        self.assertEqual(fields[0]['parentSpanId'], root['spanId'])
+        self.assertEqual(fields[1]['parentSpanId'], fields[0]['spanId'])
+        lines = summarize(OTLPExporter.payload([trace]))
+        self.assertTrue(lines[2].startswith(f"{trace.trace_id[:8]}   OrderType.customer "))
+        self.assertTrue(lines[2].endswith(" orders.customer"))
+    
+    @override_settings(CRM_METRICS_ENABLED=False)
+    def test_metrics_can_be_disabled(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+    
+    def test_metrics_need_a_token_or_a_staff_user(self):
+        from django.contrib.auth.models import User
+        
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        with override_settings(CRM_METRICS_TOKEN='scrape-me'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+        self.client.force_login(User.objects.create_user('viewer'))
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+class AsyncGraphQLViewTest(TransactionTestCase):
+    """Root fields resolve in worker threads with their own connections, so the rows must be committed."""
+    
+    def setUp(self):
+        customer = Customer.objects.create(name="Alice", email="alice@example.com")
+        product = Product.objects.create(name="Widget", price=Decimal("5.00"), stock=3)
+        order = Order.objects.create(customer=customer)
+        OrderItem.objects.create(order=order, product=product, unit_price=product.price)
+    
+    async def post(self, query):
+        import json
+        
+        response = await self.async_client.post(
+            '/graphql/async', data=json.dumps({'query': query}), content_type='application/json'
+        )
+        return response.json()
+    
+    async def test_root_fields_are_fetched_in_parallel(self):
+        import threading
+        from unittest import mock
+        from .budget import QueryTracker
+        
+        # The first statement of each root field waits until all three are running
+        barrier = threading.Barrier(3, timeout=5)
+        started = threading.local()
+        count = QueryTracker.__call__
+        
+        def wait_for_siblings(tracker, *args):
+            if not getattr(started, 'value', False):
+                started.value = True
+                barrier.wait()
+            return count(tracker, *args)
+        
+        with mock.patch.object(QueryTracker, '__call__', wait_for_siblings):
+            body = await self.post("""
+                query Dashboard {
+                    customers { name orders { totalCount } }
+                    products { name }
+                    orders { customer { name } items { edges { node { product { name } } } } }
+                }
+            """)
+        self.assertNotIn('errors', body)
+        self.assertEqual(body['data'], {
+            'customers': [{'name': "Alice", 'orders': {'totalCount': 1}}],
+            'products': [{'name': "Widget"}],
+            'orders': [{'customer': {'name': "Alice"}, 'items': {'edges': [{'node': {'product': {'name': "Widget"}}}]}}],
+        })
+    
+    async def test_mutations_and_errors(self):
+        body = await self.post('mutation { createCustomer(input: {name: "Bob", email: "bob@example.com"}) { customer { name } } }')
+        self.assertEqual(body['data'], {'createCustomer': {'customer': {'name': "Bob"}}})
+        self.assertTrue(await Customer.objects.filter(email="bob@example.com").aexists())
+        body = await self.post("query { nope }")
+        self.assertEqual(body['errors'][0]['message'], "Cannot query field 'nope' on type 'Query'.")
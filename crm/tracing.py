@@ -0,0 +1,66 @@
+"""
+Opt-in tracing of GraphQL operations.
+
+Graphene middleware wraps every resolver of every operation, so none is
+installed by default. When CRM_GRAPHQL_DEBUG is on, an operation is traced
+if its request sends the ``X-GraphQL-Debug`` header or it selects the
+``_debug`` root field. A traced operation runs with:
+
+- QueryBudgetMiddleware, so crm.budget attributes each SQL statement to the
+  field that ran it and logs the per-field summary;
+- DjangoDebugMiddleware, when it selects ``_debug``, which records the SQL
+  statements and exceptions returned there.
+
+Traced operations bypass the response cache. With CRM_GRAPHQL_DEBUG off,
+``_debug`` resolves to null and the header is ignored.
+"""
+
+from django.conf import settings
+from graphene_django.debug import DjangoDebugMiddleware
+from graphql import FieldNode
+from .budget import QueryBudgetMiddleware
+
+
+DEBUG_HEADER = 'HTTP_X_GRAPHQL_DEBUG'
+
+DEBUG_FIELD = '_debug'
+
+
+def get_graphql_debug():
+    return getattr(settings, 'CRM_GRAPHQL_DEBUG', False)
+
+
+def selects_debug(operation_ast):
+    """Whether the operation selects _debug at its root."""
+    if operation_ast is None:
+        return False
+    return any(
+        isinstance(selection, FieldNode) and selection.name.value == DEBUG_FIELD
+        for selection in operation_ast.selection_set.selections
+    )
+
+
+def wants_tracing(request, operation_ast):
+    if not get_graphql_debug():
+        return False
+    header = request.META.get(DEBUG_HEADER, '').strip().lower()
+    return header in ('1', 'true', 'on', 'yes') or selects_debug(operation_ast)
+
+
+def tracing_middleware(operation_ast):
+    """Middleware instances for one traced operation."""
+    middleware = [QueryBudgetMiddleware()]
+    if selects_debug(operation_ast):
+        middleware.append(DjangoDebugMiddleware())
+    return middleware
+
+
+def finish_tracing(request):
+    """
+    Unwrap the cursors DjangoDebugMiddleware wrapped, which it only does
+    itself once _debug resolves (not when the operation fails before).
+    """
+    django_debug = getattr(request, 'django_debug', None)
+    if django_debug is not None:
+        django_debug.disable_instrumentation()
+        del request.django_debug
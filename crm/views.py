@@ -0,0 +1,461 @@
+import json
+import time
+from inspect import isawaitable
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.views import View
+from graphql import (
+    ExecutionResult,
+    FieldNode,
+    GraphQLError,
+    OperationDefinitionNode,
+    OperationType,
+    execute,
+    get_operation_ast,
+)
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.views import GraphQLView, HttpError
+from .budget import track_queries
+from .cache import get_cache, get_cache_key, get_cache_timeout
+from .complexity import check_query_cost, get_max_query_cost
+from .concurrency import ConcurrentExecutionContext
+from .documents import get_document_cache
+from .metrics import (
+    FieldMetricsMiddleware,
+    Trace,
+    can_read_metrics,
+    get_metrics_enabled,
+    get_otlp_endpoint,
+    record_operation,
+    registry,
+    should_sample,
+)
+from .persisted import PersistedQueryError, get_persisted_query_max_age, register_query, resolve_query
+from .pagination import StreamWindow
+from .tracing import finish_tracing, tracing_middleware, wants_tracing
+
+
+# List fields whose resolvers read their rows through paginate_list()
+STREAMABLE_FIELDS = (
+    'customers',
+    'products',
+    'orders',
+    'filteredCustomers',
+    'filteredProducts',
+    'filteredOrders',
+)
+
+
+def error_response(message, status=400):
+    return JsonResponse({'errors': [{'message': message}]}, status=status)
+
+
+def load_document(schema, query, variables=None, operation_name=None):
+    """
+    Parse and validate query through the document cache, then check it
+    against the depth and cost limits. Returns (document, QueryCost or
+    None, errors); document is None when it did not parse or validate.
+    """
+    document, errors = get_document_cache(schema).get(query)
+    if errors:
+        return None, None, errors
+    query_cost, errors = check_query_cost(schema, document, variables, operation_name)
+    return document, query_cost, errors
+
+
+def persisted_query_error(error):
+    return ExecutionResult(data=None, errors=[GraphQLError(error.message, extensions={'code': error.code})])
+
+
+class CRMGraphQLView(GraphQLView):
+    """
+    GraphQLView that takes parsing and validation out of the hot path and
+    serves repeated queries from the response cache.
+
+    Documents come from the per-schema DocumentCache (see crm.documents)
+    and are executed as they are, so a repeated operation is only executed.
+    Query results are cached as described in crm.cache. Requests may name
+    their query by hash (see crm.persisted); successful GETs of persisted
+    queries are HTTP-cacheable for CRM_PERSISTED_QUERY_MAX_AGE seconds.
+    Operations over the depth or cost limits are rejected before they run
+    (see crm.complexity), and the estimated cost is returned in
+    ``extensions``. The SQL each operation runs is checked against its
+    budget (see crm.budget). Resolvers are only wrapped in middleware for
+    operations that ask to be traced (see crm.tracing) or are sampled for
+    the metrics served on /metrics (see crm.metrics).
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(request, 'crm_operation') and get_metrics_enabled():
+            record_operation(request, response, time.perf_counter() - start)
+        max_age = self.get_http_max_age(request, response)
+        if max_age:
+            if request.user.is_authenticated:
+                patch_cache_control(response, private=True, max_age=max_age)
+            else:
+                patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+    @staticmethod
+    def get_http_max_age(request, response):
+        """Seconds response may be cached by HTTP caches; 0 unless it is a persisted query's."""
+        max_age = get_persisted_query_max_age()
+        if (
+            max_age
+            and request.method == 'GET'
+            and response.status_code == 200
+            and getattr(request, 'crm_persisted_query', False)
+        ):
+            return max_age
+        return 0
+
+    @staticmethod
+    def get_extensions(request, data):
+        extensions = request.GET.get('extensions') or data.get('extensions')
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest("Extensions are invalid JSON."))
+        return extensions if isinstance(extensions, dict) else {}
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        request.crm_operation = None
+        persisted = self.get_extensions(request, data).get('persistedQuery')
+        try:
+            query, new_hash = resolve_query(query, persisted)
+        except PersistedQueryError as error:
+            return persisted_query_error(error)
+        request.crm_persisted_query = bool(persisted)
+
+        document, operation_ast, result = self.prepare_document(request, query, variables, operation_name, show_graphiql)
+        if document is None:
+            return result
+        if new_hash:
+            register_query(new_hash, query)
+
+        timeout = get_cache_timeout()
+        key = self.get_response_cache_key(request, document, variables, operation_name) if timeout else None
+        if key is not None:
+            cached = get_cache().get(key)
+            if cached is not None:
+                return ExecutionResult(data=cached)
+        result = self.execute_tracked(request, document, variables, operation_name, operation_ast)
+        if key is not None and not result.errors:
+            get_cache().set(key, result.data, timeout)
+        return result
+
+    def prepare_document(self, request, query, variables, operation_name, show_graphiql=False):
+        """
+        Parse, validate and cost query. Returns (document, operation_ast,
+        None) when it is to be executed, or (None, None, result) with the
+        result to answer instead (None to show GraphiQL).
+        """
+        if not query:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        document, query_cost, errors = load_document(self.schema.graphql_schema, query, variables, operation_name)
+        if query_cost is not None:
+            request.crm_extensions = {
+                'cost': {'requested': query_cost.cost, 'maximum': get_max_query_cost(), 'depth': query_cost.depth},
+            }
+        if errors:
+            return None, None, ExecutionResult(data=None, errors=errors)
+
+        operation_ast = get_operation_ast(document, operation_name)
+        request.crm_operation = operation_ast
+        if request.method.lower() == 'get' and operation_ast and operation_ast.operation != OperationType.QUERY:
+            if show_graphiql:
+                return None, None, None
+            raise HttpError(HttpResponseNotAllowed(
+                ['POST'],
+                f"Can only perform a {operation_ast.operation.value} operation from a POST request.",
+            ))
+
+        request.crm_tracing = wants_tracing(request, operation_ast)
+        request.crm_sampled = get_metrics_enabled() and should_sample()
+        if request.crm_sampled and get_otlp_endpoint():
+            request.crm_trace = Trace()
+        return document, operation_ast, None
+
+    def get_response_cache_key(self, request, document, variables, operation_name):
+        if request.crm_tracing:
+            return None
+        return get_cache_key(
+            self.schema.graphql_schema, document, variables, operation_name, getattr(request, 'user', None)
+        )
+
+    def execute_tracked(self, request, document, variables, operation_name, operation_ast):
+        """execute_document() with its SQL checked against the query budget."""
+        with track_queries() as tracker:
+            try:
+                result = self.execute_document(request, document, variables, operation_name, operation_ast)
+            finally:
+                finish_tracing(request)
+        if operation_name is None and operation_ast is not None and operation_ast.name is not None:
+            operation_name = operation_ast.name.value
+        tracker.report(operation_name, trace=request.crm_tracing)
+        request.crm_queries = tracker
+        return result
+
+    def json_encode(self, request, d, pretty=False):
+        request.crm_errors = isinstance(d, dict) and bool(d.get('errors'))
+        extensions = getattr(request, 'crm_extensions', None)
+        if extensions and isinstance(d, dict):
+            d = {**d, 'extensions': extensions}
+        return super().json_encode(request, d, pretty)
+
+    def get_middleware(self, request):
+        middleware = list(self.middleware or ())
+        if getattr(request, 'crm_tracing', False):
+            middleware += tracing_middleware(request.crm_operation)
+        if getattr(request, 'crm_sampled', False):
+            middleware.append(FieldMetricsMiddleware())
+        return middleware or None
+
+    def execute_document(self, request, document, variables, operation_name, operation_ast):
+        options = {
+            'root_value': self.get_root_value(request),
+            'context_value': self.get_context(request),
+            'variable_values': variables,
+            'operation_name': operation_name,
+            'middleware': self.get_middleware(request),
+        }
+        if self.execution_context_class:
+            options['execution_context_class'] = self.execution_context_class
+        try:
+            if (
+                operation_ast
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get('ATOMIC_MUTATIONS', False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(self.schema.graphql_schema, document, **options)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+            return execute(self.schema.graphql_schema, document, **options)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class AsyncCRMGraphQLView(CRMGraphQLView):
+    """
+    CRMGraphQLView for ASGI servers, without GraphiQL or batching.
+
+    The request does not hold a thread while its operation runs: the root
+    fields of a query are resolved concurrently, each in a worker thread
+    of its own (see crm.concurrency). Mutations, whose fields run in order
+    and possibly in one transaction, and traced operations are executed
+    as in CRMGraphQLView in a single thread.
+    """
+
+    view_is_async = True
+
+    async def dispatch(self, request, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            if request.method.lower() not in ('get', 'post'):
+                raise HttpError(HttpResponseNotAllowed(['GET', 'POST'], "GraphQL only supports GET and POST requests."))
+            data = self.parse_body(request)
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            result = await self.aexecute_graphql_request(request, data, query, variables, operation_name)
+            status_code = 200
+            body = {}
+            if result.errors:
+                body['errors'] = [self.format_error(error) for error in result.errors]
+            if result.errors and any(not getattr(error, 'path', None) for error in result.errors):
+                status_code = 400
+            else:
+                body['data'] = result.data
+            response = HttpResponse(self.json_encode(request, body), status=status_code, content_type='application/json')
+        except HttpError as error:
+            response = error.response
+            response['Content-Type'] = 'application/json'
+            response.content = self.json_encode(request, {'errors': [self.format_error(error)]})
+
+        if hasattr(request, 'crm_operation') and get_metrics_enabled():
+            record_operation(request, response, time.perf_counter() - start)
+        max_age = self.get_http_max_age(request, response)
+        if max_age:
+            if await sync_to_async(lambda: request.user.is_authenticated)():
+                patch_cache_control(response, private=True, max_age=max_age)
+            else:
+                patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+    async def aexecute_graphql_request(self, request, data, query, variables, operation_name):
+        request.crm_operation = None
+        persisted = self.get_extensions(request, data).get('persistedQuery')
+        try:
+            query, new_hash = await sync_to_async(resolve_query)(query, persisted)
+        except PersistedQueryError as error:
+            return persisted_query_error(error)
+        request.crm_persisted_query = bool(persisted)
+
+        document, operation_ast, result = self.prepare_document(request, query, variables, operation_name)
+        if document is None:
+            return result
+        if new_hash:
+            await sync_to_async(register_query)(new_hash, query)
+
+        timeout = get_cache_timeout()
+        key = None
+        if timeout:
+            key = await sync_to_async(self.get_response_cache_key)(request, document, variables, operation_name)
+        if key is not None:
+            cached = await get_cache().aget(key)
+            if cached is not None:
+                return ExecutionResult(data=cached)
+        if operation_ast and operation_ast.operation == OperationType.QUERY and not request.crm_tracing:
+            result = await self.execute_concurrently(request, document, variables, operation_name, operation_ast)
+        else:
+            result = await sync_to_async(self.execute_tracked)(request, document, variables, operation_name, operation_ast)
+        if key is not None and not result.errors:
+            await get_cache().aset(key, result.data, timeout)
+        return result
+
+    async def execute_concurrently(self, request, document, variables, operation_name, operation_ast):
+        with track_queries() as tracker:
+            try:
+                result = execute(
+                    self.schema.graphql_schema,
+                    document,
+                    root_value=self.get_root_value(request),
+                    context_value=self.get_context(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    middleware=self.get_middleware(request),
+                    execution_context_class=ConcurrentExecutionContext,
+                )
+                if isawaitable(result):
+                    result = await result
+            except Exception as e:
+                result = ExecutionResult(errors=[e])
+        if operation_name is None and operation_ast.name is not None:
+            operation_name = operation_ast.name.value
+        tracker.report(operation_name)
+        request.crm_queries = tracker
+        return result
+
+
+class MetricsView(View):
+    """
+    The metrics of this process in the Prometheus text format, for staff
+    users and scrapers sending CRM_METRICS_TOKEN.
+    """
+
+    http_method_names = ['get']
+
+    def get(self, request):
+        if not get_metrics_enabled():
+            raise Http404
+        if not can_read_metrics(request):
+            response = HttpResponse("Authentication required.", status=401, content_type='text/plain')
+            response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+            return response
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class GraphQLStreamView(View):
+    """
+    Execute a query over one list field and stream its rows as NDJSON.
+
+    The document is parsed and validated once, then executed once per chunk.
+    Each execution takes the next chunk of a single queryset.iterator(), so
+    memory stays flat however many rows match. The server-side row limit of
+    the list fields does not apply here. Persisted queries and the
+    CRM_PERSISTED_QUERIES_ONLY allowlist work as on /graphql, and so do the
+    depth and cost limits (see crm.complexity).
+    """
+
+    http_method_names = ['post']
+
+    def post(self, request):
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return error_response("Request body must be JSON.")
+        if not isinstance(body, dict):
+            return error_response("Request body must be a JSON object.")
+
+        extensions = body.get('extensions')
+        persisted = extensions.get('persistedQuery') if isinstance(extensions, dict) else None
+        try:
+            query, new_hash = resolve_query(body.get('query'), persisted)
+        except PersistedQueryError as error:
+            return JsonResponse(
+                {'errors': [{'message': error.message, 'extensions': {'code': error.code}}]}, status=400
+            )
+        if not query:
+            return error_response("Must provide query string.")
+        variables = body.get('variables') or {}
+        operation_name = body.get('operationName')
+
+        schema = graphene_settings.SCHEMA.graphql_schema
+        document, _, errors = load_document(schema, query, variables, operation_name)
+        if errors:
+            return JsonResponse({'errors': [error.formatted for error in errors]}, status=400)
+
+        response_key = self.get_response_key(document, operation_name)
+        if response_key is None:
+            return error_response(
+                "Streaming requires a query that selects exactly one of: "
+                + ", ".join(STREAMABLE_FIELDS)
+            )
+        if new_hash:
+            register_query(new_hash, query)
+
+        return StreamingHttpResponse(
+            self.stream_rows(request, schema, document, variables, operation_name, response_key),
+            content_type='application/x-ndjson',
+        )
+
+    def get_response_key(self, document, operation_name):
+        operations = [
+            definition for definition in document.definitions
+            if isinstance(definition, OperationDefinitionNode)
+        ]
+        if operation_name:
+            operations = [
+                operation for operation in operations
+                if operation.name and operation.name.value == operation_name
+            ]
+        if len(operations) != 1 or operations[0].operation != OperationType.QUERY:
+            return None
+        selections = operations[0].selection_set.selections
+        if len(selections) != 1 or not isinstance(selections[0], FieldNode):
+            return None
+        field = selections[0]
+        if field.name.value not in STREAMABLE_FIELDS:
+            return None
+        return field.alias.value if field.alias else field.name.value
+
+    def stream_rows(self, request, schema, document, variables, operation_name, response_key):
+        request.crm_stream = StreamWindow()
+        while not request.crm_stream.exhausted:
+            # Loaders only need to batch within one chunk
+            request.crm_loaders = None
+            result = execute(
+                schema,
+                document,
+                context_value=request,
+                variable_values=variables,
+                operation_name=operation_name,
+            )
+            if result.errors:
+                yield json.dumps({'errors': [error.formatted for error in result.errors]}) + '\n'
+                return
+            for row in result.data[response_key] or ():
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
@@ -73,9 +73,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Seconds to keep connections open; /graphql/async opens one per worker thread
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=0, cast=int),
     }
 }
 
+# Cache (per-process local memory unless REDIS_URL is set)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,11 +133,83 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # GraphQL Configuration
 GRAPHENE = {
     'SCHEMA': 'alx-backend-graphql.schema.schema',
-    'MIDDLEWARE': [
-        'graphene_django.debug.DjangoDebugMiddleware',
-    ],
+    # Resolvers are only wrapped for traced operations (see CRM_GRAPHQL_DEBUG)
+    'MIDDLEWARE': [],
 }
 
+# Server-side row limit for the plain list fields (customers, filteredOrders, ...)
+CRM_LIST_MAX_LIMIT = config('CRM_LIST_MAX_LIMIT', default=100, cast=int)
+
+# Rows per chunk when a list field is streamed through /graphql/stream
+CRM_STREAM_CHUNK_SIZE = config('CRM_STREAM_CHUNK_SIZE', default=500, cast=int)
+
+# Search backend for the *_icontains filters: 'auto' picks pg_trgm on
+# PostgreSQL and FTS5 on SQLite, or give a dotted path to a backend class
+CRM_SEARCH_BACKEND = config('CRM_SEARCH_BACKEND', default='auto')
+
+# Rows created less than this many seconds ago are left for the next run of
+# the DailyStats rollup, so in-flight transactions are not skipped
+CRM_ROLLUP_LAG_SECONDS = config('CRM_ROLLUP_LAG_SECONDS', default=300, cast=int)
+
+# GraphQL endpoint for jobs that check the web tier itself (the heartbeat);
+# other scheduled jobs execute against the schema in-process
+CRM_GRAPHQL_URL = config('CRM_GRAPHQL_URL', default='http://localhost:8000/graphql')
+
+# SDL snapshot the HTTP client validates documents against instead of
+# introspecting the server; export it at deploy time with
+# `python manage.py graphql_schema --out schema.graphql`
+CRM_GRAPHQL_SCHEMA_SNAPSHOT = config('CRM_GRAPHQL_SCHEMA_SNAPSHOT', default=str(BASE_DIR / 'schema.graphql'))
+
+# Delivery channel for order reminders (crm.reminders.LogFileSender or
+# crm.reminders.EmailSender, or a dotted path to any class with send()) and
+# how many reminders are sent concurrently
+CRM_REMINDER_SENDER = config('CRM_REMINDER_SENDER', default='crm.reminders.LogFileSender')
+CRM_REMINDER_WORKERS = config('CRM_REMINDER_WORKERS', default=4, cast=int)
+
+# Seconds a GraphQL query response stays in the response cache (0 turns the
+# cache off), and the CACHES alias it is stored in
+CRM_RESPONSE_CACHE_TIMEOUT = config('CRM_RESPONSE_CACHE_TIMEOUT', default=0, cast=int)
+CRM_RESPONSE_CACHE_ALIAS = config('CRM_RESPONSE_CACHE_ALIAS', default='default')
+
+# Parsed and validated documents kept per schema, and the longest query
+# string (in characters) worth keeping
+CRM_DOCUMENT_CACHE_SIZE = config('CRM_DOCUMENT_CACHE_SIZE', default=256, cast=int)
+CRM_DOCUMENT_CACHE_MAX_QUERY_LENGTH = config('CRM_DOCUMENT_CACHE_MAX_QUERY_LENGTH', default=20000, cast=int)
+
+# Only run queries stored in PersistedQuery (an operation allowlist), and
+# the max-age of GET responses to persisted queries (0 sends no Cache-Control)
+CRM_PERSISTED_QUERIES_ONLY = config('CRM_PERSISTED_QUERIES_ONLY', default=False, cast=bool)
+CRM_PERSISTED_QUERY_MAX_AGE = config('CRM_PERSISTED_QUERY_MAX_AGE', default=0, cast=int)
+CRM_PERSISTED_QUERY_TTL = config('CRM_PERSISTED_QUERY_TTL', default=86400, cast=int)
+
+# Operations nested deeper or estimated to cost more than this are rejected
+# before they run (see crm.complexity; 0 disables a limit)
+CRM_MAX_QUERY_DEPTH = config('CRM_MAX_QUERY_DEPTH', default=10, cast=int)
+CRM_MAX_QUERY_COST = config('CRM_MAX_QUERY_COST', default=50000, cast=int)
+
+# SQL statements one GraphQL operation may run before it is logged ('log')
+# or stopped ('raise'), and how often one statement may repeat before it is
+# logged as a possible N+1 (0 disables either check; see crm.budget)
+CRM_QUERY_BUDGET = config('CRM_QUERY_BUDGET', default=100, cast=int)
+CRM_QUERY_BUDGET_ACTION = config('CRM_QUERY_BUDGET_ACTION', default='log')
+CRM_QUERY_REPEAT_THRESHOLD = config('CRM_QUERY_REPEAT_THRESHOLD', default=10, cast=int)
+
+# Allow tracing GraphQL operations that send the X-GraphQL-Debug header or
+# select _debug (SQL per field in the log, SQL and exceptions in _debug)
+CRM_GRAPHQL_DEBUG = config('CRM_GRAPHQL_DEBUG', default=False, cast=bool)
+
+# Level of the graphene logger, independent of CRM_GRAPHQL_DEBUG
+CRM_GRAPHQL_LOG_LEVEL = config('CRM_GRAPHQL_LOG_LEVEL', default='INFO')
+
+# Per-process GraphQL metrics on /metrics; CRM_METRICS_SAMPLE_RATE of the
+# operations also get per-field timings, sent as OTLP/JSON spans to
+# CRM_OTLP_ENDPOINT when set (e.g. http://localhost:4318/v1/traces)
+CRM_METRICS_ENABLED = config('CRM_METRICS_ENABLED', default=True, cast=bool)
+CRM_METRICS_SAMPLE_RATE = config('CRM_METRICS_SAMPLE_RATE', default=0.01, cast=float)
+CRM_OTLP_ENDPOINT = config('CRM_OTLP_ENDPOINT', default='')
+# Bearer token scrapers send to read /metrics; without it only staff users can
+CRM_METRICS_TOKEN = config('CRM_METRICS_TOKEN', default='')
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -169,7 +259,7 @@ LOGGING = {
         },
         'graphene': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': CRM_GRAPHQL_LOG_LEVEL,
             'propagate': False,
         },
     },
@@ -199,4 +289,8 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'crm.tasks.generate_crm_report',
         'schedule': crontab(day_of_week='mon', hour=6, minute=0),
     },
+    'update-crm-rollup': {
+        'task': 'crm.tasks.update_crm_rollup',
+        'schedule': crontab(minute=15),
+    },
 } 
\ No newline at end of file
@@ -4,15 +4,18 @@ URL configuration for crm_project project.
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
 from django.conf import settings
 from django.conf.urls.static import static
 from django.shortcuts import redirect
+from crm.views import AsyncCRMGraphQLView, CRMGraphQLView, GraphQLStreamView, MetricsView
 
 urlpatterns = [
     path('', lambda request: redirect('graphql'), name='root'),
     path('admin/', admin.site.urls),
-    path('graphql', csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path('graphql', csrf_exempt(CRMGraphQLView.as_view(graphiql=True))),
+    path('graphql/async', csrf_exempt(AsyncCRMGraphQLView.as_view())),
+    path('graphql/stream', csrf_exempt(GraphQLStreamView.as_view())),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 # Serve media files in development